@@ -0,0 +1,248 @@
+"""benchmark suite for `smae`
+
+Measures steps/sec, per-phase step time, observation, render,
+actor lifecycle and spawn costs and peak memory while sweeping
+one setting at a time around a base case. Every case becomes one
+JSON line so runs on different commits can be compared:
+
+    python -m benchmarks.run --out before.jsonl
+    git checkout other-commit
+    python -m benchmarks.run --out after.jsonl
+    python -m benchmarks.run --compare before.jsonl after.jsonl
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+import numpy as np
+
+from smae.env import SMAE
+from smae.elements import OPERATIONS
+from smae.actor import Actor, ACT_CONTINUOUS, ACT_SIGNAL, ACT_CONTINUOUS_LEN
+
+BASE = {
+    "world_size": (64, 64, 4),
+    "n_actors": 32,
+    "vision_size": (5, 8, 1),
+    "signal_depth": 8,
+    "density": 0.1,
+}
+
+# settings swept one at a time (the others stay at BASE)
+SWEEPS = {
+    "world_size": [(32, 32, 4), (64, 64, 4), (128, 128, 8), (256, 256, 8)],
+    "n_actors": [8, 32, 128, 512],
+    "vision_size": [(3, 4, 1), (5, 8, 1), (9, 16, 3)],
+    "signal_depth": [2, 8, 64],
+    "density": [0.0, 0.1, 0.3],
+}
+
+QUICK_SWEEPS = {
+    "world_size": [(32, 32, 4), (64, 64, 4)],
+    "n_actors": [8, 32],
+}
+
+# static objects scattered at the given density
+BLOCKS = [
+    OPERATIONS.encode([]), # rigid
+    OPERATIONS.encode([OPERATIONS.EAT]), # food
+    OPERATIONS.encode([OPERATIONS.PUSH_OVER, OPERATIONS.PICKUP]),
+]
+
+# methods timed as step phases. Whatever is left of a step
+# is `apply_actions`
+PHASES = ["_apply_global_acceleration", "_update_actors",
+    "_logic_update", "egocentric_obs_batch"]
+
+def make_env(case, seed=0) -> SMAE:
+    """build the env of a case with its actors in place"""
+    rng = np.random.RandomState(seed)
+    world_size = tuple(case["world_size"])
+    static_objects = np.full(world_size,
+        OPERATIONS.encode([OPERATIONS.GOTHROUGH]), dtype=np.int8)
+    blocks = rng.random_sample(world_size) < case["density"]
+    static_objects[blocks] = rng.choice(BLOCKS, size=int(blocks.sum()))
+    env = SMAE(signal_depth=case["signal_depth"], world_size=world_size,
+        static_objects=static_objects, rng=rng)
+    for actor_id in range(case["n_actors"]):
+        add_actor(env, actor_id, case)
+    return env
+
+def add_actor(env, actor_id, case):
+    actor = env.add_actor(Actor(env=env,
+        vision_size=tuple(case["vision_size"])), actor_id=actor_id)
+    # nobody starves during a benchmark
+    actor.energy = actor.prev_energy = 1e9
+    return actor
+
+def rate(fn, min_time, min_calls=3) -> float:
+    """returns seconds per call of fn, called until both
+    min_calls and min_time are reached"""
+    calls = 0
+    start = time.perf_counter()
+    while True:
+        fn()
+        calls += 1
+        elapsed = time.perf_counter() - start
+        if calls >= min_calls and elapsed >= min_time:
+            return elapsed / calls
+
+def time_phases(env):
+    """shadow the PHASES methods of env with timed versions
+
+    return: returns dict phase -> accumulated seconds"""
+    timings = dict.fromkeys(PHASES, 0.0)
+    for name in PHASES:
+        method = getattr(env, name)
+        def timed(*args, _method=method, _name=name, **kwargs):
+            start = time.perf_counter()
+            try:
+                return _method(*args, **kwargs)
+            finally:
+                timings[_name] += time.perf_counter() - start
+        setattr(env, name, timed)
+    return timings
+
+def run_case(case, min_time=0.5, seed=0) -> dict:
+    """measure every metric of one case
+
+    return: returns dict of metrics (seconds unless noted)"""
+    rng = np.random.default_rng(seed)
+    metrics = {}
+
+    # peak memory of building the env and stepping it once
+    tracemalloc.start()
+    env = make_env(case, seed)
+    n = len(env.actors)
+    env.step_batch(rng.random((n, ACT_CONTINUOUS_LEN)),
+        rng.integers(case["signal_depth"], size=n))
+    metrics["peak_memory_bytes"] = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    def batch_step():
+        n = len(env.actors)
+        env.step_batch(rng.random((n, ACT_CONTINUOUS_LEN)),
+            rng.integers(case["signal_depth"], size=n))
+    timings = time_phases(env)
+    steps = [0]
+    def counted_step():
+        batch_step()
+        steps[0] += 1
+    metrics["step_batch"] = rate(counted_step, min_time)
+    metrics["step_batch_per_sec"] = 1 / metrics["step_batch"]
+    for name, seconds in timings.items():
+        metrics["phase_" + name.lstrip("_")] = seconds / steps[0]
+    metrics["phase_apply_actions"] = max(0.0, metrics["step_batch"]
+        - sum(timings.values()) / steps[0])
+
+    env = make_env(case, seed)
+    def dict_step():
+        env.step({actor_id: {
+            ACT_CONTINUOUS: rng.random(ACT_CONTINUOUS_LEN),
+            ACT_SIGNAL: int(rng.integers(case["signal_depth"])),
+        } for actor_id in env.actors})
+    metrics["step"] = rate(dict_step, min_time)
+    metrics["step_per_sec"] = 1 / metrics["step"]
+
+    actors = list(env.actors.values())
+    metrics["egocentric_obs_per_actor"] = rate(lambda: [
+        actor.egocentric_obs(env) for actor in actors], min_time) \
+        / max(len(actors), 1)
+    metrics["egocentric_obs_batch"] = rate(env.egocentric_obs_batch,
+        min_time)
+    metrics["egocentric_obs_batch_buffered"] = rate(
+        lambda: env.egocentric_obs_batch(out=True), min_time)
+    metrics["render"] = rate(env.render, min_time)
+
+    ids = ["bench_{}".format(i) for i in range(16)]
+    def lifecycle():
+        for actor_id in ids:
+            add_actor(env, actor_id, case)
+        for actor_id in ids:
+            env.remove_actor(actor_id=actor_id)
+    metrics["add_remove_actor"] = rate(lifecycle, min_time) / len(ids)
+    metrics["random_avaliable_loc"] = rate(env.random_avaliable_loc,
+        min_time, min_calls=100)
+    return metrics
+
+def cases(sweeps) -> list:
+    """returns list of (swept setting, case) pairs"""
+    return [(name, dict(BASE, **{name: value}))
+        for name, values in sweeps.items() for value in values]
+
+def environment() -> dict:
+    """what the numbers were measured on"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+    }
+
+def case_key(record) -> str:
+    return json.dumps(record["case"], sort_keys=True)
+
+def compare(before, after, threshold=0.1):
+    """print the change of every time metric between two
+    result files. Changes beyond threshold are flagged"""
+    def load(path):
+        with open(path) as f:
+            return {case_key(record): record
+                for record in map(json.loads, f)}
+    before, after = load(before), load(after)
+    for key in sorted(before.keys() & after.keys()):
+        print(key)
+        old, new = before[key]["metrics"], after[key]["metrics"]
+        for metric in sorted(old.keys() & new.keys()):
+            if metric.endswith("per_sec") or not old[metric]:
+                continue
+            change = new[metric] / old[metric] - 1
+            flag = " <--" if abs(change) > threshold else ""
+            print("  {:32s} {:12.6g} -> {:12.6g} {:+7.1%}{}".format(
+                metric, old[metric], new[metric], change, flag))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", default="benchmark.jsonl",
+        help="file to append results to")
+    parser.add_argument("--sweep", nargs="*", choices=list(SWEEPS),
+        help="settings to sweep (default all)")
+    parser.add_argument("--quick", action="store_true",
+        help="small sweeps and short timings")
+    parser.add_argument("--min-time", type=float, default=0.5,
+        help="seconds to spend on each measurement")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"),
+        help="compare two result files instead of running")
+    args = parser.parse_args(argv)
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    sweeps = QUICK_SWEEPS if args.quick else SWEEPS
+    if args.sweep:
+        sweeps = {name: SWEEPS[name] for name in args.sweep}
+    min_time = 0.1 if args.quick else args.min_time
+    info = environment()
+    with open(args.out, "a") as f:
+        for swept, case in cases(sweeps):
+            metrics = run_case(case, min_time=min_time)
+            f.write(json.dumps(dict(info, swept=swept,
+                case=case, metrics=metrics)) + "\n")
+            f.flush()
+            print("{:12s} {:40s} {:9.1f} steps/s".format(swept,
+                json.dumps({swept: case[swept]}),
+                metrics["step_batch_per_sec"]), file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -15,15 +15,19 @@ setup(
     author_email='jacobfv@msn.com',
     packages=['smae'],  #same as name
     install_requires=[
-        'numpy==1.19.0',
-        'tensorflow==2.2.0',
-        'gym==0.17.2',
-        'pillow==7.1.2'
+        'numpy>=2.0',
+        'gym>=0.26',
+        'pillow>=7.1.2'
     ],
+    extras_require={
+        # actions may be given as tensorflow variables or tensors
+        # (the first release built against numpy 2)
+        'tf': ['tensorflow>=2.18'],
+    },
     classifiers=[
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: MIT License",
         "Operating System :: OS Independent",
     ],
-    python_requires='>=3.6',
+    python_requires='>=3.8',
 )
\ No newline at end of file
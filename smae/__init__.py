@@ -4,7 +4,7 @@ from .env import SMAE
 import gym
 gym.envs.register(
     id='smae-v0',
-    entry_point='smae.env:smae',
+    entry_point='smae.env:SMAE',
     max_episode_steps=-1,
     kwargs = {
         'world_size': (16, 16, 1)
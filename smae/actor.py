@@ -1,7 +1,9 @@
-from .elements import Moving_Object, Signaling_Moving_Object, OPERATIONS
+from .elements import Moving_Object, Signaling_Moving_Object, OPERATIONS, \
+    to_cell
+from .population import Population
 
+import sys
 import numpy as np
-import tensorflow as tf
 import gym
 
 # observation space constants
@@ -11,6 +13,8 @@ OBS_MY_SIGNAL = "OBS_MY_SIGNAL"
 OBS_FREE_STORAGE_PERCENT = "OBS_FREE_STORAGE_PERCENT"
 OBS_HEALTH = "OBS_HEALTH"
 OBS_REWARD = "OBS_REWARD"
+# only if the env has `pheromones`
+OBS_PHEROMONES = "OBS_PHEROMONES"
 
 # action space constants
 ACT_SIGNAL = "ACT_SIGNAL"
@@ -26,6 +30,10 @@ ACT_EAT_INDEX = 5
 
 VOCAB_SIZE = 1024
 
+# initial_loc of actors left for `SMAE.add_actors` to place.
+# It is outside of every world
+UNPLACED = (-1, -1, -1)
+
 RESTING_ENERGY_RATE = 0.2 # energy consumed at every step
 FOOD_ENERGY = 10 # energy gained by eating food
 EATING_COST = 0.5
@@ -37,8 +45,101 @@ ATTACKING_GAIN_COEF = 0.8 # coefficent of energy gained from attacking
 PLACE_COST = 1 # energy spend placing 1 mass
 FAILED_PLACE_COST = 1 # additional energy spent when olacing fails
 
+def _to_numpy(x):
+    """convert possibly tensors into numpy arrays. TensorFlow
+    is never imported here; if nobody else imported it, x
+    cannot be one of its tensors"""
+    tf = sys.modules.get("tensorflow")
+    if tf is not None and isinstance(x, (tf.Variable, tf.Tensor)):
+        return x.numpy()
+    return x
+
+def apply_actions(env, actors, actions, signals):
+    """attempts to apply already decided actions of many
+    actors at once. All actors move simultaneously (see
+    `SMAE.resolve_moves`), then turn, then pick up, place
+    and eat one actor at a time
+
+    args:
+        env: `SMAE` the actors are in
+        actors: list of `Actor`
+        actions: np.ndarray (N, ACT_CONTINUOUS_LEN) in [0, 1]
+        signals: int np.ndarray (N,) in [0, VOCAB_SIZE)
+    """
+    actions = np.asarray(actions, dtype=float)
+    signals = np.asarray(signals)
+
+    # Negative values allow agents to directly 
+    # move backward and anti pick or place. Values
+    # greator than one would allow running faster
+    # than the max speed
+    assert np.all((0 <= actions) & (actions <= 1))
+
+    # make sure signals are valid
+    assert np.all((0 <= signals) & (signals < VOCAB_SIZE))
+
+    population = env.population
+    rows = np.fromiter((actor._row for actor in actors),
+        dtype=np.int64, count=len(actors))
+
+    # try to move. Speed is porportional to health [0, 1)
+    orientation = population.orientation[rows]
+    dir_vec = np.stack([np.cos(orientation), np.sin(orientation),
+        np.zeros_like(orientation)], axis=1)
+    delta_loc = dir_vec * (population.max_forward_speed[rows]
+        * actions[:, ACT_FORWARD_SPEED_INDEX]
+        * population.health(rows))[:, None]
+    # amount of mass moved
+    mass = 1 + population.storage_count[rows]
+    # exerting work costs energy
+    population.energy[rows] -= MOVING_ENERGY_COST \
+        * np.linalg.norm(delta_loc, axis=1) * mass
+    # below is reminiscent of a=F/m
+    env.resolve_moves(actors, delta_loc / mass[:, None])
+
+    # try rotating
+    population.orientation[rows] += (np.pi/2) * (
+        actions[:, ACT_TURN_LEFT_INDEX]
+        - actions[:, ACT_TURN_RIGHT_INDEX])
+
+    # pick up, place and eat
+    interacting = np.any(actions[:,
+        [ACT_PICK_INDEX, ACT_PLACE_INDEX, ACT_EAT_INDEX]] > 0.5, axis=1)
+    for i in np.flatnonzero(interacting):
+        actors[i]._interact(actions[i], env)
+
+    # make signals
+    population.signal[rows] = signals
+
+    # resting energy and starvation are handled for
+    # all actors at once by the env after every step
+
+def _column_view(name, doc=None):
+    """property reading and writing column `name` at
+    the actor's row of its `Population`"""
+    def fget(self):
+        value = self._population.columns[name][self._row]
+        return value if value.ndim else value.item()
+    def fset(self, value):
+        self._population.columns[name][self._row] = value
+    return property(fget, fset, doc=doc)
+
 class Actor(Signaling_Moving_Object):
 
+    # actor state lives in a `Population` row so that the
+    # env can update all actors at once. `Actor` is only a
+    # thin view onto that row
+    loc = _column_view("loc")
+    orientation = _column_view("orientation")
+    energy = _column_view("energy")
+    prev_energy = _column_view("prev_energy")
+    reward = _column_view("reward")
+    _signal = _column_view("signal")
+    storage_count = _column_view("storage_count",
+        doc="number of items in `self.storage`")
+    storage_capacity = _column_view("storage_capacity")
+    max_forward_speed = _column_view("max_forward_speed")
+
     def __init__(self,
         env,
         initial_loc:tuple=None,
@@ -57,15 +158,18 @@ class Actor(Signaling_Moving_Object):
 
         args:
             initial_loc: tuple. If None (default), location
-                is randomly initialized by env.random_avaliable_loc
+                is randomly initialized by env.random_avaliable_loc.
+                `UNPLACED` leaves it to `SMAE.add_actors`, which
+                moves the actor to a random free cell
             initial_orientation: radian angle (-inf, inf)
                 on the plane formed by first two dimensions
             max_forward_speed: maximum speed moving forward
             algorithm: see Agent
-            vision_size: egocentric dimensionwise vision lengths.
-                The second axis is not symetric; all other axes are.
-                This gives the agent a 180deg field of view. E.G.:
-                (3, 8, 0) allows agents to see 3 units left, 3 units
+            vision_size: egocentric shape of the field of view.
+                The second axis is not symetric; all other axes are
+                centered on the actor. This gives the agent a 180deg
+                field of view that turns with its orientation. E.G.:
+                (7, 8, 1) allows agents to see 3 units left, 3 units
                 right, (and the x location they are at), 8 units
                 foreward (including their present location), and only
                 in-plane with their current elevation
@@ -75,6 +179,10 @@ class Actor(Signaling_Moving_Object):
         """
         initial_loc = env.random_avaliable_loc() \
             if initial_loc is None else initial_loc
+        # until the actor is added to an env, its
+        # state is kept in a private single row store
+        self._population = Population(capacity=1)
+        self._row = self._population.allocate(owner=self)
         super(Actor, self).__init__(
             loc=initial_loc,
             signal_depth=VOCAB_SIZE,
@@ -93,34 +201,21 @@ class Actor(Signaling_Moving_Object):
         self.reward = 0.0
          
     def egocentric_obs(self, env):
-        # NOTE non idempotent logic here
-        self._calc_energy_gain_reward()
-
-        return {
-            OBS_OPERATIONS: env.combined_object_ops[
-                self.rounded_loc[0] - self.vision_size[0]:
-                self.rounded_loc[0] + self.vision_size[0],
-                self.rounded_loc[1]: # only 180deg FOV
-                self.rounded_loc[1] + self.vision_size[1],
-                self.rounded_loc[2] - self.vision_size[2]:
-                self.rounded_loc[2] + self.vision_size[2],
-            ],
-            OBS_SIGNALS: env.signal_field[
-                self.rounded_loc[0] - self.vision_size[0]:
-                self.rounded_loc[0] + self.vision_size[0],
-                self.rounded_loc[1]: # only 180deg FOV
-                self.rounded_loc[1] + self.vision_size[1],
-                self.rounded_loc[2] - self.vision_size[2]:
-                self.rounded_loc[2] + self.vision_size[2],
-            ],
+        ops, signals = env.egocentric_views([self])
+        obs = {
+            OBS_OPERATIONS: ops[0],
+            OBS_SIGNALS: signals[0],
             OBS_MY_SIGNAL: self.signal,
             OBS_FREE_STORAGE_PERCENT:
-                (self.storage_capacity - len(self.storage)) / self.storage_capacity,
+                (self.storage_capacity - self.storage_count) / self.storage_capacity,
             OBS_HEALTH: self.health,
             OBS_REWARD: self.reward
         }
+        if getattr(env, "pheromones", None) is not None:
+            obs[OBS_PHEROMONES] = env.pheromone_views([self])[0]
+        return obs
 
-    def egocentric_r(self, env, obs, a):
+    def egocentric_r(self, env):
         return self.reward
 
     def egocentric_done(self, env):
@@ -134,37 +229,22 @@ class Actor(Signaling_Moving_Object):
     def apply_action(self, a, env):
         """attempts to apply an already
         decided action to environment"""
+        self._apply(_to_numpy(a[ACT_CONTINUOUS]),
+            _to_numpy(a[ACT_SIGNAL]), env)
 
-        a_cont = a[ACT_CONTINUOUS]
-        a_signal = a[ACT_SIGNAL]
-
-        # convert possibly tensors into numpy arrays
-        if isinstance(a_cont, tf.Variable):
-            a_cont = a_cont.numpy()
-        if isinstance(a_signal, tf.Variable):
-            a_signal = a_signal.numpy()
-
-        # Negative values allow agents to directly 
-        # move backward and anti pick or place. Values
-        # greator than one would allow running faster
-        # than the max speed
-        assert np.zeros_like(a_cont) <= a_cont \
-            <= np.ones_like(a_cont)
-
-        # make sure signal is valid
-        assert 0 <= a_signal < VOCAB_SIZE
+    def _apply(self, a_cont, a_signal, env):
+        """apply an action already unpacked into its
+        ACT_CONTINUOUS and ACT_SIGNAL parts
 
-        # try to move
-        delta_loc = self.max_forward_speed \
-            * a_cont[ACT_FORWARD_SPEED_INDEX] \
-            * self._dir_vec 
-        self.try_move(delta_loc, env)
-
-        # try rotating
-        self.orientation += (np.pi/2) * (
-            a_cont[ACT_TURN_LEFT_INDEX] \
-            - a_cont[ACT_TURN_RIGHT_INDEX])
+        args:
+            a_cont: np.ndarray (ACT_CONTINUOUS_LEN,) in [0, 1]
+            a_signal: int in [0, VOCAB_SIZE)
+        """
+        apply_actions(env, [self],
+            np.asarray(a_cont)[None], np.asarray([a_signal]))
 
+    def _interact(self, a_cont, env):
+        """pick up, place and eat as requested by a_cont"""
         # if pick up
         if a_cont[ACT_PICK_INDEX] > 0.5:
             self._pick(env)
@@ -178,32 +258,20 @@ class Actor(Signaling_Moving_Object):
             # chewing takes effort whether it has nutrition or not
             self.energy -= EATING_COST
             # consume food if in front of agent
-            if OPERATIONS.EAT in self._block_ops_in_front(env):
+            if OPERATIONS.allows(self._block_ops_in_front(env),
+                OPERATIONS.EAT) \
+                and env.moving_object_at(self._loc_in_front) is None:
                 self.energy += FOOD_ENERGY
                 # remove food block from env
-                self.env.static_objects \
-                    [self.loc+self._dir_vec] \
-                    = OPERATIONS.encode([OPERATIONS.GOTHROUGH])
-                self.env.combined_object_ops \
-                    [self.loc+self._dir_vec] \
-                    = OPERATIONS.encode([OPERATIONS.GOTHROUGH])
-
-        # make signals
-        self.set_signal(a_signal)
-
-        # logic
-        self.energy -= RESTING_ENERGY_RATE
-        if self.energy <= 0:
-            env.remove_agent(self)
-
-        return # for clarity
+                env.set_static_object(self._loc_in_front,
+                    OPERATIONS.encode([OPERATIONS.GOTHROUGH]))
 
     @property
     def observation_space(self):
-        return gym.spaces.Dict({
+        spaces = {
             OBS_OPERATIONS: gym.spaces.Box(
                 low=0,
-                high=255,
+                high=np.iinfo(np.int8).max,
                 shape=self.vision_size,
                 dtype=np.int8
             ),
@@ -218,21 +286,30 @@ class Actor(Signaling_Moving_Object):
                 low=0,
                 high=1,
                 shape=(1,),
-                dtype=np.float
+                dtype=np.float64
             ),
             OBS_HEALTH: gym.spaces.Box(
                 low=0,
                 high=1,
                 shape=(1,),
-                dtype=np.float
+                dtype=np.float64
             ),
             OBS_REWARD: gym.spaces.Box(
                 low=-1,
                 high=1,
                 shape=(1,),
-                dtype=np.float
+                dtype=np.float64
             ),
-        })
+        }
+        pheromones = getattr(self.env, "pheromones", None)
+        if pheromones is not None:
+            spaces[OBS_PHEROMONES] = gym.spaces.Box(
+                low=0,
+                high=np.inf,
+                shape=(pheromones.channels,) + tuple(self.vision_size),
+                dtype=np.float32
+            )
+        return gym.spaces.Dict(spaces)
 
     @property
     def action_space(self):
@@ -241,7 +318,7 @@ class Actor(Signaling_Moving_Object):
                 low=0,
                 high=1,
                 shape=(ACT_CONTINUOUS_LEN,),
-                dtype=np.float
+                dtype=np.float64
             ),
             ACT_SIGNAL: gym.spaces.Discrete(VOCAB_SIZE)
         })
@@ -252,7 +329,7 @@ class Actor(Signaling_Moving_Object):
 
         health = 1-exp(-energy/50.0)
         """
-        return 1-np.math.exp(-self.energy/50.0)
+        return float(self._population.health(self._row))
 
     def try_move(self, delta_loc, env):
         """
@@ -261,7 +338,7 @@ class Actor(Signaling_Moving_Object):
                 to int's (possibly nondetirministically)
         """
         # speed is porportional to health [0, 1)
-        delta_loc *= self.health
+        delta_loc = np.asarray(delta_loc, dtype=float) * self.health
 
         # amount of mass moved
         mass = 1 + len(self.storage)
@@ -301,14 +378,18 @@ class Actor(Signaling_Moving_Object):
 
         always lose a small amount of energy
         """
-        loc_in_front = self.loc+self._dir_vec
+        loc_in_front = self._loc_in_front
+        if not env.in_bounds(loc_in_front):
+            # nothing to pick up outside of the world
+            self.energy -= FAILED_PICKUP_COST + PICKUP_COST
+            return
         possible_actor = env.actor_at(loc_in_front)
         if possible_actor is not None:
             # attack actor
             self.energy += ATTACKING_GAIN_COEF * possible_actor.attack(10.0)
             self.energy -= ATTACKING_COST
-        elif OPERATIONS.PICKUP in OPERATIONS.decode(
-            env.combined_object_ops[loc_in_front]) \
+        elif OPERATIONS.allows(env.ops_at(loc_in_front),
+            OPERATIONS.PICKUP) \
             and len(self.storage) < self.storage_capacity:
             # pickup object, place in storage,
             # and replace with empty block in environment
@@ -317,21 +398,17 @@ class Actor(Signaling_Moving_Object):
             # but may still be a moving_object or signaling_moving_object
             # instead of simply a static block
             possible_moving_object = env.moving_object_at(loc_in_front)
-            possible_signaling_object = env.signaling_object_at(loc_in_front)
-            if possible_signaling_object is not None:
-                # remove signaling object, but do not change
-                # static object where it stood (necesarily a
-                # GOTHROUGHable static object already)
-                self.storage.append(possible_signaling_object)
-            elif possible_moving_object is not None:
-                # remove moving object, but do not change
-                # static object where it stood (necesarily a
-                # GOTHROUGHable static object already)
+            if possible_moving_object is not None:
+                # remove (possibly signaling) moving object, but do
+                # not change static object where it stood (necesarily
+                # a GOTHROUGHable static object already)
+                env.remove_moving_object(possible_moving_object)
                 self.storage.append(possible_moving_object)
             else:
                 self.storage.append(env.static_objects[loc_in_front])
-                env.static_objects[loc_in_front] = OPERATIONS.encode([
-                    OPERATIONS.GOTHROUGH])
+                env.set_static_object(loc_in_front, OPERATIONS.encode([
+                    OPERATIONS.GOTHROUGH]))
+            self.storage_count = len(self.storage)
         else:
             # attempting to pick up costs extra energy if failed
             self.energy -= FAILED_PICKUP_COST
@@ -343,12 +420,19 @@ class Actor(Signaling_Moving_Object):
         holding
         
         lose small amount of health if placed where not allowed"""
-        loc_in_front = self.loc+self._dir_vec
-        if OPERATIONS.GOTHROUGH in OPERATIONS.decode(
-            env.combined_object_ops[loc_in_front]) \
+        loc_in_front = self._loc_in_front
+        if env.in_bounds(loc_in_front) \
+            and OPERATIONS.allows(env.ops_at(loc_in_front),
+                OPERATIONS.GOTHROUGH) \
             and len(self.storage) > 0:
             # place last object in self.storage out
-            env.static_objects[loc_in_front] = self.storage.pop()
+            item = self.storage.pop()
+            self.storage_count = len(self.storage)
+            if isinstance(item, Moving_Object):
+                item.loc = np.array(loc_in_front, dtype=float)
+                env.add_moving_object(item)
+            else:
+                env.set_static_object(loc_in_front, item)
         else:
             # could not place object or nothing to place
             self.energy -= FAILED_PLACE_COST
@@ -356,20 +440,25 @@ class Actor(Signaling_Moving_Object):
 
     @property
     def _dir_vec(self):
-        return [
+        return np.array([
             np.cos(self.orientation),
             np.sin(self.orientation),
             0.0
-        ]
+        ])
 
-    def _block_ops_in_front(self, env):
-        """get operations support by block directly
-        in front of actor"""        
-        block_loc = self.loc + self._dir_vec
-        block = env.combined_object_ops[block_loc]
-        return OPERATIONS.decode(block)
-        
     @property
+    def _loc_in_front(self):
+        """cell directly in front of actor"""
+        return to_cell(self.loc + self._dir_vec)
+
+    def _block_ops_in_front(self, env):
+        """get OPERATIONS bitfield of block directly
+        in front of actor"""
+        block_loc = self._loc_in_front
+        if not env.in_bounds(block_loc):
+            return env.out_of_bounds_ops
+        return env.ops_at(block_loc)
+
     def _calc_energy_gain_reward(self):
         """Non-idempotent reward logic here
         - calculates change in energy by prev_energy and energy
@@ -380,8 +469,18 @@ class Actor(Signaling_Moving_Object):
         have performed actions and before observations, rewards, etc.
         are collected for the next timestep.
 
-        Currently, self.egocentric_obs calls this method
+        Currently, SMAE performs this for all actors at once
+        with `Population.update_rewards`
+        """
+        self._population.update_rewards(self._row)
+
+    def _attach(self, population):
+        """move the actor's state into a row of `population`
+
+        args:
+            population: `Population` the actor's state is
+                kept in from now on
         """
-        energy_gain = self.energy - self.prev_energy
-        self.reward = np.math.tanh(energy_gain / 10.0)
-        self.prev_energy = self.energy
\ No newline at end of file
+        values = self._population.release(self._row)
+        self._population = population
+        self._row = population.allocate(owner=self, **values)
\ No newline at end of file
@@ -0,0 +1,241 @@
+import numpy as np
+
+from .actor import apply_actions, RESTING_ENERGY_RATE, \
+    ACT_CONTINUOUS_LEN, OBS_REWARD
+from .elements import OPERATIONS, to_cells
+from .env import SMAE, batch_obs, obs_buffers, _shared_vision_size
+from .population import Population
+from . import vision
+
+class Batched_SMAE:
+
+    def __init__(self,
+        n_worlds: int,
+        signal_depth: int,
+        world_size=(16,16,1),
+        static_objects=None,
+        actor_ids=[],
+        max_steps=None,
+        **kwargs):
+        """K independent `SMAE` worlds stepped together
+
+        `static_objects`, `combined_object_ops` and `signal_field`
+        of every world are slices of stacked (K, X, Y, Z) arrays and
+        all actors of all worlds share one `Population` (with a
+        `world` column). Actor bookkeeping (energy, rewards,
+        starvation) and observations are computed for every
+        world at once. Actions, gravity and the signal field
+        still loop over the worlds in Python. Worlds whose
+        actors all died (or that ran `max_steps`) are reset in
+        place
+
+        args:
+            n_worlds: number of worlds K
+            signal_depth: see `SMAE`
+            world_size: shape of every world
+            static_objects: np.ndarray (np.int8) of world_size shared
+                by every world or (K,)+world_size with one per world.
+                Worlds are reset to these. If `None` (default) all
+                points only support the OPERATIONS.GOTHROUGH operation
+            actor_ids: ids of the actors every world starts with
+                (and restarts with after a reset)
+            max_steps: reset worlds after this many steps. If `None`
+                (default) worlds are only reset once all actors died
+            kwargs: passed to every `SMAE` (eg gravity). Pheromones,
+                profilers and recorders are not supported (nor is
+                attaching a `recording.Recorder` to a world)
+        """
+        if kwargs.get("pheromones") is not None:
+            # one field shared by every world would mix their trails
+            raise ValueError("Batched_SMAE does not support pheromones")
+        for key in ("profiler", "recorder"):
+            # `step` bypasses `SMAE._global_update`, which drives them
+            if kwargs.get(key) is not None:
+                raise ValueError("Batched_SMAE does not support a "
+                    + key)
+        self.n_worlds = n_worlds
+        self.world_size = tuple(world_size)
+        self.actor_ids = list(actor_ids)
+        self.max_steps = max_steps
+        shape = (n_worlds,) + self.world_size
+        if static_objects is None:
+            static_objects = np.full(self.world_size,
+                OPERATIONS.encode([OPERATIONS.GOTHROUGH]), dtype=np.int8)
+        self.static_objects = np.broadcast_to(
+            np.asarray(static_objects, dtype=np.int8), shape).copy()
+        # no moving objects yet
+        self.combined_object_ops = self.static_objects.copy()
+        self.signal_field = np.zeros(shape, dtype=np.int16)
+        self.population = Population(
+            capacity=max(16, n_worlds * len(self.actor_ids)))
+        # steps since each world was last reset
+        self.steps = np.zeros((n_worlds,), dtype=np.int64)
+        # `Obs_Buffers` of `egocentric_obs_batch(out=True)`
+        self._owned_obs = None
+        self.worlds = [
+            SMAE(signal_depth=signal_depth,
+                world_size=self.world_size,
+                static_objects=self.static_objects[k],
+                population=self.population,
+                world=k,
+                combined_object_ops=self.combined_object_ops[k],
+                signal_field=self.signal_field[k],
+                actor_ids=self.actor_ids,
+                **kwargs)
+            for k in range(n_worlds)]
+
+    def __len__(self):
+        return self.n_worlds
+
+    @property
+    def batch_actors(self) -> list:
+        """returns list of the actors of every world, world by
+        world. Row i of `step` inputs and outputs belongs to
+        `self.batch_actors[i]`"""
+        return [actor for world in self.worlds
+            for actor in world.actors.values()]
+
+    @property
+    def batch_worlds(self) -> np.ndarray:
+        """returns int array of the world of every row"""
+        return np.repeat(np.arange(self.n_worlds),
+            [len(world.actors) for world in self.worlds])
+
+    @property
+    def batch_ids(self) -> np.ndarray:
+        """returns object array of the actor id of every row
+        (ids are only unique within a world)"""
+        ids = np.empty((sum(len(world.actors)
+            for world in self.worlds),), dtype=object)
+        ids[:] = [actor_id for world in self.worlds
+            for actor_id in world.actors]
+        return ids
+
+    def reset(self) -> dict:
+        """reset every world
+
+        return: returns dict mapping each OBS_ key to an
+            np.ndarray stacked over `self.batch_actors`"""
+        for k in range(self.n_worlds):
+            self._reset_world(k)
+        return self.egocentric_obs_batch(self.batch_actors)
+
+    def step(self, actions, signals, out=None, packed=False):
+        """simulate one step of every world
+
+        args:
+            actions: np.ndarray (N, ACT_CONTINUOUS_LEN) of
+                ACT_CONTINUOUS actions ordered like `self.batch_actors`
+            signals: np.ndarray (N,) of ACT_SIGNAL actions
+            out, packed: where and how to write obs
+                (see `SMAE.egocentric_obs_batch`)
+
+        returns: tuple (obs, r, done, info). obs is a dict mapping
+            each OBS_ key to an array stacked over actors and r and
+            done are (N,) arrays. Actors that died during the step
+            and all actors of worlds that were reset are done. info
+            maps "world" and "id" to the world and actor id of every
+            row and "reset" to a bool (K,) array of the worlds that
+            were reset after this step. obs are always the
+            observations before any reset; the rows of the next
+            step follow the new `self.batch_actors`
+        """
+        actors = self.batch_actors
+        worlds = self.batch_worlds
+        ids = self.batch_ids
+        actions = np.asarray(actions, dtype=float)
+        signals = np.asarray(signals)
+        assert actions.shape == (len(actors), ACT_CONTINUOUS_LEN)
+        assert signals.shape == (len(actors),)
+
+        # movement needs each world's spatial index
+        bounds = np.searchsorted(worlds, np.arange(self.n_worlds + 1))
+        for k, world in enumerate(self.worlds):
+            batch = slice(bounds[k], bounds[k+1])
+            world.origonal_actors = world.actors.copy()
+            apply_actions(world, actors[batch],
+                actions[batch], signals[batch])
+            world._apply_global_acceleration(world.gravity)
+        # everything else is done for all worlds at once
+        self._update_actors()
+        for world in self.worlds:
+            world._update_combined_object_ops()
+        self._update_signal_field()
+        self.steps += 1
+
+        obs = self.egocentric_obs_batch(actors, out, packed)
+        done = np.fromiter(
+            (actor._population is not self.population
+                for actor in actors),
+            dtype=bool, count=len(actors))
+        reset = np.array([not world.actors for world in self.worlds])
+        if self.max_steps is not None:
+            reset |= self.steps >= self.max_steps
+        done |= reset[worlds]
+        for k in np.flatnonzero(reset):
+            self._reset_world(k)
+        return obs, obs[OBS_REWARD].copy(), done, {
+            "world": worlds, "id": ids, "reset": reset}
+
+    def egocentric_obs_batch(self, actors, out=None, packed=False) -> dict:
+        """egocentric observations of actors from any of the
+        worlds gathered at once (see `SMAE.egocentric_obs_batch`)"""
+        vision_size = _shared_vision_size(actors)
+        # every world reads the same population
+        columns = self.worlds[0]._actor_columns(actors)
+        cells = np.concatenate([columns["world"][:, None],
+            to_cells(columns["loc"]).reshape((len(actors), -1))], axis=1)
+        buckets = vision.orientation_buckets(columns["orientation"])
+        world = self.worlds[0]
+        if out is None and not packed:
+            ops = vision.gather(self.combined_object_ops, cells, buckets,
+                vision_size, fill=world.out_of_bounds_ops)
+            signals = vision.gather(self.signal_field, cells, buckets,
+                vision_size, fill=world.out_of_bounds_signal)
+            if world.occlusion:
+                hidden = vision.hidden_cells(ops, buckets)
+                ops[hidden] = world.out_of_bounds_ops
+                signals[hidden] = world.out_of_bounds_signal
+            return batch_obs(columns, ops, signals)
+        buffers = obs_buffers(out, self._owned_obs, len(actors),
+            vision_size, packed)
+        if out is True:
+            self._owned_obs = buffers
+        return buffers.fill(columns, cells, buckets,
+            self.combined_object_ops, self.signal_field,
+            world.out_of_bounds_ops, world.out_of_bounds_signal,
+            occlusion=world.occlusion)
+
+    def render(self, world=0, **kwargs):
+        """render one world (see `SMAE.render`)"""
+        return self.worlds[world].render(**kwargs)
+
+    def close(self):
+        for world in self.worlds:
+            world.close()
+
+    def _update_actors(self):
+        """resting energy, rewards and starvation of every
+        actor in every world (see `SMAE._update_actors`)"""
+        rows = self.population.rows
+        starved = self.population.consume(RESTING_ENERGY_RATE, rows)
+        self.population.update_rewards(rows)
+        for row in starved:
+            self.worlds[self.population.world[row]].queue_death(
+                actor=self.population.owners[row])
+        for world in self.worlds:
+            world.apply_queued()
+
+    def _update_signal_field(self):
+        """rewrite the signal fields of every world (see
+        `SMAE._update_signal_field`). Each world only touches
+        the cells of its own signaling objects"""
+        for world in self.worlds:
+            world._update_signal_field()
+
+    def _reset_world(self, k):
+        """put world k back into its initial state with its
+        actors respawned at random, reusing all of its arrays
+        (see `SMAE.reset`)"""
+        self.worlds[k].reset(randomize_spawns=True)
+        self.steps[k] = 0
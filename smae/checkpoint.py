@@ -0,0 +1,267 @@
+import json
+import struct
+import numpy as np
+
+from .actor import Actor
+from .elements import encode_item, encode_items, decode_item, ITEM_LEN, \
+    OBJECT_LEN
+from .pheromones import Pheromone_Field
+from .population import COLUMNS
+
+# file layout:
+#   MAGIC | version (u32) | reserved (u32) | header length (u64)
+#   | json header | arrays, each starting on an ALIGNMENT boundary
+# A recording (see `recording`) is a sequence of such records
+# The header lists every array's dtype, shape and offset (relative
+# to the first array) next to the env's scalar settings
+MAGIC = b"SMAECKPT"
+VERSION = 1
+ALIGNMENT = 64
+_PREFIX = struct.Struct("<8sIIQ")
+
+# population columns saved for every actor
+ACTOR_COLUMNS = [name for name in COLUMNS if name != "world"]
+# `env_state` arrays with one row per actor
+ACTOR_ARRAYS = ["actor_" + name for name in ACTOR_COLUMNS] \
+    + ["storage", "vision_size"]
+
+def _aligned(n) -> int:
+    return -(-n // ALIGNMENT) * ALIGNMENT
+
+def write_arrays(f, header, arrays) -> int:
+    """write a json-able header and named np.ndarrays to the
+    binary file f at its current position. Several records
+    can follow each other in one file
+
+    return: returns number of bytes written"""
+    arrays = {name: np.ascontiguousarray(array)
+        for name, array in arrays.items()}
+    header = dict(header, arrays={})
+    offset = 0
+    for name, array in arrays.items():
+        header["arrays"][name] = {"dtype": array.dtype.str,
+            "shape": list(array.shape), "offset": offset}
+        offset = _aligned(offset + array.nbytes)
+    header_bytes = json.dumps(header).encode("utf-8")
+    start = _aligned(_PREFIX.size + len(header_bytes))
+    f.write(_PREFIX.pack(MAGIC, VERSION, 0, len(header_bytes)))
+    f.write(header_bytes)
+    f.write(bytes(start - _PREFIX.size - len(header_bytes)))
+    for array in arrays.values():
+        f.write(array.data)
+        f.write(bytes(_aligned(array.nbytes) - array.nbytes))
+    return start + offset
+
+def read_header(f, offset=0) -> tuple:
+    """read the header of the record at offset of the binary
+    file f without touching its arrays
+
+    return: returns tuple (header, start, end) where start is
+        the file offset of the record's first array and end
+        is where the next record begins"""
+    f.seek(offset)
+    magic, version, _, header_len = _PREFIX.unpack(f.read(_PREFIX.size))
+    if magic != MAGIC:
+        raise ValueError("{} holds no SMAE record at {}".format(
+            f.name, offset))
+    if version > VERSION:
+        raise ValueError("{} was written by a newer version "
+            "(format {})".format(f.name, version))
+    header = json.loads(f.read(header_len).decode("utf-8"))
+    start = offset + _aligned(_PREFIX.size + header_len)
+    size = max((_aligned(spec["offset"] + int(np.prod(spec["shape"]))
+        * np.dtype(spec["dtype"]).itemsize)
+        for spec in header["arrays"].values()), default=0)
+    return header, start, start + size
+
+def read_arrays(path, mmap_mode="c", offset=0) -> tuple:
+    """read a record written by `write_arrays`
+
+    args:
+        path: file to read
+        mmap_mode: `np.memmap` mode of the arrays ("c" (default)
+            maps them copy-on-write, "r" read-only and "r+"
+            writes changes through to the file). If `None` the
+            arrays are read into memory
+        offset: where the record starts in the file (0 default)
+
+    return: returns tuple (header, dict of np.ndarrays, end)
+        where end is where the next record begins
+    """
+    with open(path, "rb") as f:
+        header, start, end = read_header(f, offset)
+        arrays = {}
+        for name, spec in header["arrays"].items():
+            dtype, shape = np.dtype(spec["dtype"]), tuple(spec["shape"])
+            if mmap_mode is None or 0 in shape:
+                f.seek(start + spec["offset"])
+                arrays[name] = np.fromfile(f, dtype=dtype,
+                    count=int(np.prod(shape))).reshape(shape)
+            else:
+                arrays[name] = np.memmap(path, dtype=dtype, mode=mmap_mode,
+                    offset=start + spec["offset"], shape=shape)
+    return header, arrays, end
+
+def json_ids(actor_ids) -> list:
+    """returns list of actor_ids as plain ints and strs"""
+    ids = []
+    for actor_id in actor_ids:
+        if isinstance(actor_id, (np.integer, int)) \
+            and not isinstance(actor_id, bool):
+            ids.append(int(actor_id))
+        elif isinstance(actor_id, str):
+            ids.append(actor_id)
+        else:
+            raise ValueError("only int and str actor ids can be "
+                "saved, not {!r}".format(actor_id))
+    return ids
+
+def storage_array(actors, columns) -> np.ndarray:
+    """encode the storage of actors. Only actors holding
+    something are visited
+
+    args:
+        actors: list of `Actor`
+        columns: their population columns (see
+            `SMAE._actor_columns`)
+
+    return: returns int np.ndarray (N, capacity, ITEM_LEN)
+    """
+    storage = np.zeros((len(actors), max(
+        columns["storage_capacity"].max(initial=1), 1), ITEM_LEN), np.int64)
+    for row in np.flatnonzero(columns["storage_count"]):
+        for slot, item in enumerate(actors[row].storage):
+            storage[row, slot] = encode_item(item)
+    return storage
+
+def object_array(env) -> np.ndarray:
+    """returns float np.ndarray (K, OBJECT_LEN) of the location
+    and `encode_item` record of every moving object of env
+    that is not an actor"""
+    others = [moving_object for moving_object in env.moving_objects
+        if not isinstance(moving_object, Actor)]
+    objects = np.zeros((len(others), OBJECT_LEN))
+    if others:
+        objects[:, 0:3] = [moving_object.loc for moving_object in others]
+        objects[:, 3:] = encode_items(others)
+    return objects
+
+def env_state(env) -> tuple:
+    """gather everything `build_env` needs to recreate env.
+    World arrays are returned as is (not copied)
+
+    return: returns tuple (json-able header, dict of np.ndarrays)
+    """
+    actors = list(env.actors.values())
+    columns = env._actor_columns(actors)
+    storage = storage_array(actors, columns)
+    objects = object_array(env)
+    rng = np.random if env.rng is None else env.rng
+    rng_name, rng_keys, rng_pos, has_gauss, cached_gaussian = rng.get_state()
+
+    header = {
+        "signal_depth": int(env.signal_depth),
+        "world_size": [int(size) for size in env.world_size],
+        "gravity": [float(g) for g in env.gravity],
+        "out_of_bounds_ops": int(env.out_of_bounds_ops),
+        "out_of_bounds_signal": int(env.out_of_bounds_signal),
+        "occlusion": bool(env.occlusion),
+        "validate_combined_ops": bool(env.validate_combined_ops),
+        "chunk_size": env.chunk_size,
+        "actor_ids": json_ids(env.actors),
+        "pheromones": None if env.pheromones is None
+            else env.pheromones.settings,
+        "rng": {"global": env.rng is None, "name": rng_name,
+            "pos": int(rng_pos), "has_gauss": int(has_gauss),
+            "cached_gaussian": float(cached_gaussian)},
+    }
+    arrays = {
+        "static_objects": env.static_objects,
+        "combined_object_ops": env.combined_object_ops,
+        "signal_field": env.signal_field,
+        "storage": storage,
+        "vision_size": np.array([actor.vision_size for actor in actors],
+            np.int64).reshape((len(actors), 3)),
+        "objects": objects,
+        "rng_keys": rng_keys,
+    }
+    arrays.update({"actor_" + name: columns[name] for name in ACTOR_COLUMNS})
+    if env.pheromones is not None:
+        arrays["pheromones"] = env.pheromones.field
+    return header, arrays
+
+def build_env(header, arrays, cls, template=False, global_rng=True):
+    """recreate an env from what `env_state` gathered. The
+    world arrays are used as they are (not copied). If
+    "combined_object_ops" or "signal_field" are missing they
+    are recomputed
+
+    args:
+        header, arrays: see `env_state`
+        cls: `SMAE` subclass to build
+        template: see `SMAE`
+        global_rng: if True (default) and env used numpy's
+            global random state, that state is overwritten.
+            Otherwise the env gets its own `np.random.RandomState`
+
+    return: returns a new cls"""
+    rng_state = header["rng"]
+    rng_state = (rng_state["name"], np.array(arrays["rng_keys"]),
+        rng_state["pos"], rng_state["has_gauss"],
+        rng_state["cached_gaussian"])
+    if header["rng"]["global"] and global_rng:
+        np.random.set_state(rng_state)
+        rng = None
+    else:
+        rng = np.random.RandomState()
+        rng.set_state(rng_state)
+    pheromones = None
+    if header.get("pheromones") is not None:
+        pheromones = Pheromone_Field(**header["pheromones"])
+        pheromones.set_field(arrays["pheromones"])
+
+    env = cls(
+        signal_depth=header["signal_depth"],
+        world_size=tuple(header["world_size"]),
+        static_objects=arrays["static_objects"],
+        gravity=tuple(header["gravity"]),
+        out_of_bounds_ops=header["out_of_bounds_ops"],
+        out_of_bounds_signal=header["out_of_bounds_signal"],
+        occlusion=header.get("occlusion", False),
+        validate_combined_ops=header["validate_combined_ops"],
+        combined_object_ops=arrays.get("combined_object_ops"),
+        signal_field=arrays.get("signal_field"),
+        rng=rng,
+        template=template,
+        chunk_size=header.get("chunk_size"),
+        pheromones=pheromones)
+
+    locs = arrays["actor_loc"]
+    for i, actor_id in enumerate(header["actor_ids"]):
+        env.add_actor(Actor(env=env, initial_loc=locs[i],
+            vision_size=tuple(arrays["vision_size"][i].tolist())),
+            actor_id=actor_id)
+    actors = list(env.actors.values())
+    rows = np.array([actor._row for actor in actors], np.int64)
+    for name in ACTOR_COLUMNS:
+        env.population.columns[name][rows] = arrays["actor_" + name]
+    for actor, records in zip(actors, arrays["storage"]):
+        actor.storage = [decode_item(record)
+            for record in records[:actor.storage_count]]
+    for record in arrays["objects"]:
+        env.add_moving_object(decode_item(record[3:], loc=record[0:3]))
+    env.origonal_actors = env.actors.copy()
+    # a saved field already holds every signal; this only
+    # lets the env know which cells they are in
+    env._update_signal_field()
+    return env
+
+def save(env, path):
+    """write env to path. See `SMAE.save`"""
+    with open(path, "wb") as f:
+        write_arrays(f, *env_state(env))
+
+def load(path, cls, mmap_mode="c"):
+    """read an env written by `save`. See `SMAE.load`"""
+    header, arrays, _ = read_arrays(path, mmap_mode=mmap_mode)
+    return build_env(header, arrays, cls)
@@ -0,0 +1,347 @@
+import operator
+import numpy as np
+
+CHUNK_SIZE = 16 # default edge length of a chunk
+
+class Chunked_Array:
+
+    def __init__(self, shape, dtype, fill=0, chunk_size=CHUNK_SIZE):
+        """sparse stand-in for a dense np.ndarray of shape. The
+        array is cut into chunks of chunk_size cells per axis
+        that are only allocated once something is written to
+        them. Every other chunk reads as `fill` and takes no
+        memory. Chunks written back to nothing but `fill` are
+        freed whenever the pool of chunks fills up (see
+        `compact`), so memory grows with the volume that
+        currently differs from `fill` rather than with the
+        volume ever written to or the bounding box
+
+        Supports the indexing `SMAE` uses: a tuple of ints, a
+        tuple of int arrays (fancy indexing, eg `a[tuple(cells.T)]`)
+        and basic slicing (reads return dense np.ndarrays). Use
+        `np.asarray(a)` for a dense copy
+
+        args:
+            shape: shape of the array
+            dtype: np.dtype of the array
+            fill: value of cells never written (0 default)
+            chunk_size: edge length of a chunk (16 default). Axes
+                shorter than that are not cut
+        """
+        self.shape = tuple(int(size) for size in shape)
+        self.dtype = np.dtype(dtype)
+        self.fill_value = self.dtype.type(fill)
+        self.chunk_shape = tuple(max(1, min(chunk_size, size))
+            for size in self.shape)
+        self._chunk = np.array(self.chunk_shape, np.int64)
+        self._clear()
+
+    @classmethod
+    def from_dense(cls, array, fill=0, chunk_size=CHUNK_SIZE):
+        """returns a `Chunked_Array` with the values of array.
+        Chunks holding nothing but fill are not allocated"""
+        array = np.asarray(array)
+        chunked = cls(array.shape, array.dtype, fill=fill,
+            chunk_size=chunk_size)
+        chunked[...] = array
+        return chunked
+
+    @property
+    def ndim(self) -> int:
+        return len(self.shape)
+
+    @property
+    def size(self) -> int:
+        return int(np.prod(self.shape))
+
+    @property
+    def n_chunks(self) -> int:
+        """number of allocated chunks"""
+        return self._used
+
+    @property
+    def nbytes(self) -> int:
+        """bytes taken by the chunk pool and the chunk table"""
+        return self._pool.nbytes + self._table.nbytes
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __repr__(self):
+        return "Chunked_Array(shape={}, dtype={}, chunks={}/{})".format(
+            self.shape, self.dtype, self._used, self._table.size)
+
+    def __array__(self, dtype=None, copy=None):
+        dense = self._read_box(np.zeros(self.ndim, np.int64),
+            np.array(self.shape))
+        return dense if dtype is None else dense.astype(dtype)
+
+    def __getitem__(self, key):
+        cell = self._cell(key)
+        if cell is not None:
+            slot = self._table[cell[0]]
+            return self.fill_value if slot < 0 \
+                else self._pool[(slot,) + cell[1]]
+        key = self._expand(key)
+        if any(isinstance(k, slice) for k in key):
+            lo, hi, local = self._box(key)
+            return self._read_box(lo, hi)[local]
+        shape, chunks, offsets = self._cells(key)
+        slots = self._table[chunks]
+        values = np.full(slots.shape, self.fill_value, self.dtype)
+        hit = slots >= 0
+        values[hit] = self._pool[(slots[hit],)
+            + tuple(offset[hit] for offset in offsets)]
+        return values.reshape(shape)
+
+    def __setitem__(self, key, value):
+        cell = self._cell(key)
+        if cell is not None:
+            chunk, offset = cell
+            if self._table[chunk] < 0:
+                self._allocate(tuple(np.array([c]) for c in chunk))
+            self._pool[(self._table[chunk],) + offset] = value
+            return
+        key = self._expand(key)
+        if any(isinstance(k, slice) for k in key):
+            self._write_box(key, value)
+        else:
+            shape, chunks, offsets = self._cells(key)
+            values = np.broadcast_to(
+                np.asarray(value, self.dtype), shape).ravel()
+            if np.any(self._table[chunks] < 0):
+                self._allocate(tuple(np.unique(np.stack(chunks), axis=1)))
+            self._pool[(self._table[chunks],) + offsets] = values
+
+    def copy(self):
+        """returns an independent `Chunked_Array` with the same
+        values (only allocated chunks are copied)"""
+        copy = Chunked_Array.__new__(Chunked_Array)
+        copy.__dict__.update(self.__dict__)
+        copy._table = self._table.copy()
+        copy._pool = self._pool[:self._used].copy()
+        return copy
+
+    def fill(self, value):
+        """set every cell to value, freeing all chunks"""
+        self.fill_value = self.dtype.type(value)
+        self._clear()
+
+    def map(self, fn, dtype):
+        """returns a `Chunked_Array` of fn applied to every cell.
+        fn must work elementwise on np.ndarrays and is only
+        run over the allocated chunks and the fill value"""
+        mapped = Chunked_Array.__new__(Chunked_Array)
+        mapped.__dict__.update(self.__dict__)
+        mapped.dtype = np.dtype(dtype)
+        mapped.fill_value = mapped.dtype.type(
+            np.asarray(fn(np.array([self.fill_value])))[0])
+        mapped._table = self._table.copy()
+        mapped._pool = np.asarray(
+            fn(self._pool[:self._used])).astype(mapped.dtype)
+        return mapped
+
+    def nonfill_cells(self) -> np.ndarray:
+        """returns int np.ndarray (K, ndim) of the cells whose
+        value differs from `self.fill_value` (found in the
+        allocated chunks only)"""
+        chunks = np.argwhere(self._table >= 0)
+        slots = self._table[tuple(chunks.T)]
+        found = np.argwhere(self._pool[slots] != self.fill_value)
+        return chunks[found[:, 0]] * self._chunk + found[:, 1:]
+
+    def compact(self):
+        """free allocated chunks that hold nothing but
+        `self.fill_value` again (eg after signals moved on)"""
+        pool = self._pool[:self._used]
+        keep = np.any((pool != self.fill_value).reshape(
+            (self._used, -1)), axis=1) if self._used else np.zeros(0, bool)
+        slots = np.full(self._used + 1, -1, np.int32)
+        slots[:-1][keep] = np.arange(np.count_nonzero(keep))
+        # -1 (unallocated) maps to the extra last entry
+        self._table = slots[self._table]
+        self._pool = pool[keep].copy()
+        self._used = len(self._pool)
+
+    def _clear(self):
+        grid = tuple(-(-size // chunk)
+            for size, chunk in zip(self.shape, self.chunk_shape))
+        # slot in `self._pool` of every chunk, -1 if unallocated
+        self._table = np.full(grid, -1, np.int32)
+        self._pool = np.empty((0,) + self.chunk_shape, self.dtype)
+        self._used = 0
+
+    def _allocate(self, chunks):
+        """give every chunk in chunks (tuple of index arrays)
+        that has none a slot filled with `self.fill_value`.
+        If the pool is full, chunks holding nothing but fill
+        are freed first (see `compact`)"""
+        missing = self._table[chunks] < 0
+        if self._used + np.count_nonzero(missing) > len(self._pool):
+            # the pool is at least doubled after this, so compacting
+            # costs O(1) per allocated chunk
+            self.compact()
+            missing = self._table[chunks] < 0
+        chunks = tuple(chunk[missing] for chunk in chunks)
+        n = len(chunks[0])
+        if self._used + n > len(self._pool):
+            pool = np.empty((max(2 * len(self._pool), self._used + n),)
+                + self.chunk_shape, self.dtype)
+            pool[:self._used] = self._pool[:self._used]
+            self._pool = pool
+        self._pool[self._used:self._used+n] = self.fill_value
+        self._table[chunks] = np.arange(self._used, self._used + n)
+        self._used += n
+
+    def _expand(self, key) -> tuple:
+        """key as a tuple with one entry per axis"""
+        key = key if isinstance(key, tuple) else (key,)
+        if any(k is Ellipsis for k in key):
+            i = next(i for i, k in enumerate(key) if k is Ellipsis)
+            key = key[:i] + (slice(None),) * (self.ndim - len(key) + 1) \
+                + key[i+1:]
+        if len(key) < self.ndim:
+            key = key + (slice(None),) * (self.ndim - len(key))
+        if len(key) != self.ndim:
+            raise IndexError("too many indices for array of shape {}"
+                .format(self.shape))
+        return key
+
+    def _cell(self, key):
+        """chunk and offset within it of the single cell key
+        points at. This is the hot path, so it is kept plain
+
+        return: returns tuple (chunk, offset) or `None` if key
+            is not a tuple of one int per axis"""
+        if type(key) is not tuple or len(key) != len(self.shape):
+            return None
+        try:
+            cell = [operator.index(k) for k in key]
+        except TypeError:
+            return None
+        chunk, offset = [], []
+        for k, size, chunk_size in zip(cell, self.shape, self.chunk_shape):
+            if k < 0:
+                k += size
+            if not 0 <= k < size:
+                raise IndexError("index {} is out of bounds for "
+                    "shape {}".format(key, self.shape))
+            chunk.append(k // chunk_size)
+            offset.append(k % chunk_size)
+        return tuple(chunk), tuple(offset)
+
+    def _cells(self, key) -> tuple:
+        """vectorized `_cell` of fancy indices
+
+        return: returns tuple (shape, chunks, offsets) where
+            shape is the broadcast shape of the indices"""
+        idx = np.broadcast_arrays(*[np.asarray(k, np.int64) for k in key])
+        shape = idx[0].shape
+        idx = np.stack([i.ravel() for i in idx])
+        sizes = np.array(self.shape, np.int64)[:, None]
+        idx = np.where(idx < 0, idx + sizes, idx)
+        if np.any((idx < 0) | (idx >= sizes)):
+            raise IndexError("index out of bounds for shape {}"
+                .format(self.shape))
+        chunks = idx // self._chunk[:, None]
+        return shape, tuple(chunks), tuple(idx - chunks * self._chunk[:, None])
+
+    def _box(self, key) -> tuple:
+        """bounding box of a key of ints and slices
+
+        return: returns tuple (lo, hi, local) where local
+            indexes the box like key indexes the array"""
+        lo, hi, local = [], [], []
+        for k, size in zip(key, self.shape):
+            if isinstance(k, slice):
+                start, stop, step = k.indices(size)
+                if step < 0:
+                    # read the whole axis, let numpy reverse it
+                    lo.append(0)
+                    hi.append(size)
+                    local.append(k)
+                else:
+                    lo.append(start)
+                    hi.append(max(start, stop))
+                    local.append(slice(None, None, step))
+            elif isinstance(k, (int, np.integer)):
+                k = int(k) + size if k < 0 else int(k)
+                if not 0 <= k < size:
+                    raise IndexError("index {} is out of bounds for "
+                        "axis of size {}".format(k, size))
+                lo.append(k)
+                hi.append(k + 1)
+                local.append(0)
+            else:
+                raise IndexError("slices can not be mixed with index "
+                    "arrays in a Chunked_Array")
+        return np.array(lo, np.int64), np.array(hi, np.int64), tuple(local)
+
+    def _chunks_in(self, lo, hi):
+        """yield (chunk, slot, box slices, chunk slices) of every
+        chunk overlapping [lo, hi)"""
+        first = lo // self._chunk
+        last = np.maximum(-(-hi // self._chunk), first)
+        table = self._table[tuple(slice(a, b) for a, b in zip(first, last))]
+        for index in np.ndindex(table.shape):
+            chunk = first + index
+            start = chunk * self._chunk
+            a = np.maximum(start, lo)
+            b = np.minimum(start + self._chunk, hi)
+            yield tuple(chunk), table[index], \
+                tuple(slice(x, y) for x, y in zip(a - lo, b - lo)), \
+                tuple(slice(x, y) for x, y in zip(a - start, b - start))
+
+    def _read_box(self, lo, hi) -> np.ndarray:
+        box = np.full(tuple(hi - lo), self.fill_value, self.dtype)
+        for _, slot, in_box, in_chunk in self._chunks_in(lo, hi):
+            if slot >= 0:
+                box[in_box] = self._pool[slot][in_chunk]
+        return box
+
+    def _write_box(self, key, value):
+        lo, hi, local = self._box(key)
+        whole = not lo.any() and np.array_equal(hi, self.shape)
+        if whole and isinstance(value, Chunked_Array) \
+            and value.shape == self.shape \
+            and value.chunk_shape == self.chunk_shape:
+            self.fill_value = self.dtype.type(value.fill_value)
+            self._table = value._table.copy()
+            self._pool = value._pool[:value._used].astype(self.dtype)
+            self._used = value._used
+            return
+        if whole and np.ndim(value) == 0:
+            self.fill(value)
+            return
+        shape = tuple(hi - lo)
+        if all(k == 0 or k == slice(None, None, 1) for k in local):
+            # plain box, read the values straight from value
+            box = np.broadcast_to(np.asarray(value, self.dtype), tuple(
+                size for size, k in zip(shape, local) if k != 0)
+                ).reshape(shape)
+        else:
+            box = self._read_box(lo, hi)
+            box[local] = np.asarray(value)
+        for chunk, _, in_box, in_chunk in self._chunks_in(lo, hi):
+            block = box[in_box]
+            # allocating may have compacted the pool, look slots up again
+            slot = self._table[chunk]
+            if slot < 0:
+                if np.all(block == self.fill_value):
+                    continue
+                self._allocate(tuple(np.array([c]) for c in chunk))
+                slot = self._table[chunk]
+            self._pool[slot][in_chunk] = block
+
+def as_chunked(array, fill, chunk_size=CHUNK_SIZE):
+    """returns array as a `Chunked_Array` (as is if it already is one)"""
+    if isinstance(array, Chunked_Array):
+        return array
+    return Chunked_Array.from_dense(array, fill=fill, chunk_size=chunk_size)
+
+def copyto(dst, src):
+    """`np.copyto` that also accepts `Chunked_Array`s"""
+    if isinstance(dst, Chunked_Array):
+        dst[...] = src
+    else:
+        np.copyto(dst, np.asarray(src))
@@ -1,3 +1,4 @@
+import functools
 import numpy as np
 from enum import Enum
 
@@ -40,9 +41,77 @@ class OPERATIONS(Enum):
             if (2**i) & ops_int
         ]
 
-    #@staticmethod
-    #def allows(ops_int, op):
-    #    return bool((2**i) & ops_int)
+    @staticmethod
+    def allows(ops_int, op) -> bool:
+        """check a single OPERATION with one bitwise and.
+        Equivalent to `op in OPERATIONS.decode(ops_int)`
+
+        args:
+            ops_int: int8 encoding
+            op: OPERATIONS enum to check for
+
+        return: returns True if ops_int supports op
+        """
+        return bool(int(ops_int) & (1 << op.value))
+
+@functools.lru_cache(maxsize=None)
+def _predicate_table(require: int, exclude: int) -> np.ndarray:
+    codes = np.arange(256)
+    table = ((codes & require) == require) & ((codes & exclude) == 0)
+    table.flags.writeable = False
+    return table
+
+def predicate_table(require=(), exclude=()) -> np.ndarray:
+    """compile a predicate over OPERATIONS bitfields into a
+    256-entry lookup table
+
+    args:
+        require: OPERATIONS that must all be supported
+        exclude: OPERATIONS that must all be unsupported
+
+    return: returns read-only bool np.ndarray (256,) indexed
+        by the bitfield (as an unsigned byte)
+    """
+    return _predicate_table(
+        OPERATIONS.encode(list(require)),
+        OPERATIONS.encode(list(exclude)))
+
+def ops_mask(ops, require=(), exclude=()) -> np.ndarray:
+    """evaluate a predicate over an entire array of OPERATIONS
+    bitfields at once, eg "GOTHROUGH mask of this region" or
+    "PUSH_OVER and not GOTHROUGH"
+
+    args:
+        ops: np.ndarray of OPERATIONS bitfields (any shape)
+        require: OPERATIONS that must all be supported
+        exclude: OPERATIONS that must all be unsupported
+
+    return: returns bool np.ndarray shaped like ops
+    """
+    table = predicate_table(tuple(require), tuple(exclude))
+    return table[np.asarray(ops).astype(np.uint8)]
+
+def to_cell(loc) -> tuple:
+    """round a (possibly decimal valued) location to the
+    grid cell it occupies. Halves always round up so that
+    every location maps to exactly one cell
+
+    args:
+        loc: location sequence or np.ndarray
+
+    return: returns tuple of ints
+    """
+    return tuple(int(np.floor(loc_i + 0.5)) for loc_i in loc)
+
+def to_cells(locs) -> np.ndarray:
+    """vectorized `to_cell` over an array of locations
+
+    args:
+        locs: np.ndarray (N, D) of locations
+
+    return: returns int np.ndarray (N, D) of cells
+    """
+    return np.floor(np.asarray(locs) + 0.5).astype(np.int64)
 
 class Moving_Object:
     def __init__(self,
@@ -58,7 +127,7 @@ class Moving_Object:
         if isinstance(ops, list):
             ops = OPERATIONS.encode(ops)
 
-        self.loc = loc
+        self.loc = np.array(loc, dtype=float)
         self.ops = ops
     
     def try_move(self, delta_loc, env):
@@ -72,57 +141,7 @@ class Moving_Object:
                 will get converted to int's
                 (possibly nondetirministically)
         """
-        unit_delta=delta_loc/np.linalg.norm(delta_loc, ord=1)
-        target_displ = np.linalg.norm( \
-            delta_loc + np.mod(self.loc, 1.0), ord=1)
-        # remove decimal location to begin, add back later
-        self.loc = np.mod(self.loc, 1.0)
-        # step until at target or block is not traversable
-        for i in range(int(target_displ)):
-            block_loc = self.loc + i*unit_delta
-            block = env.combined_object_ops[block_loc]
-            block_ops = OPERATIONS.decode(block)
-            if OPERATIONS.GOTHROUGH in block_ops:
-                # yes, moving is allowed
-                pass
-            elif OPERATIONS.PUSH_OVER in block_ops:
-                # see if block can be pushed over by looking
-                # at the space immediantly in travel direction
-                # of that block
-                next_space = env.combined_object_ops \
-                    [block_loc+unit_delta]
-                if OPERATIONS.GOTHROUGH in OPERATIONS.decode(next_space):
-                    # if that block is actually a 
-                    # `moving_object` have it move itself
-                    moved_itself = False
-                    for mov_obj in env.moving_objects:
-                        if mov_obj.loc == block_loc:
-                            moved_itself = True
-                            mov_obj.try_move(unit_delta,env)
-                    # otherwise manually move block over
-                    # replace with GO_THROUGHable block
-                    if not moved_itself:
-                        env.static_objects[block_loc] = \
-                            OPERATIONS.encode([OPERATIONS.GOTHROUGH])
-                        env.static_objects[next_space] = block
-                else:
-                    # the space after the object being pushed
-                    # over is occupied, so that object cannot
-                    # move to allow the actor to move
-                    # motion cannot continue
-                    break
-            else:
-                # this space is not GO_THROUGHable 
-                # nor can is be PUSH_OVERed
-                # the motion cannot continue
-                break
-            # increment location by one unit 
-            # in the direction of delta_loc
-            self.loc += unit_delta
-        # there may be a decimal remainder not attempted
-        # which is just stored in self.loc and added to the
-        # next try_move call
-        self.loc += target_displ % 1.0
+        env.resolve_moves([self], np.asarray(delta_loc, dtype=float)[None])
         return # for clarity
 
     @property
@@ -130,25 +149,26 @@ class Moving_Object:
         """get nearest whole number rounded location
         This allows grid-world interactions while not losing
         the ability to perform decimal valued motions"""
-        return tuple([round(loc_i) for loc_i in list(self.loc)])
+        return to_cell(self.loc)
 
 class Signaling_Moving_Object(Moving_Object):
     def __init__(self, signal_depth: int, **kwargs):
         """Create signalling object.
 
         args
-            signal_depth: int. How many float
-                values to dedicate for the signal
+            signal_depth: int. Size of the signal
+                vocabulary. Signals are ints in
+                [0, signal_depth)
         """
         super(Signaling_Moving_Object, self).__init__(**kwargs)
-        self._signal = np.zeros((signal_depth,))
+        self.signal_depth = signal_depth
+        self._signal = 0
     
     @property
     def signal(self):
         """get current signal of `self`
         
-        return: returns np.ndarry (np.float)
-            of current signal
+        return: returns int of current signal
         """
         return self._signal
 
@@ -156,6 +176,43 @@ class Signaling_Moving_Object(Moving_Object):
         """set current signal of `self`
         
         args:
-            signal: np.ndarry (np.float) to signal
+            signal: int in [0, self.signal_depth) to signal
         """
-        self._signal = signal
\ No newline at end of file
+        self._signal = signal
+
+# kinds of records describing storage items and moving objects
+ITEM_STATIC = 0 # a static object's OPERATIONS bitfield
+ITEM_MOVING = 1 # `Moving_Object`
+ITEM_SIGNALING = 2 # `Signaling_Moving_Object`
+ITEM_LEN = 4 # kind, ops, signal_depth, signal
+OBJECT_LEN = 3 + ITEM_LEN # x, y, z, then the item record
+
+def encode_item(item) -> np.ndarray:
+    """record (kind, ops, signal_depth, signal) of a storage
+    item (`Moving_Object` or static OPERATIONS bitfield)"""
+    return np.array(_item_record(item))
+
+def encode_items(items) -> np.ndarray:
+    """returns int np.ndarray (K, ITEM_LEN) of the `encode_item`
+    records of many items at once"""
+    return np.array([_item_record(item) for item in items],
+        np.int64).reshape((-1, ITEM_LEN))
+
+def _item_record(item) -> tuple:
+    if isinstance(item, Signaling_Moving_Object):
+        return (ITEM_SIGNALING, item.ops, item.signal_depth, item.signal)
+    if isinstance(item, Moving_Object):
+        return (ITEM_MOVING, item.ops, 0, 0)
+    return (ITEM_STATIC, item, 0, 0)
+
+def decode_item(record, loc=(0, 0, 0)):
+    """inverse of `encode_item`. Moving objects are created at loc"""
+    kind, ops, signal_depth, signal = (int(value) for value in record)
+    if kind == ITEM_SIGNALING:
+        item = Signaling_Moving_Object(signal_depth=signal_depth,
+            loc=loc, ops=ops)
+        item.set_signal(signal)
+        return item
+    if kind == ITEM_MOVING:
+        return Moving_Object(loc=loc, ops=ops)
+    return np.int8(ops)
@@ -1,13 +1,215 @@
 import numpy as np
-import tensorflow as tf
 import gym
-from PIL import Image
 
-from .actor import Actor, VOCAB_SIZE
-from .elements import OPERATIONS, Moving_Object, Signaling_Moving_Object
+from .actor import Actor, apply_actions, _to_numpy, VOCAB_SIZE, \
+    RESTING_ENERGY_RATE, ACT_CONTINUOUS, ACT_SIGNAL, \
+    ACT_CONTINUOUS_LEN, OBS_OPERATIONS, OBS_SIGNALS, OBS_MY_SIGNAL, \
+    OBS_FREE_STORAGE_PERCENT, OBS_HEALTH, OBS_REWARD, OBS_PHEROMONES, \
+    UNPLACED
+from .elements import OPERATIONS, Moving_Object, Signaling_Moving_Object, \
+    to_cell, to_cells, ops_mask
+from .chunked import Chunked_Array, as_chunked, copyto
+from . import checkpoint, gravity, movement, render, vision
+from .profiling import NO_PHASE
+from .population import Population, energy_to_health, \
+    HEALTH_ENERGY_SCALE
+from .registry import Entity_Registry
+from .free_cells import Free_Cells
+
+def batch_obs(columns, ops, signals, out=None) -> dict:
+    """stack egocentric observations of many actors
+
+    args:
+        columns: population columns of the actors
+            (see `SMAE._actor_columns`)
+        ops: OBS_OPERATIONS views (N,)+vision_size
+        signals: OBS_SIGNALS views (N,)+vision_size
+        out: dict of arrays to write the per actor fields into
+            (eg `Obs_Buffers.rows`). Its OBS_OPERATIONS and
+            OBS_SIGNALS are taken as they are. Optional
+
+    return: returns dict mapping each OBS_ key to an
+        np.ndarray stacked over actors (out if given)
+    """
+    if out is None:
+        return {
+            OBS_OPERATIONS: ops,
+            OBS_SIGNALS: signals,
+            OBS_MY_SIGNAL: columns["signal"],
+            OBS_FREE_STORAGE_PERCENT:
+                (columns["storage_capacity"] - columns["storage_count"])
+                / columns["storage_capacity"],
+            OBS_HEALTH: energy_to_health(columns["energy"]),
+            OBS_REWARD: columns["reward"],
+        }
+    out[OBS_MY_SIGNAL][...] = columns["signal"]
+    free = out[OBS_FREE_STORAGE_PERCENT]
+    np.subtract(columns["storage_capacity"], columns["storage_count"],
+        out=free)
+    free /= columns["storage_capacity"]
+    health = out[OBS_HEALTH]
+    np.divide(columns["energy"], -HEALTH_ENERGY_SCALE, out=health)
+    np.exp(health, out=health)
+    np.subtract(1, health, out=health)
+    out[OBS_REWARD][...] = columns["reward"]
+    return out
+
+class Obs_Buffers:
+
+    def __init__(self, capacity, vision_size, packed=False,
+            pheromone_channels=0):
+        """preallocated observation arrays of up to capacity
+        actors. `SMAE.egocentric_obs_batch(out=...)` writes into
+        them (and into their gather indices) instead of
+        allocating new arrays every step
+
+        args:
+            capacity: number of actors
+            vision_size: (x, y, z) shape of the field of view
+            packed: if True OBS_OPERATIONS holds `vision.pack_ops`
+                packed views, uint8 (capacity,
+                vision.packed_size(vision_size)), which
+                `vision.unpack_ops` turns back into int8 views
+            pheromone_channels: number of OBS_PHEROMONES channels
+                (0 default: no OBS_PHEROMONES)
+        """
+        self.capacity = int(capacity)
+        self.vision_size = tuple(vision_size)
+        self.packed = bool(packed)
+        self.pheromone_channels = int(pheromone_channels)
+        views = (self.capacity,) + self.vision_size
+        self.arrays = {
+            OBS_OPERATIONS: np.zeros((self.capacity,
+                vision.packed_size(self.vision_size)), np.uint8)
+                if self.packed else np.zeros(views, np.int8),
+            OBS_SIGNALS: np.zeros(views, np.int16),
+            OBS_MY_SIGNAL: np.zeros((self.capacity,), np.int64),
+            OBS_FREE_STORAGE_PERCENT: np.zeros((self.capacity,)),
+            OBS_HEALTH: np.zeros((self.capacity,)),
+            OBS_REWARD: np.zeros((self.capacity,)),
+        }
+        if self.pheromone_channels:
+            self.arrays[OBS_PHEROMONES] = np.zeros((self.capacity,
+                self.pheromone_channels) + self.vision_size, np.float32)
+        # unpacked views waiting to be packed
+        self._ops = np.zeros(views, np.int8) if self.packed else None
+        self.scratch = vision.Gather_Scratch(self.capacity, self.vision_size)
+        self._rows = (None, None)
+
+    def fits(self, n, vision_size, packed, pheromone_channels) -> bool:
+        """returns whether these buffers can hold the observations
+        of n actors with this layout"""
+        return n <= self.capacity \
+            and tuple(vision_size) == self.vision_size \
+            and bool(packed) == self.packed \
+            and int(pheromone_channels) == self.pheromone_channels
+
+    def rows(self, n) -> dict:
+        """returns dict mapping each OBS_ key to the first n rows
+        of its array. The same dict is handed out again while n
+        stays the same"""
+        if self._rows[0] != n:
+            self._rows = (n, {key: array[:n]
+                for key, array in self.arrays.items()})
+        return self._rows[1]
+
+    def fill(self, columns, cells, buckets, ops_grid, signal_grid,
+            ops_fill=0, signal_fill=0, pheromones=None,
+            occlusion=False) -> dict:
+        """gather the observations of many actors into the buffers
+
+        args:
+            columns: population columns of the actors
+                (see `SMAE._actor_columns`)
+            cells: int np.ndarray (N, ops_grid.ndim) of actor
+                cells (see `vision.gather`)
+            buckets: int np.ndarray (N,) of orientation buckets
+            ops_grid: grid of OBS_OPERATIONS
+            signal_grid: grid of OBS_SIGNALS
+            ops_fill, signal_fill: values of cells outside of
+                the grids
+            pheromones: `pheromones.Pheromone_Field` (optional)
+            occlusion: if True fill cells hidden behind opaque
+                ones like cells outside of the grids (see
+                `vision.hidden_cells`)
+
+        return: returns `self.rows(N)`
+        """
+        n = len(cells)
+        obs = self.rows(n)
+        ops = self._ops[:n] if self.packed else obs[OBS_OPERATIONS]
+        vision.gather(ops_grid, cells, buckets, self.vision_size,
+            fill=ops_fill, out=ops, scratch=self.scratch)
+        vision.gather(signal_grid, cells, buckets, self.vision_size,
+            fill=signal_fill, out=obs[OBS_SIGNALS], scratch=self.scratch)
+        if pheromones is not None:
+            for channel in range(self.pheromone_channels):
+                vision.gather(pheromones.field[channel], cells, buckets,
+                    self.vision_size, out=obs[OBS_PHEROMONES][:, channel],
+                    scratch=self.scratch)
+        if occlusion:
+            hidden = vision.hidden_cells(ops, buckets)
+            np.copyto(ops, ops_fill, where=hidden, casting="unsafe")
+            np.copyto(obs[OBS_SIGNALS], signal_fill, where=hidden,
+                casting="unsafe")
+            if pheromones is not None:
+                np.copyto(obs[OBS_PHEROMONES], 0, where=hidden[:, None])
+        if self.packed:
+            vision.pack_ops(ops, out=obs[OBS_OPERATIONS])
+        return batch_obs(columns, None, None, out=obs)
+
+def obs_buffers(out, owned, n, vision_size, packed=False,
+        pheromone_channels=0) -> Obs_Buffers:
+    """pick the `Obs_Buffers` n observations are written into
+
+    args:
+        out: `Obs_Buffers` (checked to fit), True to reuse owned
+            or `None` for new buffers holding exactly n
+        owned: `Obs_Buffers` kept by the caller between calls
+            (or `None`). Replaced by larger ones (twice the
+            capacity) when it no longer fits
+        n, vision_size, packed, pheromone_channels: layout
+            (see `Obs_Buffers`)
+
+    return: returns the buffers to fill
+    """
+    if isinstance(out, Obs_Buffers):
+        if not out.fits(n, vision_size, out.packed, pheromone_channels):
+            raise ValueError("observation buffers do not fit {} actors "
+                "with vision_size {}".format(n, vision_size))
+        return out
+    if out is None or owned is None:
+        return Obs_Buffers(n, vision_size, packed, pheromone_channels)
+    if owned.fits(n, vision_size, packed, pheromone_channels):
+        return owned
+    return Obs_Buffers(max(n, 2 * owned.capacity), vision_size, packed,
+        pheromone_channels)
+
+def _shared_vision_size(actors) -> tuple:
+    vision_size = tuple(actors[0].vision_size) if actors else (0, 0, 0)
+    if any(tuple(actor.vision_size) != vision_size for actor in actors):
+        raise ValueError("actors must share one vision_size")
+    return vision_size
+
+class Change_Log:
+
+    def __init__(self):
+        """cells `SMAE.set_static_object` changed since whoever
+        holds this log last looked (see `SMAE.watch_static`)"""
+        # `None` when unknown: anything may have changed
+        self.cells = None
+
+    def take(self):
+        """returns list of changed cells (or `None` if unknown)
+        and starts over with nothing changed"""
+        cells, self.cells = self.cells, []
+        return cells
 
 class MA_Gym_Env(gym.Env):
 
+    # `profiling.Profiler` timing the step loop (optional)
+    profiler = None
+
     def __init__(self, actor_ids=[]):
         """
         args:
@@ -23,6 +225,11 @@ class MA_Gym_Env(gym.Env):
             the environment with `self.add_id(id)`
         """
         self.actors = { }
+        # <actor, actor_id> to find actors by value in O(1)
+        self._actor_ids = { }
+        # births and deaths waiting for `apply_queued`
+        self._births = []
+        self._deaths = { }
         for actor_id in actor_ids:
             self.add_actor(actor_id)
         self.origonal_actors = self.actors.copy()
@@ -41,7 +248,7 @@ class MA_Gym_Env(gym.Env):
         attempted to execute their actions, `a_n` may
         be disregaurded but is still passed along in
         case it serves any purpose later"""
-        pass
+        self.apply_queued()
 
     def step(self, a_n):
         """simulate one step
@@ -52,13 +259,17 @@ class MA_Gym_Env(gym.Env):
         # since agents may die and be added to self.agents
         # mid step, a frozen copy is used for this step
         self.origonal_actors = self.actors.copy()
-        for actor_id, a in a_n.items():
-            self.origonal_actors[actor_id].apply_action(a, self)
+        with self._phase("apply_actions"):
+            self._apply_actions(a_n)
         self._global_update(a_n)
-        return {
-            actor_id: actor.egocentric_obs(self)
-            for actor_id, actor in self.origonal_actors.items()
-        }, {
+        with self._phase("observations"):
+            obs_n = {
+                actor_id: actor.egocentric_obs(self)
+                for actor_id, actor in self.origonal_actors.items()
+            }
+        if self.profiler is not None:
+            self.profiler.step_done()
+        return obs_n, {
             actor_id: actor.egocentric_r(self)
             for actor_id, actor in self.origonal_actors.items()
         }, {
@@ -69,6 +280,18 @@ class MA_Gym_Env(gym.Env):
             for actor_id, actor in self.origonal_actors.items()
         }
 
+    def _phase(self, name):
+        """returns context manager timing phase name with
+        `self.profiler` (does nothing without one)"""
+        if self.profiler is None:
+            return NO_PHASE
+        return self.profiler.phase(name)
+
+    def _apply_actions(self, a_n):
+        """let every actor in `a_n` attempt its action"""
+        for actor_id, a in a_n.items():
+            self.origonal_actors[actor_id].apply_action(a, self)
+
     def close(self):
         """free any resources not automatically destroyed"""
         pass
@@ -91,7 +314,7 @@ class MA_Gym_Env(gym.Env):
             for actor_id, actor in self.actors.items()
         })
 
-    def add_actor(self, actor):
+    def add_actor(self, actor, actor_id=None):
         """new actors created post-initialization
         or midgame can be added here
         
@@ -101,14 +324,17 @@ class MA_Gym_Env(gym.Env):
                 random Actor is initialized and
                 `actor` arg supplied becomes its
                 dictionary key
+            actor_id: key for an `actor.Actor` given as
+                `actor`. Defaults to the actor itself
                 
         return: returns `actor` if it was an `actor.Actor`
             object, otherwise returns the newly initialized
             `actor.Actor` mapped to by `actor`"""
-        actor_id = actor
+        if actor_id is None:
+            actor_id = actor
         if not isinstance(actor, Actor):
             actor = Actor(env=self)
-        self.actors[actor_id] = actor
+        self._register_actor(actor_id, actor)
         return actor
 
     def remove_actor(self, actor_id=None, actor=None):
@@ -126,11 +352,86 @@ class MA_Gym_Env(gym.Env):
         assert not (actor_id is None and actor is None)
 
         if actor_id is None:
-            actor_ids = list(self.actors.keys())
-            actors = list(self.actors.values())
-            actor_id = actor_ids[actors.index(actor)]
-            
-        return actor_id, self.actors.pop(actor_id)
+            actor_id = self._actor_ids[actor]
+        return actor_id, self._unregister_actor(actor_id)
+
+    def add_actors(self, actors, actor_ids=None) -> list:
+        """`add_actor` many actors at once
+
+        args:
+            actors: list of actors (or keys, see `add_actor`)
+            actor_ids: list of keys for the actors. Optional
+
+        return: returns list of the added `actor.Actor`s"""
+        if actor_ids is None:
+            actor_ids = [None] * len(actors)
+        return [self.add_actor(actor, actor_id=actor_id)
+            for actor, actor_id in zip(actors, actor_ids)]
+
+    def remove_actors(self, actor_ids) -> list:
+        """`remove_actor` many actors at once
+
+        return: returns list of tuples (actor_id, actor) removed"""
+        return [self.remove_actor(actor_id=actor_id)
+            for actor_id in actor_ids]
+
+    def queue_birth(self, actor, actor_id=None):
+        """add an actor once the current step is over rather
+        than right away. Every birth queued during a step
+        is applied in one `add_actors` batch at its end (see
+        `apply_queued`)
+
+        args: see `add_actor`
+
+        return: returns the `actor.Actor` that will be added"""
+        if actor_id is None:
+            actor_id = actor
+        if not isinstance(actor, Actor):
+            actor = Actor(env=self)
+        self._births.append((actor_id, actor))
+        return actor
+
+    def queue_death(self, actor_id=None, actor=None):
+        """remove an actor once the current step is over
+        rather than right away (see `queue_birth`). Queuing
+        an actor more than once removes it once
+
+        args: see `remove_actor`
+
+        return: returns the actor_id queued"""
+        assert actor_id is None or actor is None
+        assert not (actor_id is None and actor is None)
+        if actor_id is None:
+            actor_id = self._actor_ids[actor]
+        self._deaths[actor_id] = None
+        return actor_id
+
+    def apply_queued(self):
+        """apply every queued death, then every queued birth,
+        each as one batch. Called at the end of every step"""
+        deaths = [actor_id for actor_id in self._deaths
+            if actor_id in self.actors]
+        births = self._births
+        self._deaths, self._births = { }, []
+        if deaths:
+            self.remove_actors(deaths)
+        if births:
+            self.add_actors([actor for _, actor in births],
+                [actor_id for actor_id, _ in births])
+
+    def _register_actor(self, actor_id, actor):
+        """map actor_id to actor (and back)"""
+        replaced = self.actors.get(actor_id)
+        if replaced is not None:
+            del self._actor_ids[replaced]
+        self.actors[actor_id] = actor
+        self._actor_ids[actor] = actor_id
+
+    def _unregister_actor(self, actor_id):
+        """returns the actor actor_id no longer maps to"""
+        actor = self.actors.pop(actor_id)
+        del self._actor_ids[actor]
+        return actor
 
     def random_avaliable_loc(self) -> tuple:
         """Find random location in environment to
@@ -148,6 +449,19 @@ class SMAE(MA_Gym_Env):
         world_size=(16,16,4),
         static_objects=None,
         gravity=(0,0,-1),
+        out_of_bounds_ops=OPERATIONS.encode([]),
+        out_of_bounds_signal=0,
+        validate_combined_ops=False,
+        population=None,
+        world=0,
+        combined_object_ops=None,
+        signal_field=None,
+        rng=None,
+        template=True,
+        chunk_size=None,
+        profiler=None,
+        pheromones=None,
+        occlusion=False,
         **kwargs):
         """
         args:
@@ -159,28 +473,147 @@ class SMAE(MA_Gym_Env):
             gravity: uniform acceleration vector to apply after
                 each step (If z-height = 1, verticle gravity has
                 no effect). Can also represent wind force
+            out_of_bounds_ops: OPERATIONS bitfield actors see
+                for cells outside of the world. Defaults to
+                rigid objects (no operations supported)
+            out_of_bounds_signal: signal actors see for cells
+                outside of the world (default 0)
+            validate_combined_ops: if True, rebuild
+                `self.combined_object_ops` from scratch after
+                every step and check that it agrees with the
+                incrementally patched one. Slow; meant for debugging
+            population: `Population` to keep actor state in. If
+                `None` (default) the env gets its own. Several
+                envs may share one (see `batched.Batched_SMAE`)
+            world: index of this env in its `population` (0 default)
+            combined_object_ops: np.ndarray (np.int8) of world_size
+                to keep `self.combined_object_ops` in. Must already
+                agree with static_objects (eg a copy). Optional
+            signal_field: zeroed np.ndarray (np.int16) of world_size
+                to keep `self.signal_field` in. Optional
+            rng: `np.random.RandomState` used for random placement.
+                If `None` (default), numpy's global one (as seeded
+                by `np.random.seed`)
+            template: if True (default), the state at the end of
+                `__init__` is what `reset` returns to (see
+                `capture_template`). Pass False to skip copying
+                the world arrays
+            chunk_size: if given, keep `self.static_objects`,
+                `self.combined_object_ops` and `self.signal_field`
+                in `chunked.Chunked_Array`s of chunk_size cubed
+                chunks, allocated on first write and freed again
+                once they are back to empty air (see
+                `chunked.Chunked_Array`). Memory then grows with
+                the volume that currently differs from empty air
+                (or holds signals) rather than with world_size or
+                the volume ever visited. Dense
+                arrays given are converted. If `None` (default)
+                they are dense np.ndarrays
+            profiler: `profiling.Profiler` to time the phases of
+                every step with and count what they do. If `None`
+                (default) nothing is measured
+            pheromones: `pheromones.Pheromone_Field` of world_size
+                that signaling objects leave trails in. Actors
+                then also observe OBS_PHEROMONES. If `None`
+                (default) there are no trails
+            occlusion: if True actors only see cells in their
+                line of sight. Cells behind ones that do not
+                allow GOTHROUGH (see `vision.hidden_cells`) look
+                like cells outside of the world. If False
+                (default) they see their whole field of view
         """
 
-        super(SMAE, self).__init__(**kwargs)
-
         self.signal_depth = signal_depth
-        self.moving_objects = []
-        self.signaling_objects = []
+        # every moving object in the env and the signaling
+        # ones among them (see `registry.Entity_Registry`)
+        self.moving_objects = Entity_Registry()
+        self.signaling_objects = Entity_Registry()
+        # <(x,y,z), moving_object> spatial index. Every
+        # location based lookup goes through here
+        self._occupancy = {}
+        # cells whose contents changed since the last
+        # gravity pass (see `gravity.apply_gravity`)
+        self._dirty_cells = set()
+        # moving objects gravity may still move. The rest
+        # sleep until something near them changes
+        self._awake = set()
+        self._gravity_applied = None
+        # cells to spawn in (see `self.free_cells`)
+        self._free_cells = None
+        # `Obs_Buffers` of `egocentric_obs_batch(out=True)`
+        self._owned_obs = None
+        # `Change_Log`s `set_static_object` reports to
+        self._static_logs = []
+        # `recording.Recorder` fed after every step (optional)
+        self.recorder = None
+        self.profiler = profiler
+        if pheromones is not None \
+            and tuple(pheromones.world_size) != tuple(world_size):
+            raise ValueError("pheromones must have the world's size")
+        self.pheromones = pheromones
+        self.validate_combined_ops = validate_combined_ops
+        # struct-of-arrays state of every actor in the env
+        self.population = Population() if population is None \
+            else population
+        self.world = world
         self.world_size = world_size
         self.gravity = gravity
-        self.signal_field = np.zeros(world_size, dtype=np.int16)
-        self.static_objects = np.ones(world_size, dtype=np.int8) \
-            * OPERATIONS.encode([OPERATIONS.GOTHROUGH]) \
-            if static_objects is None else static_objects
+        self.rng = rng
+        self.out_of_bounds_ops = out_of_bounds_ops
+        self.out_of_bounds_signal = out_of_bounds_signal
+        self.occlusion = occlusion
+        self.chunk_size = chunk_size
+        air = OPERATIONS.encode([OPERATIONS.GOTHROUGH])
+        if chunk_size is None:
+            self.signal_field = np.zeros(world_size, dtype=np.int16) \
+                if signal_field is None else signal_field
+            self.static_objects = np.ones(world_size, dtype=np.int8) * air \
+                if static_objects is None else static_objects
+            # True wherever a moving object stands
+            self._occupied = np.zeros(world_size, dtype=bool)
+        else:
+            self.signal_field = Chunked_Array(world_size, np.int16,
+                chunk_size=chunk_size) if signal_field is None \
+                else as_chunked(signal_field, 0, chunk_size)
+            self.static_objects = Chunked_Array(world_size, np.int8,
+                fill=air, chunk_size=chunk_size) if static_objects is None \
+                else as_chunked(static_objects, air, chunk_size)
+            self._occupied = Chunked_Array(world_size, bool,
+                chunk_size=chunk_size)
+            if combined_object_ops is not None:
+                combined_object_ops = as_chunked(combined_object_ops,
+                    air, chunk_size)
+        # cells `_update_signal_field` wrote last time and
+        # cells patched since (see `_refresh_signal`)
+        self._signal_cells = np.zeros((0, len(world_size)), np.int64)
+        self._patched_signal_cells = []
+        # there are no moving objects yet
+        self.combined_object_ops = self.static_objects.copy() \
+            if combined_object_ops is None else combined_object_ops
+
+        # actors can only be placed once the world exists
+        super(SMAE, self).__init__(**kwargs)
         self._global_update()
+        self._template = None
+        if template:
+            self.capture_template()
+
+    def in_bounds(self, loc) -> bool:
+        """returns True if the cell at loc is inside the world"""
+        return all(0 <= loc_i < size_i
+            for loc_i, size_i in zip(to_cell(loc), self.world_size))
+
+    def ops_at(self, loc):
+        """returns the OPERATIONS bitfield currently
+        supported at loc taking moving objects into account"""
+        return self.combined_object_ops[to_cell(loc)]
 
     def moving_object_at(self, loc):
         """returns the moving object (if present)
         at loc. returns `None` if just static objects"""
-        for moving_object in self.moving_objects:
-            if moving_object.loc == loc:
-                return moving_object
-        return None
+        if self.profiler is not None:
+            self.profiler.count("moving_object_lookups")
+        return self._occupancy.get(to_cell(loc))
 
     def signaling_object_at(self, loc):
         """returns the signaling object (if present)
@@ -194,6 +627,193 @@ class SMAE(MA_Gym_Env):
         obj = self.moving_object_at(loc)
         return obj if isinstance(obj, Actor) else None
 
+    @property
+    def actor_rows(self) -> np.ndarray:
+        """returns int array of the `self.population` rows
+        of the actors in this env"""
+        population = self.population
+        return np.flatnonzero(population.alive
+            & (population.world == self.world))
+
+    @property
+    def batch_ids(self) -> np.ndarray:
+        """returns object array of actor ids. Row i of
+        `step_batch` inputs and outputs belongs to the actor
+        `self.actors[self.batch_ids[i]]`"""
+        ids = np.empty((len(self.actors),), dtype=object)
+        ids[:] = list(self.actors)
+        return ids
+
+    def step_batch(self, actions, signals, out=None, packed=False):
+        """array-in/array-out version of `step`
+
+        args:
+            actions: np.ndarray (N, ACT_CONTINUOUS_LEN) of
+                ACT_CONTINUOUS actions ordered like `self.batch_ids`
+            signals: np.ndarray (N,) of ACT_SIGNAL actions
+            out, packed: where and how to write obs
+                (see `self.egocentric_obs_batch`)
+
+        returns: tuple (obs, r, done, ids). obs is a dict
+            mapping each OBS_ key to an array stacked over
+            actors, r and done are (N,) arrays and ids is
+            the object array of the actor ids of every row.
+            Actors that die during the step are done
+            """
+        ids = self.batch_ids
+        actors = list(self.actors.values())
+        actions = np.asarray(actions)
+        signals = np.asarray(signals)
+        assert actions.shape == (len(actors), ACT_CONTINUOUS_LEN)
+        assert signals.shape == (len(actors),)
+
+        self.origonal_actors = self.actors.copy()
+        with self._phase("apply_actions"):
+            apply_actions(self, actors, actions, signals)
+        self._global_update((actions, signals))
+
+        with self._phase("observations"):
+            obs = self.egocentric_obs_batch(actors, out, packed)
+        if self.profiler is not None:
+            self.profiler.step_done()
+        done = np.fromiter(
+            (actor._population is not self.population
+                for actor in actors),
+            dtype=bool, count=len(actors))
+        return obs, obs[OBS_REWARD].copy(), done, ids
+
+    def _apply_actions(self, a_n):
+        """apply the actions of every actor in `a_n` at once
+        (see `actor.apply_actions`)"""
+        actors = [self.origonal_actors[actor_id] for actor_id in a_n]
+        actions = np.array([_to_numpy(a[ACT_CONTINUOUS])
+            for a in a_n.values()], dtype=float)
+        signals = np.array([_to_numpy(a[ACT_SIGNAL])
+            for a in a_n.values()], dtype=np.int64)
+        apply_actions(self, actors,
+            actions.reshape((len(actors), ACT_CONTINUOUS_LEN)), signals)
+
+    def egocentric_obs_batch(self, actors=None, out=None,
+            packed=False) -> dict:
+        """egocentric observations of many actors at once
+
+        args:
+            actors: list of `Actor`. If `None` (default)
+                all actors in `self.actors`
+            out: `Obs_Buffers` to write the observations into, or
+                True to use buffers owned by the env (grown as
+                needed). Nothing is allocated per call then, but
+                the arrays handed out are overwritten by the next
+                call. If `None` (default) new arrays
+            packed: pack OBS_OPERATIONS (see `Obs_Buffers`) when
+                out is `None` or True
+
+        return: returns dict mapping each OBS_ key to an
+            np.ndarray stacked over actors
+        """
+        actors = list(self.actors.values()) if actors is None else actors
+        columns = self._actor_columns(actors)
+        if out is None and not packed:
+            ops, signals, hidden = self._egocentric_views(actors, columns)
+            obs = batch_obs(columns, ops, signals)
+            if self.pheromones is not None:
+                obs[OBS_PHEROMONES] = self.pheromone_views(actors, columns,
+                    hidden)
+            return obs
+        vision_size = _shared_vision_size(actors)
+        buffers = obs_buffers(out, self._owned_obs, len(actors),
+            vision_size, packed,
+            0 if self.pheromones is None else self.pheromones.channels)
+        if out is True:
+            self._owned_obs = buffers
+        return buffers.fill(columns, to_cells(columns["loc"]),
+            vision.orientation_buckets(columns["orientation"]),
+            self.combined_object_ops, self.signal_field,
+            self.out_of_bounds_ops, self.out_of_bounds_signal,
+            self.pheromones, self.occlusion)
+
+    def egocentric_views(self, actors, columns=None):
+        """OBS_OPERATIONS and OBS_SIGNALS fields of view of many
+        actors gathered at once. Views turn with each actor's
+        (bucketed) orientation and always have the declared
+        `vision_size` shape; cells outside of the world are
+        filled with `self.out_of_bounds_ops` and
+        `self.out_of_bounds_signal`. So are cells hidden behind
+        opaque ones if `self.occlusion` is on
+
+        args:
+            actors: list of `Actor` sharing one vision_size
+            columns: population columns already gathered for
+                actors (see `self._actor_columns`). Optional
+
+        return: returns tuple (ops, signals) of np.ndarrays
+            shaped (N,)+vision_size
+        """
+        ops, signals, _ = self._egocentric_views(actors, columns)
+        return ops, signals
+
+    def _egocentric_views(self, actors, columns=None) -> tuple:
+        """`egocentric_views` plus the bool (N,)+vision_size mask
+        of the hidden cells (`None` without `self.occlusion`)"""
+        vision_size = _shared_vision_size(actors)
+        if columns is None:
+            columns = self._actor_columns(actors)
+        cells = to_cells(columns["loc"])
+        buckets = vision.orientation_buckets(columns["orientation"])
+        ops = vision.gather(self.combined_object_ops, cells, buckets,
+            vision_size, fill=self.out_of_bounds_ops)
+        signals = vision.gather(self.signal_field, cells, buckets,
+            vision_size, fill=self.out_of_bounds_signal)
+        hidden = None
+        if self.occlusion:
+            hidden = vision.hidden_cells(ops, buckets)
+            ops[hidden] = self.out_of_bounds_ops
+            signals[hidden] = self.out_of_bounds_signal
+        return ops, signals, hidden
+
+    def pheromone_views(self, actors, columns=None, hidden=None) -> np.ndarray:
+        """OBS_PHEROMONES fields of view of many actors (see
+        `self.egocentric_views`). Cells outside of the world
+        (or hidden) hold no pheromones
+
+        args:
+            hidden: mask of hidden cells from
+                `self._egocentric_views`. Computed if `None` (and
+                `self.occlusion` is on)
+
+        return: returns np.ndarray (N, channels)+vision_size"""
+        vision_size = _shared_vision_size(actors)
+        if columns is None:
+            columns = self._actor_columns(actors)
+        cells = to_cells(columns["loc"])
+        buckets = vision.orientation_buckets(columns["orientation"])
+        views = self.pheromones.views(cells, buckets, vision_size)
+        if self.occlusion:
+            if hidden is None:
+                hidden = vision.hidden_cells(vision.gather(
+                    self.combined_object_ops, cells, buckets, vision_size,
+                    fill=self.out_of_bounds_ops), buckets)
+            np.copyto(views, 0, where=hidden[:, None])
+        return views
+
+    def _actor_columns(self, actors) -> dict:
+        """gather the population columns of actors
+
+        return: returns dict mapping column names to
+            np.ndarrays with one row per actor"""
+        rows = np.fromiter((actor._row for actor in actors),
+            dtype=np.int64, count=len(actors))
+        columns = {name: column[rows]
+            for name, column in self.population.columns.items()}
+        # actors removed this step keep their final state in
+        # private stores, so their rows may already be reused
+        for i, actor in enumerate(actors):
+            if actor._population is not self.population:
+                for name in columns:
+                    columns[name][i] = \
+                        actor._population.columns[name][actor._row]
+        return columns
+
     def default_coloring(self, x, y, z):
         """default coloring scheme for smae env render
 
@@ -214,53 +834,35 @@ class SMAE(MA_Gym_Env):
 
         return: returns tuple (r,g,b,a) as np.int8 values 0-255 
         """
-        # for brevity in the if cases, static_obj is idenitified here
-        static_obj = self.static_objects[x,y,z]
-        static_obj_ops = OPERATIONS.decode(static_obj)
-
         moving_obj = self.moving_object_at((x,y,z))
         # big conditional statement per voxel
         if isinstance(moving_obj, Actor):
             # blue, intensity detirmined by signal
-            signal = moving_obj.signal() / VOCAB_SIZE
+            signal = moving_obj.signal / VOCAB_SIZE
             return [0, 0, int(255*signal), 255]
-        elif self.signaling_object_at((x,y,z)):
+        elif isinstance(moving_obj, Signaling_Moving_Object):
             # green, intensity detirmined by signal
-            signal = moving_obj.signal() / VOCAB_SIZE
+            signal = moving_obj.signal / moving_obj.signal_depth
             return [0, int(255*signal), 0, 255]
-        elif self.moving_object_at((x,y,z)):
+        elif moving_obj is not None:
             # brown
-            return [128, 32, 16, 255]
+            return list(render.MOVING_COLOR)
         # Now the object is presumed to be static
-        elif OPERATIONS.EAT in static_obj_ops:
-            # yellow
-            return [255, 255, 0, 255]
-        elif OPERATIONS.PICKUP in static_obj_ops \
-            and OPERATIONS.PUSH_OVER in static_obj_ops:
-            # red-orange
-            return [255, 64, 0, 255]
-        elif OPERATIONS.PUSH_OVER in static_obj_ops:
-            # orange
-            return [255, 128, 0, 255]
-        elif OPERATIONS.PICKUP in static_obj_ops:
-            # red
-            return [255, 0, 0, 255]
-        elif OPERATIONS.GOTHROUGH in static_obj_ops:
-            # transparent
-            return [0, 0, 0, 0]
-        else:
-            # black
-            return [0, 0, 0, 255]
+        return list(render.static_color(self.static_objects[x,y,z]))
 
     def render(self, mode="rgb", z_heights=0, coloring=None, blending=None):
         """renders entire environment as bitmap
         stacking z layers on top of white background
+
+        The default coloring is computed with array operations
+        over whole layers. Custom `coloring` callbacks are
+        called once per voxel and are much slower
         
         args:
             mode: "rgb" or "human". See env.metadata['render.modes']
             z_heights: int or list of ints of z heights to render
             coloring: color mapping function
-                (x,y,z)->(r,g,b,a) as np.int8 values 0-255
+                (x,y,z)->(r,g,b,a) as np.uint8 values 0-255
                 if `None`, self.default_coloring is used
             blending: blending mode (default simple_overlay:
                 full overlay if alpha > 0). (back, fore) -> img
@@ -273,45 +875,183 @@ class SMAE(MA_Gym_Env):
         """
         if not isinstance(z_heights, list):
             z_heights=[z_heights]
-        if coloring is None:
-            coloring = self.default_coloring
         if blending is None:
-            def simple_overlay(back, fore):
-                """override back with any nonzero fore alpha
-                return: returns 3D numpy array (H,W,D) with
-                depth still (r,g,b,a) but alpha is only zero
-                if both back and fore have zero alpha"""
-                # this broadcasts alpha onto all four channels
-                # (r',g',b',a') := a * (r,g,b,a)
-                return back[:,:,:] * (255 - fore[:,:,3]) \
-                     + fore[:,:,:] * fore[:,:,3]
-            blender = simple_overlay
-
-        # start with white background
-        layers = [np.zeros(self.world_size[0:1]+(4,), np.int8)]
+            blending = render.simple_overlay
 
         # overlay renders from bottom up
-        for z in z_heights:
-            # this loop can be parallelized
-            pixel_rgba = [coloring(x,y,z) for x, y
-                in np.ndindex(self.world_size[0:1])]
-            layers.append(
-                np.array(
-                    pixel_rgba,
-                    shape=self.world_size[0:1]+(4,),
-                    dtype=np.int8))
-        
-        # blend layers into np_img
-        np_img = layers[0]
-        for layer in layers[1:]:
-            np_img = blending(np_img, layer)
+        if coloring is None:
+            entities = render.entity_colors(self)
+            layers = [render.render_layer(self, z, entities)
+                for z in z_heights]
+        else:
+            layers = [render.render_layer_slow(self, z, coloring)
+                for z in z_heights]
+        np_img = render.composite(layers, blending)
 
-        return {
-            "rgb": np_img,
-            "human": Image.fromarray(np_img[:,:,0:2], 'RGB')
-        }[mode]
+        if mode == "human":
+            # Pillow is only needed for images
+            from PIL import Image
+            return Image.fromarray(np_img[:,:,0:3], 'RGB')
+        return np_img
+
+    def capture_template(self):
+        """remember the current state as the one `reset`
+        returns to. `__init__` already does this; call it again
+        after customizing a new env (eg adding moving objects)
+        to make `reset` start from there instead"""
+        actors = list(self.actors.values())
+        rows = np.array([actor._row for actor in actors], np.int64)
+        others = [moving_object for moving_object in self.moving_objects
+            if not isinstance(moving_object, Actor)]
+        self._template = {
+            "static_objects": self.static_objects.copy(),
+            "combined_object_ops": self.combined_object_ops.copy(),
+            "signal_field": self.signal_field.copy(),
+            "occupied": self._occupied.copy(),
+            "signal_cells": self._signal_cells.copy(),
+            "pheromones": None if self.pheromones is None
+                else self.pheromones.field.copy(),
+            "occupancy": self._occupancy.copy(),
+            "moving_objects": self.moving_objects.copy(),
+            "signaling_objects": self.signaling_objects.copy(),
+            "awake": set(self._awake),
+            "free_cells": None if self._free_cells is None
+                else self._free_cells.copy(),
+            "gravity_applied": self._gravity_applied,
+            "actors": self.actors.copy(),
+            "columns": {name: column[rows].copy()
+                for name, column in self.population.columns.items()
+                if name != "world"},
+            "storage": [list(actor.storage) for actor in actors],
+            "objects": others,
+            "object_locs": [moving_object.loc.copy()
+                for moving_object in others],
+            "object_signals": [moving_object.signal
+                if isinstance(moving_object, Signaling_Moving_Object)
+                else None for moving_object in others],
+        }
+
+    def reset(self, randomize_spawns=False):
+        """put the env back into the state captured by
+        `capture_template` (by default, the state right after
+        `__init__`). World arrays are restored in place, the
+        template's actors are revived (actors added since are
+        dropped) and their population rows rewritten at once
+
+        args:
+            randomize_spawns: if True, actors start from new
+                random free cells (drawn together, see
+                `random_avaliable_locs`) instead of where they
+                were in the template
+
+        return: returns vectorized observation for agents
+        """
+        template = self._template
+        if template is None:
+            raise RuntimeError("no template to reset to, "
+                "call capture_template first")
+        for actor_id, actor in self.actors.items():
+            if template["actors"].get(actor_id) is not actor:
+                actor._attach(Population(capacity=1))
+        for actor in template["actors"].values():
+            if actor._population is not self.population:
+                actor._attach(self.population)
+        self.actors = template["actors"].copy()
+        self._actor_ids = {actor: actor_id
+            for actor_id, actor in self.actors.items()}
+        self._births, self._deaths = [], {}
+        self.origonal_actors = self.actors.copy()
+        actors = list(self.actors.values())
+        rows = np.array([actor._row for actor in actors], np.int64)
+        for name, values in template["columns"].items():
+            self.population.columns[name][rows] = values
+        self.population.world[rows] = self.world
+        for actor, storage in zip(actors, template["storage"]):
+            actor.storage = list(storage)
+        for moving_object, loc, signal in zip(template["objects"],
+                template["object_locs"], template["object_signals"]):
+            moving_object.loc = loc.copy()
+            if signal is not None:
+                moving_object.set_signal(signal)
 
-    def add_actor(self, actor):
+        copyto(self.static_objects, template["static_objects"])
+        copyto(self.combined_object_ops, template["combined_object_ops"])
+        copyto(self.signal_field, template["signal_field"])
+        copyto(self._occupied, template["occupied"])
+        self._signal_cells = template["signal_cells"]
+        self._patched_signal_cells = []
+        if self.pheromones is not None:
+            if template["pheromones"] is None:
+                self.pheromones.clear()
+            else:
+                self.pheromones.set_field(template["pheromones"])
+        self._occupancy = template["occupancy"].copy()
+        self.moving_objects = template["moving_objects"].copy()
+        self.signaling_objects = template["signaling_objects"].copy()
+        self._dirty_cells = set()
+        self._forget_static_changes()
+        self._awake = set(template["awake"])
+        self._gravity_applied = template["gravity_applied"]
+        self._free_cells = None if template["free_cells"] is None \
+            else template["free_cells"].copy()
+
+        if randomize_spawns and actors:
+            old_cells = to_cells(self.population.loc[rows])
+            for cell in map(tuple, old_cells.tolist()):
+                del self._occupancy[cell]
+            self._occupied[tuple(old_cells.T)] = False
+            self.combined_object_ops[tuple(old_cells.T)] = \
+                self.static_objects[tuple(old_cells.T)]
+            self._update_free_cells(old_cells)
+            cells = self.random_avaliable_locs(len(actors))
+            self.population.loc[rows] = cells
+            for actor, cell in zip(actors, map(tuple, cells.tolist())):
+                self._occupancy[cell] = actor
+            self._occupied[tuple(cells.T)] = True
+            self.combined_object_ops[tuple(cells.T)] = \
+                [actor.ops for actor in actors]
+            self._update_free_cells(cells)
+            # settle the new spawns like `__init__` does
+            self._awake = set(self.moving_objects)
+            self._gravity_applied = None
+            self._global_update()
+        return super(SMAE, self).reset()
+
+    def save(self, path):
+        """write the whole env to path: static_objects,
+        combined_object_ops, signal_field, the population
+        columns and storage of every actor, all other moving
+        objects and the random state. Arrays are stored raw
+        (see `checkpoint`), nothing is pickled
+
+        args:
+            path: file to write. Actor ids must be ints or strs
+        """
+        checkpoint.save(self, path)
+
+    @classmethod
+    def load(cls, path, mmap_mode="c"):
+        """read an env written by `SMAE.save`. The world arrays
+        are memory-mapped rather than read, so opening even a
+        huge world is quick; pages are only read once touched
+
+        args:
+            path: file to read
+            mmap_mode: how to map the world arrays. "c" (default)
+                is copy-on-write: the env can be stepped and the
+                file is never changed. "r+" writes changes back
+                to the file. If `None` the arrays are read into
+                memory
+
+        return: returns the new env. Moving objects come back as
+            `Moving_Object`s, `Signaling_Moving_Object`s or
+            `Actor`s (subclasses are not preserved). No
+            template is captured; call `capture_template` before
+            using `reset`
+        """
+        return checkpoint.load(path, cls, mmap_mode=mmap_mode)
+
+    def add_actor(self, actor, actor_id=None):
         """new actors created post-initialization
         or midgame can be added here
         
@@ -321,14 +1061,18 @@ class SMAE(MA_Gym_Env):
                 random Actor is initialized and
                 `actor` arg supplied becomes its
                 dictionary lookup key
+            actor_id: key for an `actor.Actor` given as
+                `actor`. Defaults to the actor itself
                 
         return: returns `actor` if it was an `actor.Actor`
             object, otherwise returns the newly initialized
             `actor.Actor` mapped to by `actor`"""
-        actor = super(SMAE, self).add_actor(actor)
-        self.moving_objects.append(actor)
-        self.signaling_objects.append(actor)
-        self._logic_update()
+        actor = super(SMAE, self).add_actor(actor, actor_id=actor_id)
+        actor._attach(self.population)
+        self.population.world[actor._row] = self.world
+        self.add_moving_object(actor)
+        if self.profiler is not None:
+            self.profiler.count("actors_added")
         return actor
 
     def remove_actor(self, actor_id=None, actor=None):
@@ -344,57 +1088,442 @@ class SMAE(MA_Gym_Env):
         return: returns tuple (actor_id, actor) removed"""
         actor_id, actor = super(SMAE, self).remove_actor(
             actor_id=actor_id, actor=actor)
-        self.moving_objects.pop(actor)
-        self.signaling_objects.pop(actor)
-        self._logic_update()
+        self.remove_moving_object(actor)
+        actor._attach(Population(capacity=1))
+        if self.profiler is not None:
+            self.profiler.count("actors_removed")
         return actor_id, actor
 
+    def add_actors(self, actors, actor_ids=None) -> list:
+        """add many actors at once (see `add_actor`). The
+        spatial index, registries and world arrays are patched
+        in one go. Actors whose cell is already taken (or
+        taken by an earlier actor of the batch) are moved to
+        random free cells (see `random_avaliable_locs`)
+
+        args:
+            actors: list of actors (or keys, see `add_actor`)
+            actor_ids: list of keys for the actors. Optional
+
+        return: returns list of the added `actor.Actor`s"""
+        if actor_ids is None:
+            actor_ids = [None] * len(actors)
+        added = []
+        for actor, actor_id in zip(actors, actor_ids):
+            if actor_id is None:
+                actor_id = actor
+            if not isinstance(actor, Actor):
+                # placed below with the others
+                actor = Actor(env=self, initial_loc=UNPLACED)
+            actor._attach(self.population)
+            self._register_actor(actor_id, actor)
+            added.append(actor)
+        if not added:
+            return added
+        rows = np.array([actor._row for actor in added], np.int64)
+        self.population.world[rows] = self.world
+        cells = to_cells(self.population.loc[rows])
+
+        inside = np.all((cells >= 0) & (cells < self.world_size), axis=1)
+        taken = set(self._occupancy)
+        placed = np.zeros(len(added), bool)
+        for i, cell in enumerate(map(tuple, cells.tolist())):
+            if inside[i] and cell not in taken:
+                taken.add(cell)
+                placed[i] = True
+        if not placed.all():
+            # nobody may spawn where the others just did
+            self._occupied[tuple(cells[placed].T)] = True
+            self._update_free_cells(cells[placed])
+            cells[~placed] = self.random_avaliable_locs(
+                int(np.count_nonzero(~placed)))
+            self.population.loc[rows[~placed]] = cells[~placed]
+
+        for actor, cell in zip(added, map(tuple, cells.tolist())):
+            self._occupancy[cell] = actor
+            self.moving_objects.add(actor)
+            self.signaling_objects.add(actor)
+            self._awake.add(actor)
+        idx = tuple(cells.T)
+        self._occupied[idx] = True
+        self._update_free_cells(cells)
+        self.combined_object_ops[idx] = [actor.ops for actor in added]
+        self.signal_field[idx] = self.population.signal[rows]
+        self._patched_signal_cells.extend(map(tuple, cells.tolist()))
+        self._dirty_cells.update(map(tuple, cells.tolist()))
+        if self.profiler is not None:
+            self.profiler.count("actors_added", len(added))
+        return added
+
+    def remove_actors(self, actor_ids) -> list:
+        """remove many actors at once (see `remove_actor`).
+        The spatial index, registries and world arrays are
+        patched in one go
+
+        args:
+            actor_ids: list of keys of the actors to remove
+
+        return: returns list of tuples (actor_id, actor) removed"""
+        removed = [(actor_id, self._unregister_actor(actor_id))
+            for actor_id in actor_ids]
+        if not removed:
+            return removed
+        actors = [actor for _, actor in removed]
+        rows = np.array([actor._row for actor in actors], np.int64)
+        cells = to_cells(self.population.loc[rows])
+        for actor, cell in zip(actors, map(tuple, cells.tolist())):
+            del self._occupancy[cell]
+            self.moving_objects.remove(actor)
+            self.signaling_objects.remove(actor)
+            self._awake.discard(actor)
+        idx = tuple(cells.T)
+        self._occupied[idx] = False
+        self.combined_object_ops[idx] = self.static_objects[idx]
+        self._update_free_cells(cells)
+        self.signal_field[idx] = 0
+        self._patched_signal_cells.extend(map(tuple, cells.tolist()))
+        self._dirty_cells.update(map(tuple, cells.tolist()))
+        for actor in actors:
+            actor._attach(Population(capacity=1))
+        if self.profiler is not None:
+            self.profiler.count("actors_removed", len(removed))
+        return removed
+
+    def add_moving_object(self, moving_object):
+        """place a (possibly signaling) moving object into
+        the world at `moving_object.rounded_loc`
+
+        args:
+            moving_object: `Moving_Object` to add. Its cell
+                must not already hold another moving object
+        """
+        loc = moving_object.rounded_loc
+        if loc in self._occupancy:
+            raise ValueError(
+                "{} is already occupied by a moving object".format(loc))
+        self._occupancy[loc] = moving_object
+        self._refresh_cell(loc)
+        self.moving_objects.add(moving_object)
+        self._awake.add(moving_object)
+        if isinstance(moving_object, Signaling_Moving_Object):
+            self.signaling_objects.add(moving_object)
+        self._refresh_signal(loc)
+
+    def remove_moving_object(self, moving_object):
+        """take a moving object out of the world. The static
+        object it was standing on is left unchanged
+
+        args:
+            moving_object: `Moving_Object` to remove
+        """
+        del self._occupancy[moving_object.rounded_loc]
+        self._refresh_cell(moving_object.rounded_loc)
+        self.moving_objects.remove(moving_object)
+        self._awake.discard(moving_object)
+        if isinstance(moving_object, Signaling_Moving_Object):
+            self.signaling_objects.remove(moving_object)
+        self._refresh_signal(moving_object.rounded_loc)
+
+    def _move_object(self, moving_object, new_loc):
+        """set `moving_object.loc` to new_loc keeping the
+        spatial index in sync. The caller is responsible
+        for making sure the new cell is free"""
+        old_cell = moving_object.rounded_loc
+        moving_object.loc = np.array(new_loc, dtype=float)
+        new_cell = moving_object.rounded_loc
+        if new_cell != old_cell:
+            del self._occupancy[old_cell]
+            self._occupancy[new_cell] = moving_object
+            self._refresh_cell(old_cell)
+            self._refresh_cell(new_cell)
+
+    def resolve_moves(self, movers, displacements):
+        """move many moving objects at once. All paths are
+        traced and resolved together so the outcome does
+        not depend on the order of `movers` (see
+        `movement.resolve_moves`)
+
+        args:
+            movers: list of `Moving_Object` in this env
+            displacements: np.ndarray (N, 3) of intended
+                displacements
+        """
+        movement.resolve_moves(self, movers, displacements)
+
+    def _lift_objects(self, moving_objects):
+        """temporarily take moving objects out of the spatial
+        index (but not `self.moving_objects`). Every lifted
+        object must be put back with `_place_objects`"""
+        for moving_object in moving_objects:
+            loc = moving_object.rounded_loc
+            del self._occupancy[loc]
+            # `_place_objects` marks the cell dirty if the
+            # object does not come back to it
+            self._refresh_cell(loc, dirty=False)
+
+    def _place_objects(self, moving_objects, locs):
+        """put lifted moving objects back at locs
+
+        args:
+            moving_objects: list of lifted `Moving_Object`
+            locs: np.ndarray (N, 3) of their new locations.
+                No two may share a cell
+        """
+        old_cells = to_cells([moving_object.loc
+            for moving_object in moving_objects])
+        new_cells = to_cells(locs)
+        rows = [moving_object._row for moving_object in moving_objects
+            if getattr(moving_object, "_population", None)
+                is self.population]
+        if len(rows) == len(moving_objects):
+            # all actors, write their locations in one go
+            self.population.loc[rows] = locs
+        else:
+            for moving_object, loc in zip(moving_objects, locs):
+                moving_object.loc = np.array(loc, dtype=float)
+        for moving_object, loc in zip(moving_objects,
+                map(tuple, new_cells.tolist())):
+            self._occupancy[loc] = moving_object
+            self._refresh_cell(loc, dirty=False)
+        moved = np.any(old_cells != new_cells, axis=1)
+        self._dirty_cells.update(map(tuple, old_cells[moved].tolist()))
+        self._dirty_cells.update(map(tuple, new_cells[moved].tolist()))
+
+    def _refresh_cell(self, loc, dirty=True):
+        """patch the combined ops and occupancy of one cell
+        after whatever is at loc changed
+
+        args:
+            loc: cell to patch
+            dirty: if True (default), also wake whatever
+                gravity put to sleep around loc
+        """
+        moving_object = self._occupancy.get(loc)
+        self._occupied[loc] = moving_object is not None
+        self.combined_object_ops[loc] = self.static_objects[loc] \
+            if moving_object is None else moving_object.ops
+        if self._free_cells is not None:
+            self._free_cells.set(loc, moving_object is None
+                and OPERATIONS.allows(
+                    self.static_objects[loc], OPERATIONS.GOTHROUGH))
+        if dirty:
+            self._dirty_cells.add(loc)
+
+    def _update_free_cells(self, cells):
+        """vectorized `_refresh_cell` of `self.free_cells` after
+        writing to `self._occupied` or `self.static_objects`
+        directly"""
+        if self._free_cells is None or not len(cells):
+            return
+        idx = tuple(np.asarray(cells).T)
+        self._free_cells.update(cells, ops_mask(self.static_objects[idx],
+            require=[OPERATIONS.GOTHROUGH]) & ~self._occupied[idx])
+
+    @property
+    def free_cells(self) -> Free_Cells:
+        """`free_cells.Free_Cells` index of the cells that
+        support GOTHROUGH and hold no moving object. Built on
+        first use, then patched cell by cell as they change.
+        In chunked envs the index is chunked as well"""
+        if self._free_cells is None:
+            passable = lambda ops: ops_mask(ops,
+                require=[OPERATIONS.GOTHROUGH])
+            if self.chunk_size is None:
+                free = passable(self.static_objects) & ~self._occupied
+            else:
+                free = self.static_objects.map(passable, bool)
+                cells = np.array(list(self._occupancy), np.int64)
+                free[tuple(cells.reshape((-1, len(self.world_size))).T)] \
+                    = False
+            self._free_cells = Free_Cells(free)
+        return self._free_cells
+
+    def _refresh_signal(self, loc):
+        """patch `self.signal_field` at one cell after a
+        (possibly signaling) moving object came or went. The
+        whole field is rewritten by every `_logic_update`"""
+        moving_object = self._occupancy.get(loc)
+        self.signal_field[loc] = moving_object.signal \
+            if isinstance(moving_object, Signaling_Moving_Object) else 0
+        self._patched_signal_cells.append(loc)
+
+    def set_static_object(self, loc, ops):
+        """replace the static object at loc. Use this rather than
+        writing to `self.static_objects` directly so that
+        `self.combined_object_ops` picks up the change
+
+        args:
+            loc: cell to change
+            ops: OPERATIONS bitfield of the new static object
+        """
+        loc = to_cell(loc)
+        self.static_objects[loc] = ops
+        self._refresh_cell(loc)
+        for log in self._static_logs:
+            if log.cells is not None:
+                log.cells.append(loc)
+
+    def watch_static(self) -> Change_Log:
+        """start logging the cells `set_static_object` changes
+
+        return: returns a new `Change_Log`. It starts out unknown
+            (`None`), and so does it again whenever static
+            objects were written to in bulk (`reset`,
+            `rebuild_combined_object_ops`)"""
+        log = Change_Log()
+        self._static_logs.append(log)
+        return log
+
+    def unwatch_static(self, log):
+        """stop feeding a `Change_Log` from `watch_static`"""
+        self._static_logs = [other for other in self._static_logs
+            if other is not log]
+
+    def _forget_static_changes(self):
+        for log in self._static_logs:
+            log.cells = None
+
     def random_avaliable_loc(self) -> tuple:
         """Find random location in environment that
-        supports OPERATIONS.GOTHROUGH
+        supports OPERATIONS.GOTHROUGH and holds no moving
+        object (see `random_avaliable_locs`)
 
         return: returns random location"""
-        # recursively shoot until an allowable space is found
-        loc = np.random.randint(0, self.world_size)
-        return loc \
-            if OPERATIONS.GOTHROUGH in OPERATIONS.decode(
-                self.combined_object_ops[loc]) \
-            else self.random_avaliable_loc()
-
-    def _global_update(self):
+        return tuple(self.random_avaliable_locs(1)[0].tolist())
+
+    def random_avaliable_locs(self, n, region=None, predicate=None) \
+            -> np.ndarray:
+        """draw n distinct cells that support OPERATIONS.GOTHROUGH
+        and hold no moving object at once. Drawn from
+        `self.free_cells`, so the cost does not grow as the world
+        fills up
+
+        args:
+            n: number of cells
+            region: tuple (lo, hi) of the box [lo, hi) to draw
+                from. If `None` (default) the whole world
+            predicate: function mapping int np.ndarray (K, D) of
+                candidate cells to a bool np.ndarray (K,) of the
+                acceptable ones. Optional
+
+        return: returns int np.ndarray (n, D) of cells. Raises
+            `ValueError` if there are fewer than n such cells
+        """
+        rng = np.random if self.rng is None else self.rng
+        return self.free_cells.sample(n, rng, region=region,
+            predicate=predicate)
+
+    def _global_update(self, a_n=None):
         """All moving objects have moved
         and all signaling objects should
         have made their signals by now"""
         # physics
         # perform global motion here
-        self._apply_global_acceleration(self.gravity)
+        with self._phase("gravity"):
+            self._apply_global_acceleration(self.gravity)
+        if a_n is not None:
+            with self._phase("update_actors"):
+                self._update_actors()
+            if self.pheromones is not None:
+                with self._phase("pheromones"):
+                    self._update_pheromones()
+        with self._phase("births_deaths"):
+            self.apply_queued()
         self._logic_update()
+        if a_n is not None and self.recorder is not None:
+            with self._phase("recording"):
+                self.recorder.record(a_n)
 
     def _apply_global_acceleration(self, accel_vec):
-        for moving_object in self.moving_objects:
-            moving_object.try_move(accel_vec, self)
+        """move all moving objects by accel_vec at once. Objects
+        resting on solid ground are skipped (see
+        `gravity.apply_gravity`)"""
+        gravity.apply_gravity(self, accel_vec)
+
+    def _update_actors(self):
+        """per-step actor bookkeeping performed on the
+        whole population at once: resting energy, rewards
+        and queuing the deaths of actors whose energy ran out"""
+        rows = self.actor_rows
+        starved = self.population.consume(RESTING_ENERGY_RATE, rows)
+        self.population.update_rewards(rows)
+        for row in starved:
+            self.queue_death(actor=self.population.owners[row])
 
     def _logic_update(self):
         """logic. After execution, no motion
         should occur until next step"""
-        self._update_combined_object_ops()
-        self._update_signal_field()
+        with self._phase("combined_object_ops"):
+            self._update_combined_object_ops()
+        with self._phase("signal_field"):
+            self._update_signal_field()
 
     def _update_combined_object_ops(self):
-        """update self.combined_objects with
-        new moving_object locations"""
-        self.combined_object_ops = self.static_objects.copy()
-        for moving_object in self.moving_objects:
-            self.combined_object_ops[moving_object.loc] = \
-                moving_object.ops
+        """self.combined_objects is patched cell by cell as
+        moving objects move and static objects change (see
+        `self._refresh_cell`) so there is nothing left to do
+        here unless validating against a full rebuild"""
+        if self.validate_combined_ops:
+            combined_object_ops = self.combined_object_ops.copy()
+            self.rebuild_combined_object_ops()
+            assert np.array_equal(
+                combined_object_ops, self.combined_object_ops), \
+                "incremental combined_object_ops diverged " \
+                "from a full rebuild"
+
+    def rebuild_combined_object_ops(self):
+        """rebuild self.combined_objects from scratch. Call this
+        after writing to `self.static_objects` directly"""
+        self.combined_object_ops[...] = self.static_objects
+        self._occupied.fill(False)
+        # anything may have changed
+        self._awake = set(self.moving_objects)
+        self._forget_static_changes()
+        self._free_cells = None
+        for loc, moving_object in self._occupancy.items():
+            self.combined_object_ops[loc] = moving_object.ops
+            self._occupied[loc] = True
 
     def _update_signal_field(self):
-        # make self.signal_field all zero
-        self.signal_field.fill(0)
-        # add signals currently being broadcast
-        for signaling_object in self.signaling_objects:
-            self.signal_field[
-                signaling_object.rounded_loc[0],
-                signaling_object.rounded_loc[1],
-                signaling_object.rounded_loc[2]
-                ] = signaling_object.signal
\ No newline at end of file
+        """write the signals currently being broadcast into
+        `self.signal_field`. Only the cells written last time
+        are cleared, so the cost grows with the number of
+        signaling objects rather than the size of the world"""
+        stale = np.concatenate([self._signal_cells,
+            np.array(self._patched_signal_cells, np.int64).reshape(
+                (-1, len(self.world_size)))])
+        self.signal_field[tuple(stale.T)] = 0
+        self._patched_signal_cells = []
+        cells, signals = self._emitters()
+        self.signal_field[tuple(cells.T)] = signals
+        self._signal_cells = cells
+
+    def _update_pheromones(self):
+        """every signaling object deposits into the
+        pheromone channel its signal selects (see
+        `pheromones.Pheromone_Field`), then the trails
+        diffuse and decay"""
+        cells, signals = self._emitters()
+        self.pheromones.deposit(cells, signals - 1)
+        self.pheromones.step()
+
+    def _emitters(self) -> tuple:
+        """cells and signals of every signaling object
+
+        return: returns tuple of int np.ndarrays (cells (N, D),
+            signals (N,))"""
+        # actors come straight from the population columns
+        rows = self.actor_rows
+        cells = [to_cells(self.population.loc[rows])]
+        signals = [self.population.signal[rows]]
+        # other signaling objects are usually few
+        others = [signaling_object
+            for signaling_object in self.signaling_objects
+            if not isinstance(signaling_object, Actor)]
+        if others:
+            cells.append(to_cells([signaling_object.loc
+                for signaling_object in others]))
+            signals.append([signaling_object.signal
+                for signaling_object in others])
+        cells = np.concatenate(cells).reshape((-1, len(self.world_size)))
+        return cells, np.concatenate(signals).astype(np.int64)
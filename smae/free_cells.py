@@ -0,0 +1,153 @@
+import numpy as np
+
+from .chunked import Chunked_Array
+
+BLOCK = 1024 # cells (in C order) counted together
+
+class Free_Cells:
+
+    def __init__(self, free):
+        """index of the cells something may spawn in: a mask
+        of the free cells plus the number of free cells in
+        every block of BLOCK consecutive cells (in C order).
+        A cell joins or leaves in O(1). The i-th free cell is
+        found from the block counts, so k distinct free cells
+        are drawn in O(min(k * BLOCK, cells) + cells / BLOCK)
+        however full the world is
+
+        Draws only depend on which cells are free and the
+        random state, never on the order cells changed in
+
+        args:
+            free: bool np.ndarray or `chunked.Chunked_Array` of
+                the world's shape, True where a cell is free.
+                Kept (not copied) and written to from now on
+        """
+        self.shape = tuple(free.shape)
+        self.size = int(np.prod(self.shape))
+        self.free = free
+        n_blocks = -(-self.size // BLOCK)
+        if isinstance(free, Chunked_Array):
+            # only allocated chunks can differ from the fill
+            lin = np.ravel_multi_index(free.nonfill_cells().T, self.shape)
+            odd = np.bincount(lin // BLOCK, minlength=n_blocks)
+            if free.fill_value:
+                self.counts = np.full((n_blocks,), BLOCK, np.int64) - odd
+                self.counts[-1] -= n_blocks * BLOCK - self.size
+            else:
+                self.counts = odd.astype(np.int64)
+        else:
+            flat = np.zeros((n_blocks * BLOCK,), bool)
+            flat[:self.size] = free.reshape(-1)
+            self.counts = flat.reshape((n_blocks, BLOCK)).sum(
+                axis=1).astype(np.int64)
+
+    def __len__(self):
+        return int(self.counts.sum())
+
+    def __contains__(self, cell):
+        return bool(self.free[tuple(cell)])
+
+    def copy(self):
+        copy = Free_Cells.__new__(Free_Cells)
+        copy.__dict__.update(self.__dict__)
+        copy.free = self.free.copy()
+        copy.counts = self.counts.copy()
+        return copy
+
+    def set(self, cell, free):
+        """mark cell (tuple of ints) free or taken"""
+        if bool(self.free[cell]) != free:
+            self.free[cell] = free
+            self.counts[np.ravel_multi_index(cell, self.shape) // BLOCK] \
+                += 1 if free else -1
+
+    def update(self, cells, free):
+        """vectorized `set`
+
+        args:
+            cells: int np.ndarray (K, D) of distinct cells
+            free: bool np.ndarray (K,) (or a single bool)
+        """
+        cells = np.asarray(cells, np.int64).reshape((-1, len(self.shape)))
+        free = np.broadcast_to(np.asarray(free, dtype=bool), (len(cells),))
+        idx = tuple(cells.T)
+        change = np.asarray(self.free[idx]) != free
+        if not change.any():
+            return
+        cells, free = cells[change], free[change]
+        self.free[tuple(cells.T)] = free
+        np.add.at(self.counts, np.ravel_multi_index(cells.T, self.shape)
+            // BLOCK, np.where(free, 1, -1))
+
+    def sample(self, k, rng=np.random, region=None, predicate=None):
+        """draw k distinct free cells
+
+        args:
+            k: number of cells
+            rng: `np.random.RandomState` (or `np.random`) to draw with
+            region: tuple (lo, hi) of the box [lo, hi) to draw
+                from. Costs O(box volume). If `None` (default)
+                the whole world
+            predicate: function mapping int np.ndarray (K, D) of
+                candidate cells to a bool np.ndarray (K,) of the
+                acceptable ones. It sees every free cell of region
+                (of the world if no region is given, so costs
+                O(world) then). Optional
+
+        return: returns int np.ndarray (k, D) of cells. Raises
+            `ValueError` if there are fewer than k candidates
+        """
+        if region is None and predicate is None:
+            return self._nth(choose(len(self), k, rng))
+        lo, hi = np.zeros(len(self.shape), np.int64), np.array(self.shape)
+        if region is not None:
+            lo = np.clip(np.asarray(region[0], np.int64), 0, self.shape)
+            hi = np.clip(np.asarray(region[1], np.int64), lo, self.shape)
+        cells = np.argwhere(np.asarray(self.free[tuple(
+            slice(a, b) for a, b in zip(lo, hi))])) + lo
+        if predicate is not None:
+            cells = cells[np.asarray(predicate(cells), dtype=bool)]
+        return cells[choose(len(cells), k, rng)]
+
+    def _nth(self, ranks) -> np.ndarray:
+        """returns int np.ndarray (K, D) of the free cells with
+        the given ranks (in C order)"""
+        ranks = np.asarray(ranks, np.int64)
+        ends = np.cumsum(self.counts)
+        blocks = np.searchsorted(ends, ranks, side="right")
+        hit = np.unique(blocks)
+        if 4 * len(hit) * BLOCK >= self.size:
+            # the blocks cover much of the world, read it all at once
+            free = np.asarray(self.free[tuple(slice(None)
+                for _ in self.shape)]).reshape(-1)
+            lin = np.flatnonzero(free)[ranks]
+        else:
+            # read every block hit once, ranks then index its free cells
+            lin = (hit[:, None] * BLOCK + np.arange(BLOCK)).reshape(-1)
+            inside = lin < self.size
+            free = np.asarray(self.free[np.unravel_index(
+                np.minimum(lin, self.size - 1), self.shape)]) & inside
+            row = np.searchsorted(hit, blocks)
+            before = np.cumsum(self.counts[hit]) - self.counts[hit]
+            local = ranks - (ends[blocks] - self.counts[blocks])
+            lin = lin[np.flatnonzero(free)[before[row] + local]]
+        return np.stack(np.unravel_index(lin, self.shape),
+            axis=-1).reshape((-1, len(self.shape)))
+
+def choose(n, k, rng=np.random) -> np.ndarray:
+    """returns int np.ndarray of k distinct indices in [0, n)
+    drawn in O(k) (unless k is close to n)"""
+    if k > n:
+        raise ValueError("cannot draw {} cells, only {} are free"
+            .format(k, n))
+    if 2 * k >= n:
+        return rng.permutation(n)[:k]
+    picked = np.zeros((0,), np.int64)
+    while len(picked) < k:
+        picked = np.concatenate([picked,
+            rng.randint(0, n, size=k - len(picked) + 8)])
+        # keep the first draw of every index
+        _, first = np.unique(picked, return_index=True)
+        picked = picked[np.sort(first)]
+    return picked[:k]
@@ -0,0 +1,96 @@
+import numpy as np
+
+from .elements import to_cells
+
+def neighbourhood(cells, shape, radius=1) -> np.ndarray:
+    """every cell within `radius` (chebyshev distance) of
+    cells that lies inside the world
+
+    args:
+        cells: int np.ndarray (K, D)
+        shape: world size
+        radius: how far around each cell to look
+
+    return: returns int np.ndarray (M, D) of unique cells
+    """
+    cells = np.asarray(cells, dtype=np.int64).reshape((-1, len(shape)))
+    offsets = np.stack(np.meshgrid(
+        *[np.arange(-radius, radius+1)] * len(shape),
+        indexing="ij"), axis=-1).reshape((-1, len(shape)))
+    near = (cells[:, None, :] + offsets).reshape((-1, len(shape)))
+    inside = np.all((near >= 0) & (near < np.array(shape)), axis=1)
+    return np.unique(near[inside], axis=0)
+
+def objects_at(env, cells) -> list:
+    """returns list of the moving objects standing in cells"""
+    cells = np.asarray(cells, dtype=np.int64).reshape(
+        (-1, len(env.world_size)))
+    occupied = cells[env._occupied[tuple(cells.T)]]
+    if env.profiler is not None:
+        env.profiler.count("moving_object_lookups", len(occupied))
+    return [env._occupancy[cell] for cell in map(tuple, occupied.tolist())]
+
+def stacks(env, moving_objects, up) -> set:
+    """grow moving_objects by whatever rests on top of them
+    (transitively) so that whole columns fall together
+
+    args:
+        env: `SMAE` the objects are in
+        moving_objects: iterable of `Moving_Object`
+        up: int np.ndarray (D,) step from an object to the
+            cell resting on it
+
+    return: returns set of `Moving_Object`
+    """
+    stacked = set(moving_objects)
+    frontier = list(stacked)
+    while frontier:
+        cells = to_cells([moving_object.loc
+            for moving_object in frontier]) + up
+        inside = np.all((cells >= 0) & (cells < np.array(env.world_size)),
+            axis=1)
+        frontier = [moving_object
+            for moving_object in objects_at(env, cells[inside])
+            if moving_object not in stacked]
+        stacked.update(frontier)
+    return stacked
+
+def apply_gravity(env, accel_vec):
+    """move every awake moving object of env by accel_vec in
+    one `resolve_moves` call
+
+    Objects that did not move fall asleep and are skipped on
+    later calls until a cell within one cell of them changes
+    (`env._dirty_cells`) or the acceleration itself changes.
+    Everything resting on an awake object is woken with it so
+    that columns settle in one pass
+
+    args:
+        env: `SMAE` to apply gravity to
+        accel_vec: uniform acceleration vector
+    """
+    accel_vec = np.asarray(accel_vec, dtype=float)
+    if env._gravity_applied is None \
+        or not np.array_equal(env._gravity_applied, accel_vec):
+        env._awake = set(env.moving_objects)
+        env._gravity_applied = accel_vec
+    changed, env._dirty_cells = env._dirty_cells, set()
+    if not accel_vec.any():
+        env._awake = set()
+        return
+
+    # wake everything near cells that changed since the last pass
+    if changed:
+        env._awake.update(objects_at(env,
+            neighbourhood(list(changed), env.world_size)))
+    if not env._awake:
+        return
+    up = -np.sign(accel_vec).astype(np.int64)
+    movers = list(stacks(env, env._awake, up) if up.any() else env._awake)
+
+    before = np.array([moving_object.loc for moving_object in movers])
+    env.resolve_moves(movers, np.tile(accel_vec, (len(movers), 1)))
+    after = np.array([moving_object.loc for moving_object in movers])
+    # whatever could not move sleeps until its surroundings change
+    env._awake = {moving_object for moving_object, moved
+        in zip(movers, np.any(after != before, axis=1)) if moved}
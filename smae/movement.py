@@ -0,0 +1,257 @@
+import numpy as np
+
+from .elements import OPERATIONS, predicate_table, to_cells
+
+MAX_PUSH_CHAIN = 8 # longest row of objects one mover can push
+
+# what a mover finds in the cell it tries to enter
+_FREE = 0 # empty and GOTHROUGHable
+_BLOCKED = 1 # outside of the world or rigid
+_PUSHABLE = 2 # PUSH_OVERable (and not GOTHROUGHable)
+_MOVER = 3 # another mover that is leaving its cell this tick
+
+_GOTHROUGH = predicate_table((OPERATIONS.GOTHROUGH,))
+_PUSH_OVER = predicate_table((OPERATIONS.PUSH_OVER,), (OPERATIONS.GOTHROUGH,))
+
+class _Movers:
+
+    def __init__(self, env, movers, displacements):
+        """array state of everything moving this phase"""
+        self.env = env
+        self.objects = movers
+        self.shape = np.array(env.world_size)
+        self.loc = np.array([mover.loc for mover in movers], dtype=float)
+        self.ops = np.array([mover.ops for mover in movers],
+            dtype=np.int64).astype(np.uint8)
+        displacements = np.asarray(displacements, dtype=float)
+        # walk in increments no longer than one unit so
+        # that no cell along the way gets skipped
+        self.n_steps = np.ceil(
+            np.abs(displacements).sum(axis=1)).astype(np.int64)
+        self.unit_delta = displacements \
+            / np.maximum(self.n_steps, 1)[:, None]
+        self.speed = np.abs(self.unit_delta).sum(axis=1)
+        self.cells = to_cells(self.loc)
+        self.reindex()
+
+    def reindex(self):
+        """rebuild the sorted cell -> mover lookup"""
+        self.lin = np.ravel_multi_index(self.cells.T, self.shape)
+        self.order = np.argsort(self.lin)
+        self.sorted_lin = self.lin[self.order]
+
+    def at(self, cells) -> np.ndarray:
+        """returns index of the mover in each of cells or -1"""
+        lin = np.ravel_multi_index(cells.T, self.shape)
+        pos = np.minimum(np.searchsorted(self.sorted_lin, lin),
+            len(self.sorted_lin) - 1)
+        found = self.sorted_lin[pos] == lin
+        return np.where(found, self.order[pos], -1)
+
+    def classify(self, cells, leaving):
+        """classify what is found in cells
+
+        args:
+            cells: int np.ndarray (K, 3)
+            leaving: bool np.ndarray (N,) of movers trying
+                to leave their cells this tick
+
+        return: returns tuple (kind, mover) of int np.ndarrays
+            (K,). mover is the index of the mover in the
+            cell or -1
+        """
+        kind = np.full((len(cells),), _BLOCKED)
+        mover = np.full((len(cells),), -1)
+        if self.env.profiler is not None:
+            self.env.profiler.count("cells_classified", len(cells))
+        inside = np.all((cells >= 0) & (cells < self.shape), axis=1)
+        if not inside.any():
+            return kind, mover
+        mover[inside] = self.at(cells[inside])
+        has_mover = mover >= 0
+        is_leaving = has_mover & leaving[mover]
+        kind[is_leaving] = _MOVER
+        # movers staying put can be pushed like any other object
+        staying = has_mover & ~is_leaving
+        kind[staying] = np.where(
+            _PUSH_OVER[self.ops[mover[staying]]], _PUSHABLE, _BLOCKED)
+        # everything else is in the env (movers are lifted out)
+        rest = inside & ~has_mover
+        idx = tuple(cells[rest].T)
+        ops = np.asarray(self.env.combined_object_ops[idx]).astype(np.uint8)
+        occupied = np.asarray(self.env._occupied[idx])
+        kind[rest] = np.where(_GOTHROUGH[ops] & ~occupied, _FREE,
+            np.where(_PUSH_OVER[ops], _PUSHABLE, _BLOCKED))
+        return kind, mover
+
+def resolve_moves(env, movers, displacements, max_push_chain=MAX_PUSH_CHAIN):
+    """move every mover along its displacement simultaneously
+
+    Movers advance in lock step ticks of at most one cell
+    (a DDA-style traversal of each path). Every tick:
+     - a mover entering a cell that differs from its own along
+       several axes (a diagonal step) fails unless every cell
+       it brushes past on the way (ie its own cell moved along
+       only some of those axes) is free or being left, so
+       movers never cut through the corners of walls
+     - a mover entering a free cell succeeds
+     - a mover entering a cell another mover is leaving
+       succeeds if that mover does (cycles and swaps fail)
+     - a mover entering a PUSH_OVERable cell pushes the row
+       of PUSH_OVERable objects ahead of it one cell forward
+       if the row ends in a free cell within `max_push_chain`
+     - when several movers claim the same cell, the fastest
+       wins. Ties go to the mover whose current cell is first
+       in C order of the world, so the result only depends on
+       the state of the world and never on the order of movers
+    A mover that fails stops for the rest of the phase. Its
+    decimal remainder stays in its loc
+
+    args:
+        env: `SMAE` the movers are in
+        movers: list of `Moving_Object`
+        displacements: np.ndarray (N, 3) of intended displacements
+        max_push_chain: longest row of objects a mover can push
+    """
+    if not len(movers):
+        return
+    state = _Movers(env, movers, displacements)
+    active = state.n_steps > 0
+    if not active.any():
+        return
+    env._lift_objects(movers)
+    try:
+        for tick in range(int(state.n_steps.max())):
+            active &= tick < state.n_steps
+            if not active.any():
+                break
+            _tick(state, active, max_push_chain)
+    finally:
+        env._place_objects(movers, state.loc)
+
+def _tick(state, active, max_push_chain):
+    """advance every active mover by one increment"""
+    next_loc = state.loc + state.unit_delta
+    next_cells = to_cells(next_loc)
+    leaving = active & np.any(next_cells != state.cells, axis=1)
+    # moving within the same cell never conflicts
+    staying = active & ~leaving
+    state.loc[staying] = next_loc[staying]
+
+    cand = np.flatnonzero(leaving)
+    if not len(cand):
+        return
+    target = next_cells[cand]
+    direction = target - state.cells[cand]
+    kind, mover = state.classify(target, leaving)
+
+    ok = (kind != _BLOCKED) & ~_cuts_corner(state, cand, direction, leaving)
+    # which candidate each candidate waits on (or -1)
+    cand_of_mover = np.full((len(state.objects),), -1)
+    cand_of_mover[cand] = np.arange(len(cand))
+    waits_on = np.where(kind == _MOVER, cand_of_mover[mover], -1)
+
+    # trace push chains for every pushing candidate at once
+    chain_len = np.zeros((len(cand),), np.int64)
+    pushing = np.flatnonzero(kind == _PUSHABLE)
+    walking = pushing
+    for k in range(1, max_push_chain + 1):
+        if not len(walking):
+            break
+        ahead, _ = state.classify(
+            target[walking] + k * direction[walking], leaving)
+        ends = ahead == _FREE
+        chain_len[walking[ends]] = k
+        ok[walking[(ahead != _FREE) & (ahead != _PUSHABLE)]] = False
+        walking = walking[ahead == _PUSHABLE]
+    ok[walking] = False
+
+    # same-target conflicts over every claimed cell
+    claim_cand = [np.flatnonzero(ok)]
+    claim_cells = [target[claim_cand[0]]]
+    for k in range(1, int(chain_len.max(initial=0)) + 1):
+        pushers = np.flatnonzero(ok & (chain_len >= k))
+        claim_cand.append(pushers)
+        claim_cells.append(target[pushers] + k * direction[pushers])
+    claim_cand = np.concatenate(claim_cand)
+    claim_lin = np.ravel_multi_index(
+        np.concatenate(claim_cells).T, state.shape)
+    # rank candidates: fastest first, then C order of current cell
+    rank = np.empty((len(cand),), np.int64)
+    rank[np.lexsort((state.lin[cand], -state.speed[cand]))] = \
+        np.arange(len(cand))
+    order = np.lexsort((rank[claim_cand], claim_lin))
+    claim_lin, claim_cand = claim_lin[order], claim_cand[order]
+    first = np.ones((len(claim_lin),), bool)
+    first[1:] = claim_lin[1:] != claim_lin[:-1]
+    winner = claim_cand[first][np.cumsum(first) - 1]
+    ok[claim_cand[winner != claim_cand]] = False
+
+    # movers following other movers succeed if those do
+    status = np.where(ok, np.where(waits_on < 0, 1, -1), 0)
+    while True:
+        pending = np.flatnonzero(status == -1)
+        resolved = pending[status[waits_on[pending]] != -1]
+        if not len(resolved):
+            break
+        status[resolved] = status[waits_on[resolved]]
+    # whatever is still pending waits in a cycle
+    ok = status == 1
+
+    # push rows forward, far end first
+    for i in np.flatnonzero(ok & (chain_len > 0)):
+        for k in range(chain_len[i] - 1, -1, -1):
+            _push_cell(state, target[i] + k * direction[i], direction[i])
+
+    moved = cand[ok]
+    profiler = state.env.profiler
+    if profiler is not None:
+        profiler.count("cells_traversed", len(moved))
+        pushed = chain_len[ok]
+        profiler.count("push_chains", int(np.count_nonzero(pushed)))
+        profiler.count("cells_pushed", int(pushed.sum()))
+    state.loc[moved] = next_loc[moved]
+    state.cells[moved] = next_cells[moved]
+    active[cand[~ok]] = False
+    state.reindex()
+
+def _cuts_corner(state, cand, direction, leaving) -> np.ndarray:
+    """returns bool np.ndarray of the candidates whose step
+    changes several axes at once and brushes past a cell
+    that is neither free nor being left"""
+    changed = direction != 0
+    cuts = np.zeros((len(cand),), bool)
+    diagonal = np.flatnonzero(changed.sum(axis=1) > 1)
+    if not len(diagonal):
+        return cuts
+    # every nonzero subset of the axes, as 0/1 rows
+    subsets = np.array(list(np.ndindex((2,) * direction.shape[1])))[1:]
+    changed = changed[diagonal]
+    # only the proper subsets of the axes a step changes
+    brushed = np.all(subsets[None] <= changed[:, None], axis=2) \
+        & (subsets.sum(axis=1)[None] < changed.sum(axis=1)[:, None])
+    step, subset = np.nonzero(brushed)
+    step = diagonal[step]
+    cells = state.cells[cand[step]] + direction[step] * subsets[subset]
+    kind, _ = state.classify(cells, leaving)
+    cuts[step[(kind != _FREE) & (kind != _MOVER)]] = True
+    return cuts
+
+def _push_cell(state, cell, direction):
+    """shift whatever is in cell one cell along direction.
+    The destination is known to be free"""
+    env = state.env
+    dest = cell + direction
+    mover = state.at(cell[None])[0]
+    if mover >= 0:
+        state.loc[mover] += direction
+        state.cells[mover] += direction
+        state.reindex()
+        return
+    cell, dest = tuple(cell.tolist()), tuple(dest.tolist())
+    moving_object = env.moving_object_at(cell)
+    if moving_object is not None:
+        env._move_object(moving_object, moving_object.loc + direction)
+        return
+    env.set_static_object(dest, env.static_objects[cell])
+    env.set_static_object(cell, OPERATIONS.encode([OPERATIONS.GOTHROUGH]))
@@ -0,0 +1,186 @@
+import numpy as np
+
+from . import vision
+
+class Pheromone_Field:
+
+    def __init__(self, world_size, channels=1, decay=0.05, diffusion=0.1,
+            deposit=1.0, min_concentration=1e-3):
+        """persistent pheromone trails. Unlike `SMAE.signal_field`,
+        which only holds a signal while its emitter stands on it,
+        concentrations stay behind, spread and evaporate
+
+        Every step (see `SMAE._update_pheromones`) all emitters
+        deposit at once, then every channel diffuses to the face
+        neighbours of its cells and decays. Both are array
+        stencils over the active box only: the smallest box
+        holding every non-zero concentration (grown by one cell
+        per step of diffusion)
+
+        An emitter signaling s in [1, channels] deposits into
+        channel s-1. Signal 0 (what everything starts out with)
+        and signals beyond channels deposit nothing, so channels
+        cost one float per cell each and nothing per emitter
+
+        args:
+            world_size: shape of the world
+            channels: number of pheromone channels (1 default)
+            decay: fraction of every concentration evaporating
+                each step (0.05 default). Scalar or one per channel
+            diffusion: fraction of every concentration spread
+                evenly over the cell's 2*D face neighbours each step
+                (0.1 default), in [0, 1]. Nothing leaks out of the
+                world. Scalar or one per channel
+            deposit: amount an emitter adds each step (1 default).
+                Scalar or one per channel
+            min_concentration: concentrations falling below this
+                are zeroed so that trails end (1e-3 default)
+        """
+        self.world_size = tuple(int(size) for size in world_size)
+        self.channels = int(channels)
+        self.decay = self._per_channel(decay, "decay")
+        self.diffusion = self._per_channel(diffusion, "diffusion")
+        self.deposit_amount = self._per_channel(deposit, "deposit")
+        self.min_concentration = float(min_concentration)
+        if np.any((self.decay < 0) | (self.decay > 1)):
+            raise ValueError("decay must be in [0, 1]")
+        if np.any((self.diffusion < 0) | (self.diffusion > 1)):
+            raise ValueError("diffusion must be in [0, 1]")
+        # (channels,)+world_size concentrations
+        self.field = np.zeros((self.channels,) + self.world_size, np.float32)
+        self._lo = np.zeros(len(self.world_size), np.int64)
+        self._hi = np.zeros(len(self.world_size), np.int64)
+
+    def _per_channel(self, value, name) -> np.ndarray:
+        value = np.asarray(value, dtype=np.float32)
+        if value.ndim == 0:
+            value = np.full((self.channels,), value)
+        if value.shape != (self.channels,):
+            raise ValueError("{} must be a scalar or one value per "
+                "channel".format(name))
+        return value
+
+    @property
+    def settings(self) -> dict:
+        """json-able keyword arguments recreating this field
+        (without its concentrations)"""
+        return {
+            "world_size": list(self.world_size),
+            "channels": self.channels,
+            "decay": self.decay.tolist(),
+            "diffusion": self.diffusion.tolist(),
+            "deposit": self.deposit_amount.tolist(),
+            "min_concentration": self.min_concentration,
+        }
+
+    @property
+    def active_box(self) -> tuple:
+        """returns tuple (lo, hi) of int np.ndarrays bounding
+        every non-zero concentration (lo == hi if none)"""
+        return self._lo.copy(), self._hi.copy()
+
+    def deposit(self, cells, channels, amounts=None):
+        """scatter deposits of many emitters at once. Several
+        deposits into one cell add up
+
+        args:
+            cells: int np.ndarray (N, D) of cells
+            channels: int np.ndarray (N,) of channels. Deposits
+                into cells outside of the world or channels
+                outside of [0, self.channels) are dropped
+            amounts: amount of every deposit. If `None` (default)
+                the channel's deposit amount
+        """
+        cells = np.asarray(cells, np.int64).reshape(
+            (-1, len(self.world_size)))
+        channels = np.broadcast_to(np.asarray(channels, np.int64),
+            (len(cells),))
+        keep = (channels >= 0) & (channels < self.channels) & np.all(
+            (cells >= 0) & (cells < np.array(self.world_size)), axis=1)
+        if not keep.any():
+            return
+        cells, channels = cells[keep], channels[keep]
+        amounts = self.deposit_amount[channels] if amounts is None \
+            else np.broadcast_to(np.asarray(amounts, np.float32),
+                keep.shape)[keep]
+        np.add.at(self.field, (channels,) + tuple(cells.T), amounts)
+        self._grow(cells.min(axis=0), cells.max(axis=0) + 1)
+
+    def step(self):
+        """diffuse and decay every channel once"""
+        if np.any(self._lo >= self._hi):
+            return
+        diffusing = bool(self.diffusion.any())
+        # concentrations spread one cell out of the box
+        lo = np.maximum(self._lo - diffusing, 0)
+        hi = np.minimum(self._hi + diffusing, self.world_size)
+        box = (slice(None),) + tuple(slice(a, b) for a, b in zip(lo, hi))
+        field = self.field[box]
+        scale = (slice(None),) + (None,) * len(self.world_size)
+
+        if diffusing:
+            # outside of the world every cell sees itself, so
+            # whatever it sends out there comes straight back
+            padded = np.pad(field, [(0, 0)] + [(1, 1)] * len(self.world_size),
+                mode="edge")
+            neighbours = np.zeros_like(field)
+            for axis in range(1, field.ndim):
+                for start in (0, 2):
+                    neighbours += padded[tuple(
+                        slice(start, start + size) if i == axis
+                        else slice(1, 1 + size) if i > 0 else slice(None)
+                        for i, size in enumerate(field.shape))]
+            field = (1 - self.diffusion)[scale] * field \
+                + (self.diffusion / (2 * len(self.world_size)))[scale] \
+                * neighbours
+        field *= (1 - self.decay)[scale]
+        field[field < self.min_concentration] = 0
+        self.field[box] = field
+
+        # shrink the box to what is left
+        self._lo[:], self._hi[:] = lo, lo
+        nonzero = np.any(field != 0, axis=0)
+        if nonzero.any():
+            for axis in range(nonzero.ndim):
+                used = np.flatnonzero(np.any(nonzero, axis=tuple(
+                    i for i in range(nonzero.ndim) if i != axis)))
+                self._lo[axis] = lo[axis] + used[0]
+                self._hi[axis] = lo[axis] + used[-1] + 1
+
+    def set_field(self, field):
+        """overwrite every concentration with field
+        ((channels,)+world_size)"""
+        self.field[...] = field
+        self._lo[:] = self._hi[:] = 0
+        cells = np.argwhere(np.any(self.field != 0, axis=0))
+        if len(cells):
+            self._lo[:] = cells.min(axis=0)
+            self._hi[:] = cells.max(axis=0) + 1
+
+    def clear(self):
+        """remove every trail"""
+        self.set_field(0)
+
+    def views(self, cells, buckets, vision_size) -> np.ndarray:
+        """egocentric views of every channel for many actors
+        (see `vision.gather`)
+
+        return: returns np.ndarray (N, channels)+vision_size
+        """
+        cells = np.asarray(cells, np.int64)
+        n = len(cells)
+        # one gather over (channel, cell) pairs
+        channel_cells = np.concatenate([
+            np.repeat(np.arange(self.channels), n)[:, None],
+            np.tile(cells, (self.channels, 1))], axis=1)
+        views = vision.gather(self.field, channel_cells,
+            np.tile(np.asarray(buckets), self.channels), vision_size)
+        return views.reshape((self.channels, n) + tuple(vision_size)) \
+            .swapaxes(0, 1)
+
+    def _grow(self, lo, hi):
+        if np.any(self._lo >= self._hi):
+            self._lo[:], self._hi[:] = lo, hi
+        else:
+            np.minimum(self._lo, lo, out=self._lo)
+            np.maximum(self._hi, hi, out=self._hi)
@@ -0,0 +1,349 @@
+import multiprocessing as mp
+import traceback
+from multiprocessing import shared_memory
+import numpy as np
+import gym
+
+from .actor import ACT_CONTINUOUS_LEN
+
+ALIGNMENT = 64 # byte alignment of every array in a `Shared_Buffers`
+
+def space_spec(space) -> tuple:
+    """shape and dtype of one sample of a gym space
+
+    args:
+        space: `gym.spaces.Box` or `gym.spaces.Discrete`
+
+    return: returns tuple (shape, np.dtype)
+    """
+    if isinstance(space, gym.spaces.Discrete):
+        return (), np.dtype(np.int64)
+    return tuple(space.shape), np.dtype(space.dtype)
+
+class Shared_Buffers:
+
+    def __init__(self, specs, name=None):
+        """named np.ndarrays packed into one block of shared memory
+
+        args:
+            specs: dict mapping array names to (shape, dtype)
+            name: name of an existing block to attach to (eg
+                `other.name` in a worker process). If `None`
+                (default) a new zeroed block is created
+        """
+        self.specs = {key: (tuple(shape), np.dtype(dtype))
+            for key, (shape, dtype) in specs.items()}
+        offsets = {}
+        size = 0
+        for key, (shape, dtype) in self.specs.items():
+            offsets[key] = size
+            nbytes = int(np.prod(shape, dtype=np.int64)) * dtype.itemsize
+            size += -(-nbytes // ALIGNMENT) * ALIGNMENT
+        self._owner = name is None
+        self._shm = shared_memory.SharedMemory(
+            name=name, create=self._owner, size=max(size, 1))
+        self.arrays = {key: np.ndarray(shape, dtype,
+                buffer=self._shm.buf, offset=offsets[key])
+            for key, (shape, dtype) in self.specs.items()}
+        if self._owner:
+            for array in self.arrays.values():
+                array.fill(0)
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    def __getitem__(self, key):
+        return self.arrays[key]
+
+    def close(self):
+        """detach (and free, if this process created the block)"""
+        self.arrays = {}
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+def _worker(conn, make_env, env_indices, specs, name):
+    """worker process loop. Hosts the envs `env_indices`
+    and answers "reset", "step" and "close" commands"""
+    buffers = Shared_Buffers(specs, name=name)
+    obs_keys = [key for key in specs if key.startswith("OBS_")]
+    n_rows = specs["alive"][0][1]
+    envs = {}
+    # <actor_id, buffer row> of every actor of every env
+    # since its last reset
+    rows = {}
+
+    def write_obs(i, obs, env_rows):
+        for key in obs_keys:
+            buffers[key][i, env_rows] = obs[key].reshape(
+                (len(env_rows),) + specs[key][0][2:])
+
+    def add_actors(i, actor_ids):
+        """give actor_ids the next unused rows of env i"""
+        if len(rows[i]) + len(actor_ids) > n_rows:
+            raise RuntimeError("env {} had more than max_actors={} "
+                "actors since its last reset".format(i, n_rows))
+        env_rows = list(range(len(rows[i]), len(rows[i]) + len(actor_ids)))
+        rows[i].update(zip(actor_ids, env_rows))
+        write_obs(i, envs[i].egocentric_obs_batch(
+            [envs[i].actors[actor_id] for actor_id in actor_ids]), env_rows)
+        buffers["alive"][i, env_rows] = True
+        buffers["done"][i, env_rows] = False
+        buffers["rewards"][i, env_rows] = 0
+
+    try:
+        while True:
+            command = conn.recv()
+            if command == "close":
+                break
+            for i in env_indices:
+                if command == "reset":
+                    envs[i] = make_env(i)
+                    rows[i] = {}
+                    buffers["alive"][i] = False
+                    buffers["done"][i] = False
+                    buffers["rewards"][i] = 0
+                    add_actors(i, list(envs[i].actors))
+                elif command == "step":
+                    env = envs[i]
+                    env_rows = [rows[i][actor_id]
+                        for actor_id in env.batch_ids]
+                    obs, r, done, _ = env.step_batch(
+                        buffers["actions"][i, env_rows],
+                        buffers["signals"][i, env_rows])
+                    write_obs(i, obs, env_rows)
+                    buffers["rewards"][i, env_rows] = r
+                    buffers["done"][i, env_rows] = done
+                    buffers["alive"][i, env_rows] = ~done
+                    born = [actor_id for actor_id in env.actors
+                        if actor_id not in rows[i]]
+                    if born:
+                        add_actors(i, born)
+            conn.send(None)
+    except Exception:
+        conn.send(traceback.format_exc())
+    finally:
+        buffers.close()
+        conn.close()
+
+class Worker_Pool:
+
+    def __init__(self, specs, context=None):
+        """shared memory buffers and worker processes driven by
+        short commands over pipes. Subclasses start the workers
+        with `self._start_worker`. Every worker answers each
+        command with `None` or a formatted traceback
+
+        args:
+            specs: `Shared_Buffers` specs. Must include
+                "actions", "signals", "rewards", "done" and
+                "alive" next to the OBS_ buffers
+            context: multiprocessing context or start method.
+                Defaults to the platform default
+        """
+        self.buffers = Shared_Buffers(specs)
+        if context is None or isinstance(context, str):
+            context = mp.get_context(context)
+        self.context = context
+        self._conns = []
+        self._workers = []
+        self._waiting = False
+        self.closed = False
+
+    @property
+    def obs(self) -> dict:
+        """returns dict mapping each OBS_ key to its shared buffer"""
+        return {key: array for key, array in self.buffers.arrays.items()
+            if key.startswith("OBS_")}
+
+    @property
+    def actions(self) -> np.ndarray:
+        """shared ACT_CONTINUOUS action buffer. Write actions
+        here in place to avoid a copy in `step_async`"""
+        return self.buffers["actions"]
+
+    @property
+    def signals(self) -> np.ndarray:
+        """shared ACT_SIGNAL buffer"""
+        return self.buffers["signals"]
+
+    @property
+    def rewards(self) -> np.ndarray:
+        return self.buffers["rewards"]
+
+    @property
+    def done(self) -> np.ndarray:
+        return self.buffers["done"]
+
+    @property
+    def alive(self) -> np.ndarray:
+        return self.buffers["alive"]
+
+    def step(self, actions=None, signals=None):
+        """step and wait for the results
+
+        return: returns tuple (obs, rewards, done, alive) of
+            the shared buffers. They are overwritten by the
+            next step; copy anything that should be kept"""
+        self.step_async(actions, signals)
+        return self.step_wait()
+
+    def step_async(self, actions=None, signals=None):
+        """start stepping and return immediately
+
+        args:
+            actions: ACT_CONTINUOUS actions shaped like
+                `self.actions`. If `None` (default)
+                `self.actions` is used as is
+            signals: ACT_SIGNAL actions shaped like
+                `self.signals`. If `None` (default)
+                `self.signals` is used as is
+        """
+        assert not self._waiting, "step_wait before stepping again"
+        if actions is not None:
+            self.actions[...] = actions
+        if signals is not None:
+            self.signals[...] = signals
+        self._send("step")
+        self._waiting = True
+
+    def poll(self) -> bool:
+        """returns True once `step_wait` would not block"""
+        return all(conn.poll() for conn in self._conns)
+
+    def step_wait(self):
+        """wait for the step started by `step_async`
+
+        return: see `step`"""
+        assert self._waiting, "step_async was not called"
+        self._waiting = False
+        self._wait()
+        return self.obs, self.rewards, self.done, self.alive
+
+    def close(self):
+        """stop the workers and free the shared buffers"""
+        if self.closed:
+            return
+        self.closed = True
+        if self._waiting:
+            self._waiting = False
+            self._wait()
+        for conn in self._conns:
+            try:
+                conn.send("close")
+            except (BrokenPipeError, OSError):
+                # the worker already stopped after an error
+                pass
+        for conn, worker in zip(self._conns, self._workers):
+            worker.join()
+            conn.close()
+        self.buffers.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _abort(self):
+        """clean up after a failure before the pool could be
+        handed out (eg while starting workers): terminate the
+        workers, which may be stuck waiting for a command, and
+        free the shared buffers"""
+        self.closed = True
+        self._waiting = False
+        for conn, worker in zip(self._conns, self._workers):
+            worker.terminate()
+            worker.join()
+            conn.close()
+        self.buffers.close()
+
+    def _start_worker(self, target, *args):
+        """start `target(conn, *args)` in a new process"""
+        conn, worker_conn = self.context.Pipe()
+        worker = self.context.Process(target=target, daemon=True,
+            args=(worker_conn,) + args)
+        worker.start()
+        worker_conn.close()
+        self._conns.append(conn)
+        self._workers.append(worker)
+
+    def _send(self, command):
+        for conn in self._conns:
+            conn.send(command)
+
+    def _wait(self):
+        errors = [error for error in (conn.recv() for conn in self._conns)
+            if error is not None]
+        if errors:
+            raise RuntimeError("worker failed:\n" + errors[0])
+
+class Env_Pool(Worker_Pool):
+
+    def __init__(self, make_env, n_envs, n_workers=None, context=None,
+            max_actors=None):
+        """host many `SMAE`s in worker processes. Actions,
+        observations, rewards and dones are exchanged through
+        preallocated shared memory buffers; only tiny commands
+        travel over pipes
+
+        Buffers are indexed (env, row). Row r of env i belongs
+        to the r-th actor of env i as of its last reset. Actors
+        born later (eg through `SMAE.queue_birth`) take the next
+        unused rows in the order of `env.actors`, starting with
+        the observations after the step they were born in. Rows
+        of actors that died are no longer `alive` and their
+        actions are ignored. Rows are only reused after a reset
+
+        args:
+            make_env: picklable callable (eg a module level
+                function) mapping an env index to a new `SMAE`.
+                Every env must start with the same number of actors
+                sharing one observation space
+            n_envs: number of envs M
+            n_workers: number of processes. Defaults to the
+                number of cpus (but never more than M). Envs are
+                split into contiguous runs across workers
+            context: multiprocessing context or start method.
+                Defaults to the platform default
+            max_actors: number of rows per env, ie how many
+                actors an env may have had since its last reset.
+                Defaults to the number of actors env 0 starts
+                with, so no births. Stepping an env past it
+                raises `RuntimeError`
+        """
+        probe = make_env(0)
+        actors = list(probe.actors.values())
+        self.n_envs = n_envs
+        self.n_actors = len(actors) if max_actors is None else max_actors
+        self.n_workers = min(n_envs, n_workers or mp.cpu_count())
+        batch = (n_envs, self.n_actors)
+        specs = {key: (batch + shape, dtype)
+            for key, (shape, dtype) in (
+                (key, space_spec(space)) for key, space
+                in actors[0].observation_space.spaces.items())}
+        specs.update({
+            "actions": (batch + (ACT_CONTINUOUS_LEN,), np.float64),
+            "signals": (batch, np.int64),
+            "rewards": (batch, np.float64),
+            "done": (batch, bool),
+            "alive": (batch, bool),
+        })
+        super(Env_Pool, self).__init__(specs, context=context)
+        try:
+            for env_indices in np.array_split(
+                    np.arange(n_envs), self.n_workers):
+                self._start_worker(_worker, make_env, env_indices.tolist(),
+                    specs, self.buffers.name)
+        except BaseException:
+            self._abort()
+            raise
+
+    def reset(self) -> dict:
+        """build fresh envs in every worker
+
+        return: returns `self.obs` shaped (M, A, ...)"""
+        self._send("reset")
+        self._wait()
+        return self.obs
@@ -0,0 +1,151 @@
+import numpy as np
+
+HEALTH_ENERGY_SCALE = 50.0 # energy at which health reaches 1-1/e
+REWARD_ENERGY_SCALE = 10.0 # energy gain at which reward reaches tanh(1)
+
+# name: (per row shape, dtype) of every column kept by a `Population`
+COLUMNS = {
+    "loc": ((3,), np.float64),
+    "orientation": ((), np.float64),
+    "energy": ((), np.float64),
+    "prev_energy": ((), np.float64),
+    "reward": ((), np.float64),
+    "signal": ((), np.int64),
+    "storage_count": ((), np.int64),
+    "storage_capacity": ((), np.int64),
+    "max_forward_speed": ((), np.float64),
+    "world": ((), np.int64), # which env the actor is in
+}
+
+def energy_to_health(energy):
+    """health saturates at unity
+
+    health = 1-exp(-energy/50.0)
+
+    args:
+        energy: float or np.ndarray of energies
+
+    return: returns health of the same shape
+    """
+    return 1 - np.exp(-np.asarray(energy) / HEALTH_ENERGY_SCALE)
+
+class Population:
+
+    def __init__(self, capacity=16):
+        """struct-of-arrays store for actor state. Every
+        actor owns one row and every column is a contiguous
+        np.ndarray so that per-step actor logic can run
+        as single array operations over the whole colony
+
+        args:
+            capacity: number of rows to preallocate. The
+                store grows (doubling) when it runs out
+        """
+        self.capacity = 0
+        self.columns = {name: np.zeros((0,)+shape, dtype)
+            for name, (shape, dtype) in COLUMNS.items()}
+        self.alive = np.zeros((0,), bool)
+        self.owners = []
+        self._free_rows = []
+        self._grow(max(capacity, 1))
+
+    def __len__(self):
+        return int(np.count_nonzero(self.alive))
+
+    def __getattr__(self, name):
+        # columns are also accessible as attributes,
+        # e.g. `population.energy`
+        columns = self.__dict__.get("columns", {})
+        if name in columns:
+            return columns[name]
+        raise AttributeError(name)
+
+    @property
+    def rows(self) -> np.ndarray:
+        """returns int array of rows currently in use"""
+        return np.flatnonzero(self.alive)
+
+    def allocate(self, owner=None, **values) -> int:
+        """claim a free row
+
+        args:
+            owner: object the row belongs to (usually an `Actor`)
+            values: initial column values for the row. Columns
+                not mentioned are zeroed
+
+        return: returns the row index
+        """
+        if not self._free_rows:
+            self._grow(2 * self.capacity)
+        row = self._free_rows.pop()
+        for name, column in self.columns.items():
+            column[row] = values.get(name, 0)
+        self.alive[row] = True
+        self.owners[row] = owner
+        return row
+
+    def release(self, row):
+        """return a row to the pool of free rows
+
+        return: returns dict of the row's final column values"""
+        values = self.row_values(row)
+        self.alive[row] = False
+        self.owners[row] = None
+        self._free_rows.append(row)
+        return values
+
+    def row_values(self, row) -> dict:
+        """returns dict copy of every column value in row"""
+        return {name: column[row].copy()
+            for name, column in self.columns.items()}
+
+    def health(self, rows=None):
+        """health of rows (see `energy_to_health`)
+
+        args:
+            rows: int or int array of rows. If `None`
+                (default), all rows in use
+
+        return: returns health of rows
+        """
+        rows = self.rows if rows is None else rows
+        return energy_to_health(self.energy[rows])
+
+    def consume(self, energy, rows=None) -> np.ndarray:
+        """subtract energy from every row in rows
+
+        return: returns int array of the rows whose energy
+            is now exhausted"""
+        rows = self.rows if rows is None else rows
+        self.energy[rows] -= energy
+        return rows[self.energy[rows] <= 0]
+
+    def update_rewards(self, rows=None):
+        """Non-idempotent reward logic for all rows at once
+        - calculates change in energy by prev_energy and energy
+        - updates reward with tanh(change in energy / 10.0)
+        - replaces prev_energy with energy
+
+        args:
+            rows: int or int array of rows. If `None`
+                (default), all rows in use
+        """
+        rows = self.rows if rows is None else rows
+        energy_gain = self.energy[rows] - self.prev_energy[rows]
+        self.reward[rows] = np.tanh(energy_gain / REWARD_ENERGY_SCALE)
+        self.prev_energy[rows] = self.energy[rows]
+
+    def _grow(self, capacity):
+        """reallocate every column with `capacity` rows"""
+        for name, column in self.columns.items():
+            grown = np.zeros((capacity,)+column.shape[1:], column.dtype)
+            grown[:self.capacity] = column
+            self.columns[name] = grown
+        alive = np.zeros((capacity,), bool)
+        alive[:self.capacity] = self.alive
+        self.alive = alive
+        self.owners.extend([None] * (capacity - self.capacity))
+        # pop() hands out the lowest free rows first
+        self._free_rows = list(range(capacity-1, self.capacity-1, -1)) \
+            + self._free_rows
+        self.capacity = capacity
@@ -0,0 +1,123 @@
+import contextlib
+import json
+import logging
+import time
+import tracemalloc
+
+# what `MA_Gym_Env._phase` hands out when there is no profiler
+NO_PHASE = contextlib.nullcontext()
+
+class _Phase:
+
+    def __init__(self, profiler, name):
+        """reusable context manager timing one phase"""
+        self.profiler = profiler
+        self.name = name
+        self.calls = 0
+        self.ns = 0
+        self.memory_delta = 0
+        self._start = 0
+        self._memory = 0
+
+    def __enter__(self):
+        if self.profiler.track_allocations:
+            self._memory = tracemalloc.get_traced_memory()[0]
+        self._start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.ns += time.perf_counter_ns() - self._start
+        self.calls += 1
+        if self.profiler.track_allocations:
+            self.memory_delta += tracemalloc.get_traced_memory()[0] \
+                - self._memory
+        return False
+
+class Profiler:
+
+    def __init__(self, log_every=None, logger=None, track_allocations=False):
+        """per phase timers and event counters of an env's step
+        loop. Give it to an env (`SMAE(profiler=...)` or
+        `env.profiler = ...`); envs without one skip all of
+        this at the cost of an attribute check
+
+        Phases (see `snapshot`) are "apply_actions", "gravity",
+        "update_actors", "combined_object_ops", "signal_field",
+        "pheromones", "births_deaths", "recording" and
+        "observations". Counters are
+        "cells_traversed" (cells movers entered),
+        "cells_classified" (cells movement looked into),
+        "push_chains" and "cells_pushed", "moving_object_lookups",
+        "actors_added" and "actors_removed"
+
+        args:
+            log_every: log the stats of the last log_every steps
+                as a JSON message every log_every steps. If
+                `None` (default) nothing is logged
+            logger: `logging.Logger` to log to. Defaults to
+                the "smae.profiling" logger
+            track_allocations: if True, also sum the net memory
+                allocated within every phase. Starts `tracemalloc`
+                (which slows everything down) unless it is
+                already tracing
+        """
+        self.log_every = log_every
+        self.logger = logging.getLogger("smae.profiling") \
+            if logger is None else logger
+        self.track_allocations = track_allocations
+        if track_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.steps = 0
+        self.counters = {}
+        self._phases = {}
+        self._logged = None
+
+    def phase(self, name) -> _Phase:
+        """returns context manager adding its time to phase name"""
+        phase = self._phases.get(name)
+        if phase is None:
+            phase = self._phases[name] = _Phase(self, name)
+        return phase
+
+    def count(self, name, n=1):
+        """add n to counter name"""
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def step_done(self):
+        """called by the env after every step"""
+        self.steps += 1
+        if self.log_every and self.steps % self.log_every == 0:
+            stats = self.snapshot()
+            interval = stats if self._logged is None \
+                else difference(stats, self._logged)
+            self._logged = stats
+            self.logger.info(json.dumps(interval),
+                extra={"smae_stats": interval})
+
+    def snapshot(self) -> dict:
+        """returns dict of the totals so far: "steps", "phases"
+        mapping every phase to its "calls", "seconds" (and
+        "memory_delta" in bytes if allocations are tracked)
+        and "counters" mapping every counter to its count"""
+        phases = {}
+        for name, phase in self._phases.items():
+            phases[name] = {"calls": phase.calls, "seconds": phase.ns * 1e-9}
+            if self.track_allocations:
+                phases[name]["memory_delta"] = phase.memory_delta
+        return {"steps": self.steps, "phases": phases,
+            "counters": dict(self.counters)}
+
+    def reset(self):
+        """start counting from zero"""
+        self.steps = 0
+        self.counters = {}
+        self._phases = {}
+        self._logged = None
+
+def difference(after, before):
+    """returns snapshot after minus snapshot before"""
+    if isinstance(after, dict):
+        return {key: difference(value, before.get(key, 0)
+            if isinstance(before, dict) else 0)
+            for key, value in after.items()}
+    return after - before
@@ -0,0 +1,368 @@
+import os
+import queue
+import threading
+import numpy as np
+
+from .actor import _to_numpy, ACT_CONTINUOUS, ACT_SIGNAL, ACT_CONTINUOUS_LEN
+from .env import SMAE
+from . import checkpoint
+
+# world arrays a keyframe stores in full
+WORLD_ARRAYS = ["static_objects", "combined_object_ops", "signal_field"]
+
+class Recorder:
+
+    def __init__(self, env, path, keyframe_interval=64, max_queue=64):
+        """stream the trajectory of an `SMAE` to path while it
+        steps. Every step becomes one record (see
+        `checkpoint.write_arrays`): every keyframe_interval steps
+        a keyframe holding the whole state, in between deltas
+        holding only the static voxels that changed, the actor
+        rows whose values changed (per column) and the moving
+        objects if any of them changed (and the active box of
+        the env's pheromones, if any). Every record also holds
+        the actions that led to it
+
+        Keyframes are full snapshots (`checkpoint.env_state`).
+        For deltas the stepping thread only copies the actor
+        columns, the non-empty storage, the other moving objects
+        and the changed voxels; diffing, encoding and writing
+        happen on a background thread
+
+        Step 0 is the state when recording starts. The env calls
+        `record` after every `step`/`step_batch` until `close`
+
+        args:
+            env: `SMAE` to record. Actor ids must be ints or strs
+            path: file to write
+            keyframe_interval: steps between keyframes (64 default).
+                `reset` and direct writes to `env.static_objects`
+                (followed by `rebuild_combined_object_ops`) also
+                force a keyframe
+            max_queue: records that may wait for the writer
+                before `record` blocks
+        """
+        self.env = env
+        self.path = path
+        self.keyframe_interval = keyframe_interval
+        self.steps = 0
+        self.closed = False
+        # whether step 0 was queued yet
+        self._started = False
+        # (ids, vision sizes) of the last delta's actors
+        self._vision_size = (None, None)
+        # actor state of the last record (writer thread only)
+        self._previous = None
+        self._error = None
+        self._file = open(path, "wb")
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._write, daemon=True)
+        self._thread.start()
+        self._static_changes = env.watch_static()
+        env.recorder = self
+        self._record_frame(None)
+
+    def record(self, a_n):
+        """queue the step env just took
+
+        args:
+            a_n: the actions of the step. Either the dict given
+                to `step` or the (actions, signals) tuple given
+                to `step_batch`
+        """
+        if isinstance(a_n, dict):
+            ids = list(a_n)
+            actions = np.array([_to_numpy(a[ACT_CONTINUOUS])
+                for a in a_n.values()], dtype=float)
+            signals = np.array([_to_numpy(a[ACT_SIGNAL])
+                for a in a_n.values()], dtype=np.int64)
+        else:
+            ids = list(self.env.origonal_actors)
+            actions, signals = a_n
+        self.steps += 1
+        # copied: callers may reuse their action buffers
+        self._record_frame((ids,
+            np.array(actions, dtype=float).reshape(
+                (len(ids), ACT_CONTINUOUS_LEN)),
+            np.array(signals, dtype=np.int64).reshape((len(ids),))))
+
+    def close(self):
+        """stop recording and wait until everything is written"""
+        if self.closed:
+            return
+        self.closed = True
+        self.env.recorder = None
+        self.env.unwatch_static(self._static_changes)
+        self._queue.put(None)
+        self._thread.join()
+        self._file.close()
+        self._raise()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _record_frame(self, acted):
+        """queue a record of the env's current state. acted is
+        `None` or (ids, actions, signals)
+
+        Only copies are made here. Keyframes come from
+        `checkpoint.env_state`; for deltas the actor columns, the
+        storage of actors holding something and the other moving
+        objects are copied, and the writer thread diffs them
+        against the previous record"""
+        self._raise()
+        env = self.env
+        changes = self._static_changes.take()
+        keyframe = not self._started or changes is None \
+            or self.steps % self.keyframe_interval == 0
+        self._started = True
+
+        if keyframe:
+            header, arrays = checkpoint.env_state(env)
+            # the env keeps writing to its arrays
+            for name in WORLD_ARRAYS + ["pheromones"]:
+                if name in arrays:
+                    arrays[name] = np.array(arrays[name])
+        else:
+            ids = list(env.actors)
+            actors = list(env.actors.values())
+            columns = env._actor_columns(actors)
+            header = {"actor_ids": ids}
+            arrays = {"actor_" + name: columns[name]
+                for name in checkpoint.ACTOR_COLUMNS}
+            arrays["storage"] = checkpoint.storage_array(actors, columns)
+            # vision sizes only change with the actors
+            if self._vision_size[0] != ids:
+                self._vision_size = (ids, np.array(
+                    [actor.vision_size for actor in actors],
+                    np.int64).reshape((len(actors), 3)))
+            arrays["vision_size"] = self._vision_size[1]
+            arrays["objects"] = checkpoint.object_array(env)
+            cells = np.array(changes, np.int64).reshape(
+                (-1, len(env.world_size)))
+            arrays["static_cells"] = cells
+            arrays["static_ops"] = np.asarray(
+                env.static_objects[tuple(cells.T)])
+            if env.pheromones is not None:
+                # nothing outside of the active box
+                lo, hi = env.pheromones.active_box
+                arrays["pheromone_lo"] = lo
+                arrays["pheromones"] = env.pheromones.field[(slice(None),)
+                    + tuple(slice(a, b) for a, b in zip(lo, hi))].copy()
+
+        header.update(step=self.steps, keyframe=keyframe)
+        self._queue.put((header, arrays, acted))
+
+    def _encode(self, header, arrays, acted) -> tuple:
+        """turn a queued state into the record to write (on the
+        writer thread)"""
+        if header["keyframe"]:
+            current = {name: arrays[name]
+                for name in checkpoint.ACTOR_ARRAYS + ["objects"]}
+            current["ids"] = header["actor_ids"]
+        else:
+            current = {name: arrays.pop(name)
+                for name in checkpoint.ACTOR_ARRAYS + ["objects"]}
+            current["ids"] = checkpoint.json_ids(header.pop("actor_ids"))
+            previous = self._previous
+            if current["ids"] != previous["ids"]:
+                header["actor_ids"] = current["ids"]
+            index = {actor_id: row
+                for row, actor_id in enumerate(previous["ids"])}
+            matched = np.array([index.get(actor_id, -1)
+                for actor_id in current["ids"]], np.int64)
+            for name in checkpoint.ACTOR_ARRAYS:
+                rows = changed_rows(current[name], previous[name], matched)
+                # columns nobody changed are left out
+                if len(rows):
+                    arrays[name + "_rows"] = rows.astype(np.int32)
+                    arrays[name] = current[name][rows]
+            if current["objects"].shape != previous["objects"].shape \
+                or not np.array_equal(current["objects"],
+                    previous["objects"]):
+                arrays["objects"] = current["objects"]
+        if acted is not None:
+            ids, actions, signals = acted
+            ids = checkpoint.json_ids(ids)
+            # usually the actors of the last record
+            if ids != self._previous["ids"]:
+                header["action_ids"] = ids
+            arrays["actions"] = actions
+            arrays["signals"] = signals
+        self._previous = current
+        return header, arrays
+
+    def _write(self):
+        """writer thread loop"""
+        while True:
+            record = self._queue.get()
+            if record is None:
+                break
+            if self._error is None:
+                try:
+                    checkpoint.write_arrays(self._file,
+                        *self._encode(*record))
+                except Exception as error:
+                    self._error = error
+
+    def _raise(self):
+        if self._error is not None:
+            raise RuntimeError("writing {} failed".format(self.path)) \
+                from self._error
+
+def changed_rows(current, previous, matched) -> np.ndarray:
+    """rows of current that differ from the previous rows they
+    were matched with (or have no match)
+
+    args:
+        current: np.ndarray (N, ...) of per actor values
+        previous: np.ndarray (M, ...) of earlier values
+        matched: int np.ndarray (N,) of the row of previous
+            each row of current was matched with, or -1
+
+    return: returns int np.ndarray of rows
+    """
+    if current.shape[1:] != previous.shape[1:]:
+        return np.arange(len(current))
+    changed = matched < 0
+    same = np.flatnonzero(~changed)
+    width = int(np.prod(current.shape[1:]))
+    changed[same] = np.any((current[same] != previous[matched[same]])
+        .reshape((len(same), width)), axis=1)
+    return np.flatnonzero(changed)
+
+class Replayer:
+
+    def __init__(self, path):
+        """read a recording written by a `Recorder`. Any step
+        can be rebuilt from the keyframe before it and the
+        deltas in between; nothing is simulated again. Reading
+        forward from the last step rebuilt only applies the
+        new deltas
+
+        args:
+            path: recording to read
+        """
+        self.path = path
+        # <header, file offset> of every record
+        self._records = []
+        size = os.path.getsize(path)
+        with open(path, "rb") as f:
+            offset = 0
+            while offset < size:
+                header, _, end = checkpoint.read_header(f, offset)
+                self._records.append((header, offset))
+                offset = end
+        # (step, header, arrays) last rebuilt
+        self._cursor = None
+
+    def __len__(self):
+        """returns number of recorded steps (including step 0)"""
+        return len(self._records)
+
+    def actor_ids(self, step) -> list:
+        """returns list of the ids of the actors at step"""
+        for header, _ in reversed(self._records[:step+1]):
+            if "actor_ids" in header:
+                return header["actor_ids"]
+
+    def actions(self, step) -> tuple:
+        """the actions that led from step-1 to step
+
+        return: returns tuple (ids, actions, signals) where
+            actions is np.ndarray (N, ACT_CONTINUOUS_LEN) and
+            signals is np.ndarray (N,)
+        """
+        if step == 0:
+            raise ValueError("step 0 has no actions")
+        header, arrays = self._read(step, mmap_mode=None)
+        ids = header["action_ids"] if "action_ids" in header \
+            else self.actor_ids(step - 1)
+        return ids, arrays["actions"], arrays["signals"]
+
+    def state(self, step) -> tuple:
+        """the state at step in the form of `checkpoint.env_state`
+        (without "combined_object_ops" or "signal_field" unless
+        step is a keyframe). Arrays may be shared with the
+        replayer; copy them before writing
+
+        return: returns tuple (header, dict of np.ndarrays)
+        """
+        if not 0 <= step < len(self):
+            raise IndexError("step {} was not recorded".format(step))
+        keyframe = max(i for i in range(step+1)
+            if self._records[i][0]["keyframe"])
+        if self._cursor is not None and keyframe <= self._cursor[0] <= step:
+            at, header, arrays = self._cursor
+        else:
+            at = keyframe
+            header, arrays = self._read(keyframe)
+        for i in range(at+1, step+1):
+            header, arrays = apply_delta(header, arrays,
+                *self._read(i, mmap_mode=None))
+        self._cursor = (step, header, arrays)
+        return header, arrays
+
+    def env(self, step, cls=SMAE):
+        """rebuild the env as it was at step
+
+        args:
+            step: step to rebuild
+            cls: `SMAE` subclass to build (`SMAE` default)
+
+        return: returns a new cls
+        """
+        header, arrays = self.state(step)
+        # the env writes to its arrays; start over next time
+        self._cursor = None
+        return checkpoint.build_env(header, arrays, cls, global_rng=False)
+
+    def observations(self, step) -> dict:
+        """observations of every actor at step (see
+        `SMAE.egocentric_obs_batch`), rows ordered like
+        `self.actor_ids(step)`"""
+        # building an env leaves the arrays as they were
+        env = checkpoint.build_env(*self.state(step), SMAE,
+            global_rng=False)
+        return env.egocentric_obs_batch()
+
+    def _read(self, step, mmap_mode="c") -> tuple:
+        header, arrays, _ = checkpoint.read_arrays(self.path,
+            mmap_mode=mmap_mode, offset=self._records[step][1])
+        return header, arrays
+
+def apply_delta(header, arrays, delta_header, delta) -> tuple:
+    """move a state (see `Replayer.state`) one step forward.
+    `arrays["static_objects"]` is changed in place
+
+    return: returns tuple (header, arrays) of the next step"""
+    arrays = {name: array for name, array in arrays.items()
+        if name not in ("combined_object_ops", "signal_field")}
+    cells = delta["static_cells"]
+    arrays["static_objects"][tuple(cells.T)] = delta["static_ops"]
+    ids = delta_header.get("actor_ids", header["actor_ids"])
+    index = {actor_id: row for row, actor_id in enumerate(header["actor_ids"])}
+    matched = np.array([index.get(actor_id, -1) for actor_id in ids],
+        np.int64)
+    kept = matched >= 0
+    for name in checkpoint.ACTOR_ARRAYS:
+        previous = arrays[name]
+        values = delta.get(name, previous[:0])
+        array = np.zeros((len(ids),) + values.shape[1:], values.dtype)
+        if previous.shape[1:] == values.shape[1:]:
+            array[kept] = previous[matched[kept]]
+        if name in delta:
+            array[delta[name + "_rows"]] = values
+        arrays[name] = array
+    if "objects" in delta:
+        arrays["objects"] = delta["objects"]
+    if "pheromone_lo" in delta:
+        pheromones = np.zeros(arrays["pheromones"].shape, np.float32)
+        box = delta["pheromones"]
+        pheromones[(slice(None),) + tuple(slice(a, a + size) for a, size
+            in zip(delta["pheromone_lo"], box.shape[1:]))] = box
+        arrays["pheromones"] = pheromones
+    return dict(header, actor_ids=ids), arrays
@@ -0,0 +1,102 @@
+class Entity_Registry:
+
+    def __init__(self, entities=()):
+        """dense collection of entities (moving objects) with
+        O(1) add, remove and membership tests. Every entity
+        gets an integer handle that stays the same for as long
+        as it is registered; handles of removed entities are
+        handed out again (free list)
+
+        Iterating and indexing go over a dense list, so they
+        are as cheap as a list's. Removing moves the last
+        entity into the hole, so the order is only the order
+        of insertion until something is removed
+
+        args:
+            entities: entities to start with
+        """
+        self._dense = []
+        # handle of every dense position
+        self._handles = []
+        # dense position of every handle (-1 if free)
+        self._positions = []
+        # <entity, handle>
+        self._index = {}
+        self._free = []
+        for entity in entities:
+            self.add(entity)
+
+    def __len__(self):
+        return len(self._dense)
+
+    def __iter__(self):
+        return iter(self._dense)
+
+    def __getitem__(self, i):
+        return self._dense[i]
+
+    def __contains__(self, entity):
+        return entity in self._index
+
+    def __repr__(self):
+        return "Entity_Registry({!r})".format(self._dense)
+
+    def add(self, entity) -> int:
+        """register entity
+
+        return: returns its handle"""
+        if entity in self._index:
+            raise ValueError("{!r} is already registered".format(entity))
+        if self._free:
+            handle = self._free.pop()
+        else:
+            handle = len(self._positions)
+            self._positions.append(-1)
+        self._positions[handle] = len(self._dense)
+        self._dense.append(entity)
+        self._handles.append(handle)
+        self._index[entity] = handle
+        return handle
+
+    def remove(self, entity) -> int:
+        """unregister entity (`KeyError` if it is not registered)
+
+        return: returns the handle it had"""
+        handle = self._index.pop(entity)
+        position = self._positions[handle]
+        # fill the hole with the last entity
+        last, last_handle = self._dense.pop(), self._handles.pop()
+        if position < len(self._dense):
+            self._dense[position] = last
+            self._handles[position] = last_handle
+            self._positions[last_handle] = position
+        self._positions[handle] = -1
+        self._free.append(handle)
+        return handle
+
+    def discard(self, entity):
+        """`remove` entity if it is registered"""
+        if entity in self._index:
+            self.remove(entity)
+
+    def handle(self, entity) -> int:
+        """returns handle of entity (`KeyError` if unregistered)"""
+        return self._index[entity]
+
+    def get(self, handle):
+        """returns the entity with handle or `None`"""
+        if 0 <= handle < len(self._positions) \
+            and self._positions[handle] >= 0:
+            return self._dense[self._positions[handle]]
+        return None
+
+    def copy(self):
+        """returns an independent registry with the same
+        entities under the same handles"""
+        copy = Entity_Registry()
+        copy._dense = list(self._dense)
+        copy._handles = list(self._handles)
+        copy._positions = list(self._positions)
+        copy._index = dict(self._index)
+        copy._free = list(self._free)
+        return copy
@@ -0,0 +1,307 @@
+import os
+import queue
+import threading
+import numpy as np
+
+from .actor import Actor, VOCAB_SIZE
+from .elements import OPERATIONS, Signaling_Moving_Object, to_cells
+
+WHITE = (255, 255, 255, 255)
+MOVING_COLOR = (128, 32, 16, 255) # brown
+ACTOR_CHANNEL = 2 # actors are blue
+SIGNALING_CHANNEL = 1 # other signaling objects are green
+
+def static_color(ops) -> tuple:
+    """color of a static object. Colors by first match:
+     - EATable: yellow
+     - PICK_UP and PUSH_OVER: red-orange
+     - PUSH_OVER: orange
+     - PICK_UP: red
+     - GOTHROUGHABLE: transparent (in case multiple z layers are stacked)
+    DEFAULT (rigid object): black
+
+    args:
+        ops: OPERATIONS bitfield of the static object
+
+    return: returns tuple (r,g,b,a) of ints 0-255
+    """
+    def allows(*required):
+        return all(OPERATIONS.allows(ops, op) for op in required)
+
+    if allows(OPERATIONS.EAT):
+        # yellow
+        return (255, 255, 0, 255)
+    elif allows(OPERATIONS.PICKUP, OPERATIONS.PUSH_OVER):
+        # red-orange
+        return (255, 64, 0, 255)
+    elif allows(OPERATIONS.PUSH_OVER):
+        # orange
+        return (255, 128, 0, 255)
+    elif allows(OPERATIONS.PICKUP):
+        # red
+        return (255, 0, 0, 255)
+    elif allows(OPERATIONS.GOTHROUGH):
+        # transparent
+        return (0, 0, 0, 0)
+    else:
+        # black
+        return (0, 0, 0, 255)
+
+# `static_color` of every possible bitfield, indexed by the
+# bitfield as an unsigned byte
+STATIC_PALETTE = np.array(
+    [static_color(code) for code in range(256)], dtype=np.uint8)
+STATIC_PALETTE.flags.writeable = False
+
+def signal_colors(signals, signal_depth, channel) -> np.ndarray:
+    """colors of signaling objects. Intensity of `channel`
+    is detirmined by signal
+
+    args:
+        signals: int np.ndarray (N,) of signals
+        signal_depth: vocabulary size of the signals
+        channel: 0 (red), 1 (green) or 2 (blue)
+
+    return: returns uint8 np.ndarray (N, 4) of (r,g,b,a)
+    """
+    colors = np.zeros((len(signals), 4), dtype=np.uint8)
+    colors[:, channel] = 255 * np.asarray(signals) // signal_depth
+    colors[:, 3] = 255
+    return colors
+
+def simple_overlay(back, fore):
+    """override back with any nonzero fore alpha
+
+    return: returns 3D numpy array (H,W,D) with
+    depth still (r,g,b,a) but alpha is only zero
+    if both back and fore have zero alpha"""
+    return np.where(fore[:, :, 3:] > 0, fore, back)
+
+def entity_colors(env):
+    """cells and colors of every moving object in env
+
+    args:
+        env: `SMAE` to render
+
+    return: returns tuple (cells, colors) of int np.ndarray
+        (M, 3) and uint8 np.ndarray (M, 4)
+    """
+    # actors come straight from the population columns
+    rows = env.actor_rows
+    cells = [to_cells(env.population.loc[rows])]
+    colors = [signal_colors(env.population.signal[rows],
+        VOCAB_SIZE, ACTOR_CHANNEL)]
+
+    # moving objects that are not actors are usually few
+    others = [moving_object for moving_object in env.moving_objects
+        if not isinstance(moving_object, Actor)]
+    if others:
+        cells.append(to_cells(
+            [moving_object.loc for moving_object in others]))
+        other_colors = np.array([MOVING_COLOR] * len(others),
+            dtype=np.uint8)
+        for i, moving_object in enumerate(others):
+            if isinstance(moving_object, Signaling_Moving_Object):
+                other_colors[i] = signal_colors([moving_object.signal],
+                    moving_object.signal_depth, SIGNALING_CHANNEL)[0]
+        colors.append(other_colors)
+    return np.concatenate(cells), np.concatenate(colors)
+
+def render_layer(env, z, entities=None) -> np.ndarray:
+    """color one z layer of env with the default coloring
+    scheme (see `SMAE.default_coloring`) using array
+    operations only
+
+    args:
+        env: `SMAE` to render
+        z: z height to render
+        entities: `entity_colors(env)` if already computed
+
+    return: returns uint8 np.ndarray (X, Y, 4) of (r,g,b,a)
+    """
+    # static objects are a palette lookup
+    layer = STATIC_PALETTE[
+        np.asarray(env.static_objects[:, :, z]).astype(np.uint8)]
+    # moving objects are scattered on top
+    cells, colors = entity_colors(env) if entities is None else entities
+    on_layer = cells[:, 2] == z
+    layer[cells[on_layer, 0], cells[on_layer, 1]] = colors[on_layer]
+    return layer
+
+def render_layer_slow(env, z, coloring) -> np.ndarray:
+    """color one z layer of env by calling `coloring` once
+    per voxel. Used for custom coloring callbacks
+
+    args:
+        env: `SMAE` to render
+        z: z height to render
+        coloring: color mapping function
+            (x,y,z)->(r,g,b,a) as ints 0-255
+
+    return: returns uint8 np.ndarray (X, Y, 4) of (r,g,b,a)
+    """
+    width, height = env.world_size[0:2]
+    return np.array([
+        [coloring(x, y, z) for y in range(height)]
+        for x in range(width)], dtype=np.uint8).reshape(
+            (width, height, 4))
+
+def composite(layers, blending=simple_overlay) -> np.ndarray:
+    """blend layers bottom up on top of a white background
+
+    args:
+        layers: list of uint8 np.ndarrays (X, Y, 4)
+        blending: (back, fore) -> img
+
+    return: returns uint8 np.ndarray (X, Y, 4)
+    """
+    np_img = np.empty(layers[0].shape, dtype=np.uint8)
+    np_img[...] = WHITE
+    for layer in layers:
+        np_img = blending(np_img, layer)
+    return np_img
+
+class Render_Pipeline:
+
+    def __init__(self, env, path, z_heights=0, blending=simple_overlay,
+        max_queue=8, image_format="png"):
+        """record frames of env to disk without stalling the
+        simulation. Every `capture` only copies the static cells
+        `env.set_static_object` changed since the previous frame
+        (see `SMAE.watch_static`) and the entity arrays. Bulk
+        writes (`reset`, `rebuild_combined_object_ops`) redraw
+        the rendered layers in full. A background thread keeps a persistent framebuffer
+        up to date by redrawing just the changed pixels and writes
+        each frame as `path/frame_000000.png`, `frame_000001.png`, ...
+        (numbered consecutively, dropped frames leave no gaps)
+
+        args:
+            env: `SMAE` to record
+            path: directory to write frames to (created if missing)
+            z_heights: int or list of ints of z heights to render
+            blending: (back, fore) -> img. See `SMAE.render`
+            max_queue: frames that may wait for the worker. When
+                the queue is full, captures are dropped (and their
+                changes carried over to the next captured frame)
+            image_format: any format Pillow can write
+        """
+        self.env = env
+        self.path = path
+        self.z_heights = z_heights \
+            if isinstance(z_heights, list) else [z_heights]
+        self.blending = blending
+        self.image_format = image_format
+        self.frames_captured = 0
+        self.frames_dropped = 0
+        self.frames_written = 0
+        os.makedirs(path, exist_ok=True)
+
+        # static cells changed since the last frame handed to
+        # the worker (unknown at first, so it redraws everything)
+        self._static_changes = env.watch_static()
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._error = None
+        self._worker = threading.Thread(
+            target=self._run, name="smae-render", daemon=True)
+        self._worker.start()
+
+    def capture(self) -> bool:
+        """snapshot whatever changed since the last frame and
+        hand it to the worker. Call between steps
+
+        return: returns False if the frame was dropped"""
+        if self._error is not None:
+            raise self._error
+        changes = self._static_changes.cells
+        if changes is not None:
+            changes = np.array(changes, np.int64).reshape((-1, 3))
+        deltas = []
+        for z in self.z_heights:
+            if changes is None:
+                xs, ys = np.indices(self.env.world_size[0:2])
+                changed = (xs.ravel(), ys.ravel())
+            else:
+                on_layer = changes[changes[:, 2] == z]
+                changed = (on_layer[:, 0], on_layer[:, 1])
+            deltas.append((changed, np.asarray(
+                self.env.static_objects[changed + (z,)])))
+        cells, colors = entity_colors(self.env)
+        frame = (self.frames_captured, deltas, cells, colors)
+        self.frames_captured += 1
+
+        try:
+            self._queue.put_nowait(frame)
+        except queue.Full:
+            # the changes are kept so that they are part
+            # of the next frame's delta
+            self.frames_dropped += 1
+            return False
+        self._static_changes.take()
+        return True
+
+    def close(self):
+        """write out every queued frame and stop the worker"""
+        self.env.unwatch_static(self._static_changes)
+        if self._worker.is_alive():
+            self._queue.put(None)
+        self._worker.join()
+        if self._error is not None:
+            raise self._error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _run(self):
+        """worker loop. Keeps per layer colors and the
+        composited framebuffer between frames"""
+        from PIL import Image
+        width, height = self.env.world_size[0:2]
+        n_layers = len(self.z_heights)
+        static_colors = np.zeros((n_layers, width, height, 4), np.uint8)
+        layer_colors = static_colors.copy()
+        framebuffer = np.empty((width, height, 4), np.uint8)
+        framebuffer[...] = WHITE
+        prev_entities = (np.zeros((0,), np.int64),) * 2
+        while True:
+            frame = self._queue.get()
+            if frame is None:
+                return
+            try:
+                _, deltas, cells, colors = frame
+                dirty = [prev_entities]
+                # static layers
+                for i, ((xs, ys), values) in enumerate(deltas):
+                    static_colors[i, xs, ys] = \
+                        STATIC_PALETTE[values.astype(np.uint8)]
+                    dirty.append((xs, ys))
+                # entities: erase the old ones, draw the new ones
+                xs, ys = prev_entities
+                layer_colors[:, xs, ys] = static_colors[:, xs, ys]
+                for (xs, ys), _ in deltas:
+                    layer_colors[:, xs, ys] = static_colors[:, xs, ys]
+                for i, z in enumerate(self.z_heights):
+                    on_layer = cells[:, 2] == z
+                    layer_colors[i, cells[on_layer, 0],
+                        cells[on_layer, 1]] = colors[on_layer]
+                prev_entities = (cells[:, 0], cells[:, 1])
+                dirty.append(prev_entities)
+                # recomposite only the dirty pixels
+                xs = np.concatenate([d[0] for d in dirty])
+                ys = np.concatenate([d[1] for d in dirty])
+                if len(xs):
+                    pixels = np.empty((1, len(xs), 4), np.uint8)
+                    pixels[...] = WHITE
+                    for i in range(n_layers):
+                        pixels = self.blending(
+                            pixels, layer_colors[i, xs, ys][None])
+                    framebuffer[xs, ys] = pixels[0]
+                Image.fromarray(framebuffer[:, :, 0:3], "RGB").save(
+                    os.path.join(self.path, "frame_{:06d}.{}".format(
+                        self.frames_written, self.image_format)))
+                self.frames_written += 1
+            except Exception as e:
+                self._error = e
+                return
@@ -0,0 +1,385 @@
+import traceback
+import numpy as np
+
+from .actor import Actor, ACT_CONTINUOUS_LEN, UNPLACED, apply_actions
+from .elements import to_cells, encode_item, decode_item, ITEM_LEN, \
+    OBJECT_LEN
+from .env import SMAE
+from .movement import MAX_PUSH_CHAIN
+from .population import COLUMNS, Population
+from .pool import Worker_Pool, Shared_Buffers, space_spec
+
+# population columns kept in the shared actor table
+TABLE_COLUMNS = [name for name in COLUMNS if name != "world"]
+
+def tile_bounds(world_size, tiles) -> list:
+    """split the first two axes of world_size into a grid of
+    tiles (the remaining axes are never split)
+
+    return: returns list of (lo, hi) int np.ndarray pairs.
+        Tile i*tiles[1]+j covers cells lo <= cell < hi"""
+    xs = np.array_split(np.arange(world_size[0]), tiles[0])
+    ys = np.array_split(np.arange(world_size[1]), tiles[1])
+    bounds = []
+    for x in xs:
+        for y in ys:
+            lo = np.zeros((len(world_size),), np.int64)
+            hi = np.array(world_size, np.int64)
+            lo[0:2] = x[0], y[0]
+            hi[0:2] = x[-1] + 1, y[-1] + 1
+            bounds.append((lo, hi))
+    return bounds
+
+def default_halo(vision_size, max_forward_speed, gravity) -> int:
+    """halo wide enough for exact observations plus the cells a
+    mover can reach in one step (path, push chain and gravity),
+    twice: once for the movers themselves and once more for
+    whatever they may collide with"""
+    vision_reach = max(vision_size[0] // 2, vision_size[1] - 1)
+    move_reach = MAX_PUSH_CHAIN + 1 \
+        + int(np.ceil(np.sqrt(2) * max_forward_speed)) \
+        + int(np.ceil(np.abs(gravity).sum()))
+    return vision_reach + 2 * move_reach
+
+class _Tile:
+
+    def __init__(self, index, bounds, halo, settings, buffers):
+        """worker side state of one tile: an `SMAE` over the
+        tile (its core) plus a halo of neighbouring cells"""
+        self.index = index
+        self.bounds = bounds
+        self.buffers = buffers
+        self.vision_size = settings["vision_size"]
+        world_size = np.array(settings["world_size"])
+        margin = np.zeros_like(world_size)
+        margin[0:2] = halo
+        lo, hi = bounds[index]
+        self.core_lo, self.core_hi = lo, hi
+        self.origin = np.maximum(lo - margin, 0)
+        self.end = np.minimum(hi + margin, world_size)
+        self.region = tuple(slice(a, b)
+            for a, b in zip(self.origin, self.end))
+        self.core = tuple(slice(a, b)
+            for a, b in zip(lo - self.origin, hi - self.origin))
+        self.env = SMAE(
+            signal_depth=settings["signal_depth"],
+            world_size=tuple((self.end - self.origin).tolist()),
+            static_objects=buffers["static_objects"][self.region].copy(),
+            gravity=settings["gravity"],
+            out_of_bounds_ops=settings["out_of_bounds_ops"],
+            out_of_bounds_signal=settings["out_of_bounds_signal"],
+            occlusion=settings["occlusion"],
+            template=False)
+        # actors that left the region, kept for when they return
+        self.cache = {}
+
+    def cells(self, moving_objects) -> np.ndarray:
+        """returns int np.ndarray (N, 3) of the global cells
+        of moving objects in the local env"""
+        return to_cells(np.array([moving_object.loc
+            for moving_object in moving_objects]).reshape(
+                (-1, len(self.origin)))) + self.origin
+
+    def in_core(self, cells) -> np.ndarray:
+        """returns bool mask of global cells inside the core"""
+        cells = np.asarray(cells).reshape((-1, len(self.core_lo)))
+        return np.all((cells >= self.core_lo) & (cells < self.core_hi),
+            axis=1)
+
+    def in_region(self, cells) -> np.ndarray:
+        """returns bool mask of global cells inside core or halo"""
+        cells = np.asarray(cells).reshape((-1, len(self.origin)))
+        return np.all((cells >= self.origin) & (cells < self.end), axis=1)
+
+    def adopt(self, objects):
+        """add every actor of the shared table and every
+        object record in objects that lies in the core"""
+        table = self.buffers
+        rows = np.flatnonzero(table["alive"])
+        for gid in rows[self.in_core(to_cells(table["loc"][rows]))]:
+            self.add_actor(gid)
+        for record in objects[self.in_core(to_cells(objects[:, 0:3]))]:
+            self.env.add_moving_object(
+                decode_item(record[3:], loc=record[0:3] - self.origin))
+        self.env._logic_update()
+
+    def add_actor(self, gid):
+        """add actor gid of the shared table to the local env"""
+        env, table = self.env, self.buffers
+        actor = self.cache.pop(gid, None)
+        if actor is None:
+            # its loc comes from the table
+            actor = Actor(env=env, initial_loc=UNPLACED,
+                vision_size=self.vision_size)
+        actor._attach(env.population)
+        for name in TABLE_COLUMNS:
+            env.population.columns[name][actor._row] = table[name][gid]
+        env.population.loc[actor._row] -= self.origin
+        actor.storage = [decode_item(record) for record
+            in table["storage"][gid, :actor.storage_count]]
+        env._register_actor(gid, actor)
+        env.add_moving_object(actor)
+
+    def remove_actor(self, gid):
+        """take actor gid out of the local env"""
+        actor = self.env._unregister_actor(gid)
+        self.env.remove_moving_object(actor)
+        actor._attach(Population(capacity=1))
+        self.cache[gid] = actor
+
+    def pull(self):
+        """rebuild the halo from what the other tiles published"""
+        env, table = self.env, self.buffers
+        # everything in the halo belongs to other tiles
+        for gid in [gid for gid, in_core in zip(list(env.actors),
+                self.in_core(self.cells(env.actors.values()))) if not in_core]:
+            self.remove_actor(gid)
+        for moving_object, in_core in zip(list(env.moving_objects),
+                self.in_core(self.cells(env.moving_objects))):
+            if not in_core:
+                env.remove_moving_object(moving_object)
+
+        static_objects = table["static_objects"][self.region]
+        changed = np.argwhere(env.static_objects != static_objects)
+        env.static_objects[...] = static_objects
+        env._forget_static_changes()
+        np.copyto(env.combined_object_ops, env.static_objects,
+            where=~env._occupied)
+        env._dirty_cells.update(map(tuple, changed.tolist()))
+        env._update_free_cells(changed)
+
+        rows = np.flatnonzero(table["alive"])
+        cells = to_cells(table["loc"][rows])
+        for gid in rows[self.in_region(cells) & ~self.in_core(cells)]:
+            self.add_actor(gid)
+        for tile in range(len(self.bounds)):
+            if tile == self.index:
+                continue
+            objects = table["outbox"][tile, :table["outbox_count"][tile]]
+            for record in objects[self.in_region(to_cells(objects[:, 0:3]))]:
+                env.add_moving_object(
+                    decode_item(record[3:], loc=record[0:3] - self.origin))
+        env._update_signal_field()
+
+    def simulate(self):
+        """step every actor in core and halo
+
+        return: returns tuple (gids, actors) of the actors that
+            took part, in global order"""
+        env, table = self.env, self.buffers
+        gids = np.array(sorted(env.actors), dtype=np.int64)
+        actors = [env.actors[gid] for gid in gids]
+        env.origonal_actors = env.actors.copy()
+        actions = table["actions"][gids]
+        signals = table["signals"][gids]
+        apply_actions(env, actors, actions, signals)
+        env._global_update((actions, signals))
+        return gids, actors
+
+    def publish(self, gids, actors, obs_keys):
+        """write the state of everything that ended up in the core
+        (including actors that died there) to the shared buffers"""
+        env, table = self.env, self.buffers
+        columns = env._actor_columns(actors)
+        mine = self.in_core(to_cells(columns["loc"]) + self.origin)
+        gids = gids[mine]
+        actors = [actor for actor, is_mine in zip(actors, mine) if is_mine]
+        columns = {name: column[mine] for name, column in columns.items()}
+        obs = env.egocentric_obs_batch(actors)
+        for name in TABLE_COLUMNS:
+            table[name][gids] = columns[name]
+        table["loc"][gids] += self.origin
+        for key in obs_keys:
+            table[key][gids] = obs[key].reshape(
+                (len(gids),) + table[key].shape[1:])
+        dead = np.array([actor._population is not env.population
+            for actor in actors], dtype=bool)
+        table["alive"][gids] = ~dead
+        table["done"][gids] = dead
+        table["rewards"][gids] = columns["reward"]
+        for gid, actor in zip(gids, actors):
+            for slot, item in enumerate(actor.storage):
+                table["storage"][gid, slot] = encode_item(item)
+
+        core = tuple(slice(a, b) for a, b in zip(self.core_lo, self.core_hi))
+        table["static_objects"][core] = env.static_objects[self.core]
+        table["combined_object_ops"][core] = env.combined_object_ops[self.core]
+        table["signal_field"][core] = env.signal_field[self.core]
+
+        objects = [moving_object for moving_object in env.moving_objects
+            if not isinstance(moving_object, Actor)]
+        objects = [moving_object for moving_object, in_core
+            in zip(objects, self.in_core(self.cells(objects))) if in_core]
+        outbox = table["outbox"][self.index]
+        if len(objects) > len(outbox):
+            raise RuntimeError("tile {} outbox overflowed".format(self.index))
+        for i, moving_object in enumerate(objects):
+            outbox[i, 0:3] = moving_object.loc + self.origin
+            outbox[i, 3:] = encode_item(moving_object)
+        table["outbox_count"][self.index] = len(objects)
+
+def _tile_worker(conn, barrier, index, bounds, halo, settings, specs,
+        name, objects):
+    """worker process loop of one tile. Answers "observe",
+    "step" and "close" commands"""
+    buffers = Shared_Buffers(specs, name=name)
+    obs_keys = [key for key in specs if key.startswith("OBS_")]
+    try:
+        tile = _Tile(index, bounds, halo, settings, buffers)
+        tile.adopt(objects)
+        tile.publish(np.zeros((0,), np.int64), [], obs_keys)
+        conn.send(None)
+        while True:
+            command = conn.recv()
+            if command == "close":
+                break
+            tile.pull()
+            # nobody writes before everybody is done reading
+            barrier.wait()
+            if command == "step":
+                gids, actors = tile.simulate()
+            else:
+                gids = np.array(sorted(tile.env.actors), dtype=np.int64)
+                actors = [tile.env.actors[gid] for gid in gids]
+            tile.publish(gids, actors, obs_keys)
+            conn.send(None)
+    except Exception:
+        # release the other tiles waiting on this one
+        barrier.abort()
+        conn.send(traceback.format_exc())
+    finally:
+        buffers.close()
+        conn.close()
+
+class Tiled_SMAE(Worker_Pool):
+
+    def __init__(self, env, tiles=(2, 2), halo=None, context=None):
+        """run one `SMAE` split into tiles, each owned by its own
+        worker process
+
+        Every worker simulates its tile plus a halo of `halo`
+        cells around it, where copies of the neighbouring tiles'
+        actors and objects take part in movement, pushing and
+        signalling exactly as in a single `SMAE`. After every
+        step each worker keeps and publishes only what ended up
+        in its own tile; actors and objects crossing a tile
+        border thereby migrate to the neighbouring tile. The
+        world grids, an actor table and every tile's moving
+        objects live in shared memory, which is also how halos
+        are exchanged
+
+        Observations, moves and signals match a single process
+        `SMAE` stepped with `step_batch` as long as no chain of
+        interacting movers (pushes, followers, contested cells)
+        reaches further than the halo within one step
+
+        args:
+            env: `SMAE` to take the world, actors and moving
+                objects from. Rows of the shared buffers follow
+                `env.batch_ids`. All actors must share one
+                vision_size. env must not have pheromones. env
+                itself is left as is
+            tiles: number of tiles along the first two axes
+            halo: halo width in cells. Defaults to `default_halo`
+            context: multiprocessing context or start method
+        """
+        if env.pheromones is not None:
+            # tiles would need their own fields exchanged across halos
+            raise ValueError("Tiled_SMAE does not support pheromones")
+        actors = list(env.actors.values())
+        self.actor_ids = env.batch_ids
+        self.world_size = tuple(env.world_size)
+        self.tiles = tuple(tiles)
+        vision_size = tuple(actors[0].vision_size) if actors else (1, 1, 1)
+        if any(tuple(actor.vision_size) != vision_size for actor in actors):
+            raise ValueError("actors must share one vision_size")
+        columns = env._actor_columns(actors)
+        self.halo = default_halo(vision_size,
+            columns["max_forward_speed"].max(initial=0), env.gravity) \
+            if halo is None else halo
+        self.bounds = tile_bounds(self.world_size, self.tiles)
+
+        others = [moving_object for moving_object in env.moving_objects
+            if not isinstance(moving_object, Actor)]
+        objects = np.zeros((len(others), OBJECT_LEN))
+        for i, moving_object in enumerate(others):
+            objects[i, 0:3] = moving_object.loc
+            objects[i, 3:] = encode_item(moving_object)
+
+        n = len(actors)
+        specs = {key: ((n,) + shape, dtype)
+            for key, (shape, dtype) in (
+                (key, space_spec(space)) for key, space
+                in (actors[0].observation_space.spaces.items()
+                    if actors else []))}
+        specs.update({name: ((n,) + COLUMNS[name][0], COLUMNS[name][1])
+            for name in TABLE_COLUMNS})
+        specs.update({
+            "storage": ((n, max(columns["storage_capacity"].max(
+                initial=1), 1), ITEM_LEN), np.int64),
+            "actions": ((n, ACT_CONTINUOUS_LEN), np.float64),
+            "signals": ((n,), np.int64),
+            "rewards": ((n,), np.float64),
+            "done": ((n,), bool),
+            "alive": ((n,), bool),
+            "static_objects": (self.world_size, np.int8),
+            "combined_object_ops": (self.world_size, np.int8),
+            "signal_field": (self.world_size, np.int16),
+            # moving objects are only ever moved, picked up and
+            # placed back, so their number never grows
+            "outbox": ((len(self.bounds), max(len(others), 1),
+                OBJECT_LEN), np.float64),
+            "outbox_count": ((len(self.bounds),), np.int64),
+        })
+        super(Tiled_SMAE, self).__init__(specs, context=context)
+        try:
+            table = self.buffers
+            for name in TABLE_COLUMNS:
+                table[name][...] = columns[name]
+            for row, actor in enumerate(actors):
+                for slot, item in enumerate(actor.storage):
+                    table["storage"][row, slot] = encode_item(item)
+            table["alive"][...] = True
+            table["static_objects"][...] = env.static_objects
+
+            settings = {
+                "world_size": self.world_size,
+                "signal_depth": env.signal_depth,
+                "gravity": env.gravity,
+                "out_of_bounds_ops": env.out_of_bounds_ops,
+                "out_of_bounds_signal": env.out_of_bounds_signal,
+                "occlusion": env.occlusion,
+                "vision_size": vision_size,
+            }
+            barrier = self.context.Barrier(len(self.bounds))
+            for index in range(len(self.bounds)):
+                self._start_worker(_tile_worker, barrier, index,
+                    self.bounds, self.halo, settings, specs, table.name,
+                    objects)
+            self._wait()
+            self._send("observe")
+            self._wait()
+        except BaseException:
+            # nobody gets to `close` a half built pool
+            self._abort()
+            raise
+
+    @property
+    def static_objects(self) -> np.ndarray:
+        """shared view of the whole world's static objects"""
+        return self.buffers["static_objects"]
+
+    @property
+    def combined_object_ops(self) -> np.ndarray:
+        """shared view of the whole world's combined ops"""
+        return self.buffers["combined_object_ops"]
+
+    @property
+    def signal_field(self) -> np.ndarray:
+        """shared view of the whole world's signal field"""
+        return self.buffers["signal_field"]
+
+    @property
+    def locs(self) -> np.ndarray:
+        """shared (N, 3) view of every actor's location"""
+        return self.buffers["loc"]
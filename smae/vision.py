@@ -0,0 +1,300 @@
+import functools
+import numpy as np
+
+from .elements import OPERATIONS, ops_mask
+
+ORIENTATION_BUCKETS = 8 # orientations are quantized to 45deg steps
+
+def orientation_buckets(orientations, n_buckets=ORIENTATION_BUCKETS):
+    """quantize radian orientations to the nearest of
+    `n_buckets` evenly spaced directions
+
+    args:
+        orientations: float or np.ndarray of radian angles
+        n_buckets: number of directions. Bucket b points
+            at angle 2*pi*b/n_buckets
+
+    return: returns int np.ndarray of buckets in [0, n_buckets)
+    """
+    turns = np.asarray(orientations) * n_buckets / (2*np.pi)
+    return np.mod(np.floor(turns + 0.5), n_buckets).astype(np.int64)
+
+@functools.lru_cache(maxsize=None)
+def offset_table(vision_size, n_buckets=ORIENTATION_BUCKETS):
+    """precompute the world space offsets of every cell in an
+    egocentric field of view for every orientation bucket
+
+    In egocentric coordinates,
+        x is left and right (centered on the actor)
+        y is forward (starting at the actor's own cell)
+        z is up and down (centered on the actor)
+
+    Views are turned by the nearest multiple of 90deg exactly
+    and by the remaining (at most 45deg) with three rounded
+    shears. Each step maps the integer grid onto itself one to
+    one, so every view cell looks at a distinct world cell in
+    every bucket (no duplicated or skipped cells on diagonals)
+
+    args:
+        vision_size: (x, y, z) shape of the field of view
+        n_buckets: number of orientation buckets
+
+    return: returns read-only int np.ndarray of shape
+        (n_buckets, prod(vision_size), 3). Cells are listed
+        in C order of the field of view
+    """
+    ex, ey, ez = np.meshgrid(
+        np.arange(vision_size[0]) - vision_size[0] // 2,
+        np.arange(vision_size[1]),
+        np.arange(vision_size[2]) - vision_size[2] // 2,
+        indexing="ij")
+    ex, ey, ez = ex.ravel(), ey.ravel(), ez.ravel()
+    rounded = lambda values: np.floor(values + 0.5).astype(np.int64)
+
+    table = np.empty((n_buckets, ex.size, 3), dtype=np.int64)
+    for bucket in range(n_buckets):
+        # egocentric +y (forward) points at 2*pi*bucket/n_buckets
+        # and +x (right) 90deg clockwise of it
+        angle = 2*np.pi*bucket / n_buckets - np.pi/2
+        quarters = int(np.round(angle / (np.pi/2)))
+        rest = angle - quarters * np.pi/2
+        # rotate by rest with shears along x, y and x again
+        shear = -np.tan(rest / 2)
+        x = ex + rounded(shear * ey)
+        y = ey + rounded(np.sin(rest) * x)
+        x = x + rounded(shear * y)
+        for _ in range(quarters % 4):
+            x, y = -y, x
+        table[bucket, :, 0] = x
+        table[bucket, :, 1] = y
+        table[bucket, :, 2] = ez
+    table.flags.writeable = False
+    return table
+
+@functools.lru_cache(maxsize=None)
+def visibility_table(vision_size, n_buckets=ORIENTATION_BUCKETS):
+    """precompute which cells of an egocentric field of view
+    each cell's line of sight runs through, for every
+    orientation bucket
+
+    Sight runs in world space from the actor's own cell to the
+    cell (see `offset_table`). Every point sampled along the
+    way depends on the view cell whose world offset is closest
+    to it, or on all of them when several are equally close
+    (eg passing exactly between two cells). The actor's own
+    cell and the cell itself are never dependencies
+
+    args:
+        vision_size: (x, y, z) shape of the field of view
+        n_buckets: number of orientation buckets
+
+    return: returns read-only int np.ndarray of shape
+        (n_buckets, prod(vision_size), L) of view cell indices
+        (C order). Rows are padded with prod(vision_size),
+        which stands for no cell
+    """
+    offsets = offset_table(vision_size, n_buckets).astype(np.float64)
+    size = offsets.shape[1]
+    eye = np.ravel_multi_index((vision_size[0] // 2, 0,
+        vision_size[2] // 2), vision_size)
+    steps = 2 * max(1, int(np.abs(offsets).max())) + 1
+    fractions = np.arange(1, steps) / steps
+    deps = []
+    for bucket in range(n_buckets):
+        table = offsets[bucket]
+        points = fractions[None, :, None] * table[:, None, :]
+        # squared distance of every point to every view cell
+        distances = (points**2).sum(axis=-1)[..., None] \
+            - 2 * points @ table.T + (table**2).sum(axis=-1)
+        closest = np.any(distances <= distances.min(axis=-1,
+            keepdims=True) + 1e-6, axis=1)
+        # cells sharing a world offset with the cell or the eye
+        same = np.all(table[:, None] == table[None], axis=-1)
+        closest &= ~same & ~same[eye]
+        deps.append([np.flatnonzero(row) for row in closest])
+
+    longest = max(len(d) for row in deps for d in row)
+    table = np.full((n_buckets, size, longest), size, np.int64)
+    for bucket in range(n_buckets):
+        for cell in range(size):
+            table[bucket, cell, :len(deps[bucket][cell])] = deps[bucket][cell]
+    table.flags.writeable = False
+    return table
+
+def occlusion_mask(opaque, buckets, n_buckets=ORIENTATION_BUCKETS):
+    """find the cells of many egocentric views hidden behind
+    opaque ones (see `visibility_table`). Opaque cells block
+    what is behind them but are seen themselves
+
+    args:
+        opaque: bool np.ndarray (N,)+vision_size
+        buckets: int np.ndarray (N,) of orientation buckets
+
+    return: returns bool np.ndarray shaped like opaque, True
+        where a cell is hidden
+    """
+    opaque = np.asarray(opaque, dtype=bool)
+    n, vision_size = len(opaque), tuple(opaque.shape[1:])
+    table = visibility_table(vision_size, n_buckets)
+    size = table.shape[1]
+    # the padding index looks at a cell that is never opaque
+    padded = np.zeros((n, size + 1), bool)
+    padded[:, :size] = opaque.reshape((n, size))
+    hidden = np.zeros((n, size), bool)
+    buckets = np.asarray(buckets, dtype=np.int64)
+    # actors facing the same way share one table
+    for bucket in np.unique(buckets):
+        rows = np.flatnonzero(buckets == bucket)
+        hidden[rows] = padded[rows][:, table[bucket]].any(axis=-1)
+    return hidden.reshape(opaque.shape)
+
+def hidden_cells(ops, buckets, n_buckets=ORIENTATION_BUCKETS):
+    """`occlusion_mask` of OBS_OPERATIONS views. Cells that do
+    not allow GOTHROUGH (rigid objects, food, actors, ...)
+    are opaque
+
+    args:
+        ops: int8 np.ndarray (N,)+vision_size of views
+        buckets: int np.ndarray (N,) of orientation buckets
+
+    return: returns bool np.ndarray shaped like ops, True
+        where a cell is hidden
+    """
+    return occlusion_mask(ops_mask(ops, exclude=[OPERATIONS.GOTHROUGH]),
+        buckets, n_buckets)
+
+def gather(grid, cells, buckets, vision_size, fill=0,
+        n_buckets=ORIENTATION_BUCKETS, out=None, scratch=None):
+    """build the egocentric views of many actors at once
+
+    args:
+        grid: np.ndarray to look at (eg `combined_object_ops`).
+            Leading axes beyond the last three (eg a world
+            index) are addressed by `cells` but never offset
+        cells: int np.ndarray (N, grid.ndim) of actor cells
+        buckets: int np.ndarray (N,) of orientation buckets
+        vision_size: (x, y, z) shape of the field of view
+        fill: value given to cells outside of `grid`
+        n_buckets: number of orientation buckets
+        out: np.ndarray (N,)+vision_size to write the views
+            into (may be a strided view). If `None` (default)
+            a new array of grid.dtype
+        scratch: `Gather_Scratch` for at least N actors holding
+            the index arrays, so that nothing is allocated per
+            call when out is also given. Optional
+
+    return: returns out
+    """
+    cells = np.asarray(cells, dtype=np.int64)
+    buckets = np.asarray(buckets, dtype=np.int64)
+    n, vision_size = len(cells), tuple(vision_size)
+    if out is None:
+        out = np.empty((n,) + vision_size, grid.dtype)
+    if scratch is None or scratch.capacity < n \
+            or scratch.vision_size != vision_size:
+        scratch = Gather_Scratch(n, vision_size)
+    table = offset_table(vision_size, n_buckets)
+    lin, coord, valid, outside = scratch.rows(n)
+
+    # linear index (C order) of every viewed cell, one axis at a time
+    lin[...] = 0
+    valid[...] = True
+    stride = 1
+    for axis in reversed(range(grid.ndim)):
+        spatial = axis - (grid.ndim - 3)
+        if spatial >= 0:
+            np.take(table[:, :, spatial], buckets, axis=0, out=coord,
+                mode="clip")
+            coord += cells[:, axis, None]
+        else:
+            # leading (batch) axes are not offset
+            coord[...] = cells[:, axis, None]
+        size = grid.shape[axis]
+        np.greater_equal(coord, 0, out=outside)
+        valid &= outside
+        np.less(coord, size, out=outside)
+        valid &= outside
+        np.clip(coord, 0, size-1, out=coord)
+        coord *= stride
+        lin += coord
+        stride *= size
+
+    shape = (n,) + vision_size
+    if isinstance(grid, np.ndarray) and grid.flags.c_contiguous:
+        np.take(grid.reshape(-1), lin.reshape(shape), out=out, mode="clip")
+    else:
+        # eg `chunked.Chunked_Array`
+        out[...] = grid[np.unravel_index(lin, grid.shape)].reshape(shape)
+    np.logical_not(valid, out=outside)
+    np.copyto(out, fill, where=outside.reshape(shape), casting="unsafe")
+    return out
+
+class Gather_Scratch:
+
+    def __init__(self, capacity, vision_size):
+        """reusable index arrays of `gather` for up to capacity
+        actors with one vision_size
+
+        args:
+            capacity: number of actors
+            vision_size: (x, y, z) shape of the field of view
+        """
+        self.capacity = int(capacity)
+        self.vision_size = tuple(vision_size)
+        size = (self.capacity, int(np.prod(self.vision_size)))
+        self._lin = np.empty(size, np.int64)
+        self._coord = np.empty(size, np.int64)
+        self._valid = np.empty(size, bool)
+        self._outside = np.empty(size, bool)
+
+    def rows(self, n) -> tuple:
+        """returns tuple of the arrays cut to the first n rows"""
+        return self._lin[:n], self._coord[:n], \
+            self._valid[:n], self._outside[:n]
+
+def packed_size(vision_size) -> int:
+    """returns number of bytes `pack_ops` packs one view into"""
+    return -(-int(np.prod(vision_size)) // 2)
+
+def pack_ops(ops, out=None) -> np.ndarray:
+    """pack OPERATIONS views two cells per byte. Cell 2i of a
+    (C order flattened) view goes to the low and cell 2i+1 to
+    the high nibble of byte i
+
+    args:
+        ops: int8 np.ndarray (N,)+vision_size of values in
+            [0, 16) (IMPLIMENTED_OPS bits)
+        out: uint8 np.ndarray (N, packed_size(vision_size)) to
+            pack into. If `None` (default) a new one
+
+    return: returns out
+    """
+    flat = np.ascontiguousarray(ops).reshape((len(ops), -1)).view(np.uint8)
+    half = flat.shape[1] // 2
+    if out is None:
+        out = np.empty((len(ops), packed_size(ops.shape[1:])), np.uint8)
+    pairs = out[:, :half]
+    np.left_shift(flat[:, 1::2], 4, out=pairs)
+    np.bitwise_or(pairs, flat[:, 0:2*half:2], out=pairs)
+    if flat.shape[1] % 2:
+        out[:, half] = flat[:, -1]
+    return out
+
+def unpack_ops(packed, vision_size, out=None) -> np.ndarray:
+    """inverse of `pack_ops`
+
+    args:
+        packed: uint8 np.ndarray (N, packed_size(vision_size))
+        vision_size: (x, y, z) shape of the field of view
+        out: int8 np.ndarray (N,)+vision_size (C contiguous)
+            to unpack into. If `None` (default) a new one
+
+    return: returns out
+    """
+    packed = np.asarray(packed, np.uint8)
+    if out is None:
+        out = np.empty((len(packed),) + tuple(vision_size), np.int8)
+    flat = out.reshape((len(packed), -1)).view(np.uint8)
+    np.bitwise_and(packed, 0xf, out=flat[:, 0::2])
+    np.right_shift(packed[:, :flat.shape[1] // 2], 4, out=flat[:, 1::2])
+    return out
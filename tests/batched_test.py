@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from smae.batched import Batched_SMAE
+from smae.actor import ACT_CONTINUOUS_LEN, OBS_OPERATIONS, OBS_SIGNALS, \
+    OBS_HEALTH
+
+
+def random_batch(env, rng):
+    n = len(env.batch_actors)
+    return rng.random((n, ACT_CONTINUOUS_LEN)), rng.integers(8, size=n)
+
+
+def test_batched_obs_match_each_world():
+    rng = np.random.default_rng(0)
+    env = Batched_SMAE(n_worlds=4, signal_depth=8, world_size=(10, 10, 1),
+        actor_ids=range(5))
+    for _ in range(5):
+        obs, r, done, info = env.step(*random_batch(env, rng))
+        assert not done.any()
+        assert np.array_equal(info["world"], np.repeat(np.arange(4), 5))
+    for k, world in enumerate(env.worlds):
+        assert world.combined_object_ops.base is env.combined_object_ops
+        expected = world.egocentric_obs_batch()
+        rows = info["world"] == k
+        for key in (OBS_OPERATIONS, OBS_SIGNALS, OBS_HEALTH):
+            assert np.array_equal(obs[key][rows], expected[key])
+        world._update_signal_field()
+    # per world signal fields agree with the batched update
+    signal_field = env.signal_field.copy()
+    env._update_signal_field()
+    assert np.array_equal(signal_field, env.signal_field)
+
+
+def test_finished_worlds_reset_in_place():
+    rng = np.random.default_rng(1)
+    env = Batched_SMAE(n_worlds=3, signal_depth=8, world_size=(8, 8, 1),
+        actor_ids=range(4), max_steps=10)
+    combined_object_ops = env.combined_object_ops
+    # starve every actor of world 1
+    for actor in env.worlds[1].actors.values():
+        actor.energy = 1e-3
+    obs, r, done, info = env.step(*random_batch(env, rng))
+    assert np.array_equal(info["reset"], [False, True, False])
+    assert np.array_equal(done, info["world"] == 1)
+    assert env.steps.tolist() == [1, 0, 1]
+    assert len(env.worlds[1].actors) == 4
+    assert env.combined_object_ops is combined_object_ops
+
+    for _ in range(9):
+        obs, r, done, info = env.step(*random_batch(env, rng))
+    assert np.array_equal(info["reset"], [True, False, True])
+    assert env.steps.tolist() == [0, 9, 0]
+
+
+def test_unsupported_kwargs_are_rejected():
+    for key in ("profiler", "recorder"):
+        with pytest.raises(ValueError, match=key):
+            Batched_SMAE(n_worlds=2, signal_depth=8, world_size=(6, 6, 1),
+                actor_ids=range(2), **{key: object()})
@@ -0,0 +1,11 @@
+from benchmarks.run import run_case, cases, BASE, PHASES
+
+
+def test_benchmark_case_runs():
+    case = dict(BASE, world_size=(12, 12, 2), n_actors=3)
+    metrics = run_case(case, min_time=0)
+    assert metrics["step_batch_per_sec"] > 0
+    assert metrics["peak_memory_bytes"] > 0
+    for name in PHASES:
+        assert metrics["phase_" + name.lstrip("_")] >= 0
+    assert len(cases({"n_actors": [1, 2]})) == 2
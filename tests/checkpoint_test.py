@@ -0,0 +1,72 @@
+import numpy as np
+
+from smae.env import SMAE
+from smae.elements import OPERATIONS, Moving_Object, Signaling_Moving_Object
+from smae.actor import ACT_CONTINUOUS_LEN, OBS_OPERATIONS, OBS_SIGNALS
+
+
+def make_env():
+    static_objects = np.full((12, 12, 3),
+        OPERATIONS.encode([OPERATIONS.GOTHROUGH]), dtype=np.int8)
+    static_objects[:, :, 0] = OPERATIONS.encode([])
+    env = SMAE(signal_depth=8, world_size=(12, 12, 3),
+        static_objects=static_objects, actor_ids=["ant", 7],
+        rng=np.random.RandomState(3))
+    env.add_moving_object(Moving_Object(loc=(2, 2, 2),
+        ops=OPERATIONS.encode([OPERATIONS.PICKUP])))
+    beacon = Signaling_Moving_Object(signal_depth=8, loc=(5, 5, 2),
+        ops=OPERATIONS.encode([OPERATIONS.PUSH_OVER]))
+    beacon.set_signal(6)
+    env.add_moving_object(beacon)
+    env.actors["ant"].storage = [np.int8(OPERATIONS.encode(
+        [OPERATIONS.EAT]))]
+    env.actors["ant"].storage_count = 1
+    return env
+
+
+def test_load_restores_env(tmp_path):
+    rng = np.random.default_rng(0)
+    env = make_env()
+    for _ in range(3):
+        env.step_batch(rng.random((2, ACT_CONTINUOUS_LEN)),
+            rng.integers(8, size=2))
+    env.save(tmp_path / "env.smae")
+    loaded = SMAE.load(tmp_path / "env.smae")
+
+    assert isinstance(loaded.static_objects, np.memmap)
+    for name in ("static_objects", "combined_object_ops", "signal_field"):
+        assert np.array_equal(getattr(env, name), getattr(loaded, name))
+    assert list(loaded.actors) == ["ant", 7]
+    for actor_id, actor in env.actors.items():
+        other = loaded.actors[actor_id]
+        assert np.array_equal(actor.loc, other.loc)
+        assert actor.orientation == other.orientation
+        assert actor.energy == other.energy
+        assert actor.prev_energy == other.prev_energy
+        assert actor.signal == other.signal
+        assert actor.storage == other.storage
+    assert loaded.rng.get_state()[2] == env.rng.get_state()[2]
+    assert sorted(map(tuple, (moving_object.loc
+        for moving_object in loaded.moving_objects))) \
+        == sorted(map(tuple, (moving_object.loc
+        for moving_object in env.moving_objects)))
+
+    # both continue identically
+    for _ in range(5):
+        actions = rng.random((2, ACT_CONTINUOUS_LEN))
+        signals = rng.integers(8, size=2)
+        obs, r, done, _ = env.step_batch(actions, signals)
+        loaded_obs, loaded_r, _, _ = loaded.step_batch(actions, signals)
+        for key in (OBS_OPERATIONS, OBS_SIGNALS):
+            assert np.array_equal(obs[key], loaded_obs[key])
+        assert np.array_equal(r, loaded_r)
+    assert env.random_avaliable_loc() == loaded.random_avaliable_loc()
+
+
+def test_copy_on_write_leaves_file_alone(tmp_path):
+    env = make_env()
+    env.save(tmp_path / "env.smae")
+    loaded = SMAE.load(tmp_path / "env.smae")
+    loaded.set_static_object((1, 1, 1), OPERATIONS.encode([]))
+    again = SMAE.load(tmp_path / "env.smae", mmap_mode=None)
+    assert np.array_equal(again.static_objects, env.static_objects)
@@ -0,0 +1,77 @@
+import numpy as np
+
+from smae.chunked import Chunked_Array
+from smae.env import SMAE
+from smae.actor import ACT_CONTINUOUS_LEN, ACT_FORWARD_SPEED_INDEX, \
+    OBS_OPERATIONS, OBS_SIGNALS
+
+
+def test_chunked_array_indexes_like_dense():
+    rng = np.random.default_rng(0)
+    dense = np.full((20, 37, 5), 3, dtype=np.int8)
+    chunked = Chunked_Array(dense.shape, np.int8, fill=3, chunk_size=8)
+    assert chunked.n_chunks == 0
+    for _ in range(20):
+        cells = tuple(rng.integers(0, dense.shape, size=(6, 3)).T)
+        values = rng.integers(0, 100, size=6)
+        dense[cells] = values
+        chunked[cells] = values
+        dense[4, 30, 1] = chunked[4, 30, 1] = 7
+    assert chunked[4, 30, 1] == 7
+    cells = tuple(rng.integers(0, dense.shape, size=(4, 9, 3)).T)
+    assert np.array_equal(chunked[cells], dense[cells])
+    assert np.array_equal(chunked[:, 2:30:3, 4], dense[:, 2:30:3, 4])
+    assert np.array_equal(chunked[..., ::-1], dense[..., ::-1])
+    dense[2:5, :, 0] = chunked[2:5, :, 0] = 9
+    assert np.array_equal(np.asarray(chunked), dense)
+
+    copy = chunked.copy()
+    copy[0, 0, 0] = 1
+    assert chunked[0, 0, 0] != 1
+    chunked[...] = 3
+    assert chunked.n_chunks == 0 and chunked[0, 0, 0] == 3
+    chunked[1, 1, 1] = 3
+    chunked.compact()
+    assert chunked.n_chunks == 0
+
+
+def test_chunked_env_matches_dense_env():
+    rng = np.random.default_rng(1)
+    envs = [SMAE(signal_depth=8, world_size=(24, 24, 6), actor_ids=range(8),
+        rng=np.random.RandomState(5), chunk_size=chunk_size,
+        validate_combined_ops=True) for chunk_size in (None, 8)]
+    assert isinstance(envs[1].static_objects, Chunked_Array)
+    for _ in range(10):
+        n = len(envs[0].actors)
+        actions = rng.random((n, ACT_CONTINUOUS_LEN))
+        signals = rng.integers(8, size=n)
+        (obs, r, _, _), (chunked_obs, chunked_r, _, _) = [
+            env.step_batch(actions, signals) for env in envs]
+        for key in (OBS_OPERATIONS, OBS_SIGNALS):
+            assert np.array_equal(obs[key], chunked_obs[key])
+        assert np.array_equal(r, chunked_r)
+    assert np.array_equal(envs[0].render(), envs[1].render())
+
+
+def test_empty_space_takes_no_memory():
+    env = SMAE(signal_depth=8, world_size=(1024, 1024, 256),
+        actor_ids=range(4), chunk_size=16)
+    assert env.static_objects.nbytes < 2**21
+    # a fall may cross into the chunk below
+    assert env.combined_object_ops.n_chunks <= 8
+
+
+def test_chunks_left_behind_are_freed():
+    env = SMAE(signal_depth=8, world_size=(1024, 4, 1), actor_ids=range(1),
+        rng=np.random.RandomState(0), chunk_size=4)
+    actions = np.zeros((1, ACT_CONTINUOUS_LEN))
+    actions[:, ACT_FORWARD_SPEED_INDEX] = 1
+    start = env.population.loc[env.actor_rows].copy()
+    for _ in range(200):
+        env.population.energy[env.actor_rows] = 1e6
+        env.step_batch(actions, np.array([3]))
+        for array in (env.signal_field, env.combined_object_ops,
+                env._occupied, env.free_cells.free):
+            assert array.n_chunks <= 2
+    # it walked across many chunks
+    assert np.abs(env.population.loc[env.actor_rows] - start).sum() > 100
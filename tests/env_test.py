@@ -0,0 +1,269 @@
+import numpy as np
+
+from smae.env import SMAE
+from smae.actor import Actor, ACT_CONTINUOUS, ACT_SIGNAL, OBS_OPERATIONS, \
+    OBS_MY_SIGNAL, UNPLACED
+from smae.elements import OPERATIONS, Moving_Object, ops_mask
+
+
+def random_actions(env, rng):
+    return {
+        actor_id: {
+            ACT_CONTINUOUS: rng.random(6),
+            ACT_SIGNAL: rng.integers(8)
+        } for actor_id in env.actors
+    }
+
+
+def test_spatial_index_follows_moving_objects():
+    env = SMAE(signal_depth=8, world_size=(8, 8, 1))
+    box = Moving_Object(loc=(3, 3, 0))
+    env.add_moving_object(box)
+    assert env.moving_object_at((3, 3, 0)) is box
+    assert env.moving_object_at((3.2, 2.9, 0)) is box
+
+    box.try_move(np.array([2.0, 0, 0]), env)
+    assert env.moving_object_at((3, 3, 0)) is None
+    assert env.moving_object_at((5, 3, 0)) is box
+
+    env.remove_moving_object(box)
+    assert env.moving_object_at((5, 3, 0)) is None
+
+
+def test_push_moves_indexed_object():
+    env = SMAE(signal_depth=8, world_size=(8, 8, 1))
+    pusher = Moving_Object(loc=(1, 1, 0))
+    box = Moving_Object(loc=(2, 1, 0))
+    env.add_moving_object(pusher)
+    env.add_moving_object(box)
+
+    pusher.try_move(np.array([1.0, 0, 0]), env)
+    assert env.moving_object_at((2, 1, 0)) is pusher
+    assert env.moving_object_at((3, 1, 0)) is box
+
+    # walls cannot be pushed over
+    env.set_static_object((5, 1, 0), OPERATIONS.encode([]))
+    pusher.try_move(np.array([3.0, 0, 0]), env)
+    assert env.moving_object_at((4, 1, 0)) is box
+    assert env.moving_object_at((3, 1, 0)) is pusher
+
+
+def test_step_keeps_spatial_index_consistent():
+    rng = np.random.default_rng(0)
+    env = SMAE(signal_depth=8, world_size=(16, 16, 1), actor_ids=range(20))
+    for _ in range(10):
+        env.step(random_actions(env, rng))
+        assert len(env._occupancy) == len(env.moving_objects)
+        for moving_object in env.moving_objects:
+            assert env.moving_object_at(moving_object.rounded_loc) \
+                is moving_object
+    for actor in env.actors.values():
+        assert env.actor_at(actor.rounded_loc) is actor
+
+
+def test_actors_are_views_onto_population_rows():
+    env = SMAE(signal_depth=8, world_size=(8, 8, 1), actor_ids=range(3))
+    actor = env.actors[1]
+    actor.energy = 42.0
+    assert env.population.energy[actor._row] == 42.0
+    env.population.loc[actor._row] += 0.25
+    assert np.allclose(actor.loc, env.population.loc[actor._row])
+    assert len(env.population) == 3
+
+
+def test_starved_actors_are_removed_in_bulk():
+    env = SMAE(signal_depth=8, world_size=(8, 8, 1), actor_ids=range(4))
+    env.actors[0].energy = 0.1
+    env.actors[2].energy = 0.1
+    idle = {ACT_CONTINUOUS: np.zeros(6), ACT_SIGNAL: 0}
+    env.step({actor_id: idle for actor_id in env.actors})
+    assert sorted(env.actors) == [1, 3]
+    assert len(env.population) == 2
+    assert len(env.moving_objects) == 2
+
+
+def test_step_batch_stacks_outputs_by_row():
+    env = SMAE(signal_depth=8, world_size=(32, 32, 1))
+    for actor_id, x in zip("abc", (8, 16, 24)):
+        env.add_actor(actor_id)
+        env.remove_moving_object(env.actors[actor_id])
+        env.actors[actor_id].loc = np.array([x, 8, 0], dtype=float)
+        env.add_moving_object(env.actors[actor_id])
+    env.actors["b"].energy = 0.1
+
+    actions = np.zeros((3, 6))
+    signals = np.array([1, 2, 3])
+    obs, r, done, ids = env.step_batch(actions, signals)
+
+    assert list(ids) == ["a", "b", "c"]
+    assert list(done) == [False, True, False]
+    assert obs[OBS_OPERATIONS].shape[0] == 3
+    assert list(obs[OBS_MY_SIGNAL]) == [1, 2, 3]
+    assert r.shape == (3,)
+    assert list(env.batch_ids) == ["a", "c"]
+
+
+def test_incremental_combined_ops_match_full_rebuild():
+    rng = np.random.default_rng(1)
+    static_objects = rng.choice([
+        OPERATIONS.encode([OPERATIONS.GOTHROUGH]),
+        OPERATIONS.encode([OPERATIONS.EAT]),
+        OPERATIONS.encode([OPERATIONS.PICKUP, OPERATIONS.PUSH_OVER]),
+    ], p=[0.7, 0.15, 0.15], size=(16, 16, 1)).astype(np.int8)
+    # validate_combined_ops asserts after every update
+    env = SMAE(signal_depth=8, world_size=(16, 16, 1),
+        static_objects=static_objects, actor_ids=range(20),
+        validate_combined_ops=True)
+    for _ in range(10):
+        env.step(random_actions(env, rng))
+
+
+def test_predicate_tables_agree_with_decode():
+    codes = np.arange(-128, 128, dtype=np.int8)
+    push_not_go = ops_mask(codes, require=[OPERATIONS.PUSH_OVER],
+        exclude=[OPERATIONS.GOTHROUGH])
+    for code, mask in zip(codes, push_not_go):
+        ops = OPERATIONS.decode(code)
+        assert mask == (OPERATIONS.PUSH_OVER in ops
+            and OPERATIONS.GOTHROUGH not in ops)
+        for op in OPERATIONS:
+            assert OPERATIONS.allows(code, op) == (op in ops)
+
+
+def test_simultaneous_moves_are_order_independent():
+    def run(order):
+        env = SMAE(signal_depth=8, world_size=(8, 8, 1))
+        # a and b race for (3,3), c and d try to swap, e follows f
+        objects = [Moving_Object(loc=loc) for loc in [
+            (2, 3, 0), (4, 3, 0), (1, 6, 0), (2, 6, 0),
+            (5, 5, 0), (6, 5, 0)]]
+        deltas = np.array([[1, 0, 0], [-1, 0, 0], [1, 0, 0],
+            [-1, 0, 0], [1, 0, 0], [1, 0, 0]], dtype=float)
+        for moving_object in objects:
+            env.add_moving_object(moving_object)
+        env.resolve_moves([objects[i] for i in order], deltas[order])
+        return np.array([moving_object.loc for moving_object in objects])
+
+    locs = run([0, 1, 2, 3, 4, 5])
+    assert np.array_equal(locs, run([5, 3, 1, 4, 0, 2]))
+    # the tie goes to the mover first in C order
+    assert np.array_equal(locs[0:2], [[3, 3, 0], [4, 3, 0]])
+    # swaps fail
+    assert np.array_equal(locs[2:4], [[1, 6, 0], [2, 6, 0]])
+    # followers move into cells being vacated
+    assert np.array_equal(locs[4:6], [[6, 5, 0], [7, 5, 0]])
+
+
+def test_diagonal_moves_do_not_cut_corners():
+    env = SMAE(signal_depth=8, world_size=(6, 6, 1))
+    for wall in [(2, 1, 0), (1, 2, 0), (4, 3, 0)]:
+        env.set_static_object(wall, OPERATIONS.encode([]))
+    # squeezed between two walls, brushing past one and in the open
+    blocked = Moving_Object(loc=(1, 1, 0))
+    brushing = Moving_Object(loc=(3, 3, 0))
+    free = Moving_Object(loc=(0, 4, 0))
+    for moving_object in (blocked, brushing, free):
+        env.add_moving_object(moving_object)
+    env.resolve_moves([blocked, brushing, free],
+        np.tile([1.0, 1.0, 0], (3, 1)))
+    assert env.moving_object_at((1, 1, 0)) is blocked
+    assert env.moving_object_at((3, 3, 0)) is brushing
+    assert env.moving_object_at((1, 5, 0)) is free
+
+
+def test_gravity_sleeps_until_support_changes():
+    env = SMAE(signal_depth=8, world_size=(3, 3, 6), gravity=(0, 0, -1))
+    env.set_static_object((1, 1, 2), OPERATIONS.encode([]))
+    boxes = [Moving_Object(loc=(1, 1, z)) for z in (3, 4)]
+    for box in boxes:
+        env.add_moving_object(box)
+    env._global_update()
+    assert not env._awake
+
+    # taking the floor away drops the whole column at once
+    env.set_static_object((1, 1, 2),
+        OPERATIONS.encode([OPERATIONS.GOTHROUGH]))
+    env._global_update()
+    assert [box.loc[2] for box in boxes] == [2, 3]
+    for _ in range(3):
+        env._global_update()
+    assert [box.loc[2] for box in boxes] == [0, 1]
+    assert not env._awake
+
+
+def test_reset_restores_template():
+    rng = np.random.default_rng(4)
+    env = SMAE(signal_depth=8, world_size=(10, 10, 1), actor_ids=range(6),
+        rng=np.random.RandomState(4))
+    box = Moving_Object(loc=(0, 0, 0))
+    env.add_moving_object(box)
+    env.capture_template()
+    changes = env.watch_static()
+    changes.take()
+    fresh = {name: getattr(env, name).copy() for name in
+        ("static_objects", "combined_object_ops", "signal_field")}
+    locs = {actor_id: actor.loc.copy()
+        for actor_id, actor in env.actors.items()}
+
+    env.actors[0].energy = 1e-3
+    for _ in range(8):
+        env.step(random_actions(env, rng))
+    env.add_actor("late")
+    env.set_static_object((9, 9, 0), OPERATIONS.encode([]))
+    assert 0 not in env.actors
+
+    obs = env.reset()
+    assert list(obs) == list(range(6))
+    # the template was copied back in bulk
+    assert changes.take() is None
+    for name, array in fresh.items():
+        assert np.array_equal(getattr(env, name), array)
+    for actor_id, actor in env.actors.items():
+        assert np.array_equal(actor.loc, locs[actor_id])
+        assert env.actor_at(actor.loc) is actor
+    assert np.array_equal(box.loc, (0, 0, 0))
+    assert len(env.population) == 6
+
+    env.reset(randomize_spawns=True)
+    cells = {actor.rounded_loc for actor in env.actors.values()}
+    assert len(cells) == 6 and box.rounded_loc not in cells
+    combined_object_ops = env.combined_object_ops.copy()
+    env.rebuild_combined_object_ops()
+    assert np.array_equal(combined_object_ops, env.combined_object_ops)
+
+
+def test_queued_births_and_deaths_apply_in_one_batch():
+    rng = np.random.default_rng(1)
+    env = SMAE(signal_depth=8, world_size=(16, 16, 1), actor_ids=range(20),
+        rng=np.random.RandomState(1))
+    for step in range(6):
+        for actor_id in list(env.actors)[:3]:
+            env.queue_death(actor_id=actor_id)
+        for i in range(4):
+            env.queue_birth((step, i))
+        # nothing changes until the step is over
+        assert len(env.actors) == 20 + step
+        env.step(random_actions(env, rng))
+        assert len(env.actors) == 21 + step
+        assert len(env._occupancy) == len(env.moving_objects) \
+            == len(env.population)
+        assert np.count_nonzero(env._occupied) == len(env.moving_objects)
+        for actor_id, actor in env.actors.items():
+            assert env.actor_at(actor.rounded_loc) is actor
+            assert env.combined_object_ops[actor.rounded_loc] == actor.ops
+            assert env._actor_ids[actor] == actor_id
+    expected = env.combined_object_ops.copy()
+    env.rebuild_combined_object_ops()
+    assert np.array_equal(env.combined_object_ops, expected)
+
+
+def test_unplaced_actors_are_placed_on_free_cells():
+    env = SMAE(signal_depth=8, world_size=(4, 4, 1),
+        rng=np.random.RandomState(0))
+    box = Moving_Object(loc=(0, 0, 0))
+    env.add_moving_object(box)
+    assert np.array_equal(Actor(env, initial_loc=UNPLACED).loc, UNPLACED)
+    added = env.add_actors(list(range(15)))
+    assert env.moving_object_at((0, 0, 0)) is box
+    cells = {actor.rounded_loc for actor in added}
+    assert len(cells) == 15 and (0, 0, 0) not in cells
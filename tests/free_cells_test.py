@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from smae.env import SMAE
+from smae.elements import OPERATIONS, ops_mask
+from smae.actor import ACT_CONTINUOUS_LEN
+
+
+def brute_force_free(env):
+    return ops_mask(np.asarray(env.static_objects),
+        require=[OPERATIONS.GOTHROUGH]) & ~np.asarray(env._occupied)
+
+
+def test_index_follows_the_world():
+    rng = np.random.default_rng(0)
+    static_objects = np.full((16, 16, 2),
+        OPERATIONS.encode([OPERATIONS.GOTHROUGH]), dtype=np.int8)
+    static_objects[rng.random((16, 16, 2)) < 0.3] = \
+        OPERATIONS.encode([OPERATIONS.PICKUP, OPERATIONS.EAT])
+    envs = [SMAE(signal_depth=8, world_size=(16, 16, 2),
+        static_objects=static_objects, actor_ids=range(30),
+        rng=np.random.RandomState(2), chunk_size=chunk_size)
+        for chunk_size in (None, 8)]
+    for _ in range(5):
+        actions = rng.random((len(envs[0].actors), ACT_CONTINUOUS_LEN))
+        signals = np.zeros(len(actions), np.int64)
+        for env in envs:
+            env.step_batch(actions, signals)
+            env.queue_birth(("late", _))
+            assert np.array_equal(np.asarray(env.free_cells.free),
+                brute_force_free(env))
+            assert len(env.free_cells) == brute_force_free(env).sum()
+    # chunked and dense worlds draw the same cells
+    cells = [env.random_avaliable_locs(20) for env in envs]
+    assert np.array_equal(*cells)
+    assert len(np.unique(cells[0], axis=0)) == 20
+    assert brute_force_free(envs[0])[tuple(cells[0].T)].all()
+
+
+def test_region_predicate_and_full_worlds():
+    env = SMAE(signal_depth=8, world_size=(32, 32, 1),
+        rng=np.random.RandomState(0))
+    cells = env.random_avaliable_locs(6, region=((4, 4, 0), (8, 8, 1)),
+        predicate=lambda cells: cells[:, 0] % 2 == 0)
+    assert np.all((cells >= (4, 4, 0)) & (cells < (8, 8, 1)))
+    assert np.all(cells[:, 0] % 2 == 0)
+    assert len(np.unique(cells, axis=0)) == 6
+    with pytest.raises(ValueError):
+        env.random_avaliable_locs(9, region=((0, 0, 0), (3, 3, 1)),
+            predicate=lambda cells: cells[:, 0] > 0)
+
+    # the last free cells are found straight away
+    env.add_actors(list(range(32 * 32 - 3)))
+    assert len(env.free_cells) == 3
+    cells = env.random_avaliable_locs(3)
+    assert not env._occupied[tuple(cells.T)].any()
+    with pytest.raises(ValueError):
+        env.random_avaliable_locs(4)
+
+
+def test_ranks_map_to_free_cells_in_c_order():
+    from smae.free_cells import Free_Cells, BLOCK
+    from smae.chunked import as_chunked
+
+    rng = np.random.default_rng(1)
+    free = rng.random((40, 40, 3)) < 0.4
+    expected = np.argwhere(free)
+    for mask in (free, as_chunked(free, False, 8)):
+        index = Free_Cells(mask.copy())
+        # few scattered blocks, then enough to read the whole world
+        for k in (0, 3, len(expected) // 2, len(expected)):
+            ranks = rng.permutation(len(expected))[:k]
+            assert np.array_equal(index._nth(ranks), expected[ranks])
+    assert free.size > 4 * BLOCK
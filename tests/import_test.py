@@ -0,0 +1,45 @@
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+# `import smae` (and every submodule) must stay this cheap
+IMPORT_SECONDS_BUDGET = 2.0
+IMPORT_RSS_MB_BUDGET = 150
+HEAVY_MODULES = ["tensorflow", "PIL", "torch"]
+
+PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+import smae, smae.env, smae.batched, smae.pool, smae.tiled, smae.render
+seconds = time.perf_counter() - start
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({
+    "seconds": seconds,
+    # bytes on macOS, kilobytes elsewhere
+    "rss_mb": rss / 2**20 if sys.platform == "darwin" else rss / 2**10,
+    "modules": [name for name in %r if name in sys.modules],
+}))
+""" % HEAVY_MODULES
+
+
+def test_import_stays_within_budget():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=root)
+    out = subprocess.run([sys.executable, "-c", PROBE], cwd=root, env=env,
+        check=True, capture_output=True, text=True).stdout
+    probe = json.loads(out.strip().splitlines()[-1])
+    assert probe["modules"] == []
+    assert probe["seconds"] < IMPORT_SECONDS_BUDGET, probe
+    assert probe["rss_mb"] < IMPORT_RSS_MB_BUDGET, probe
+
+
+def test_tensor_actions_are_converted():
+    tf = pytest.importorskip("tensorflow")
+    from smae.actor import _to_numpy
+    assert isinstance(_to_numpy(tf.Variable([1.0, 2.0])), np.ndarray)
+    assert isinstance(_to_numpy(tf.constant([1.0, 2.0])), np.ndarray)
+    assert _to_numpy(3) == 3
@@ -0,0 +1,79 @@
+import numpy as np
+
+from smae.env import SMAE
+from smae.pheromones import Pheromone_Field
+from smae.recording import Recorder, Replayer
+from smae.actor import ACT_CONTINUOUS_LEN, OBS_PHEROMONES
+
+
+def test_diffusion_keeps_mass_and_decay_removes_it():
+    field = Pheromone_Field((9, 9, 1), channels=2, decay=[0, 0.5],
+        diffusion=0.4, min_concentration=0)
+    field.deposit([[0, 0, 0], [4, 4, 0], [4, 4, 0], [20, 0, 0]],
+        [0, 0, 1, 0], amounts=10)
+    assert field.field[0, 4, 4, 0] == 10
+    assert field.field[1, 4, 4, 0] == 10
+    field.step()
+    lo, hi = field.active_box
+    assert lo.tolist() == [0, 0, 0] and hi.tolist() == [6, 6, 1]
+    # nothing leaks out at the corner
+    assert np.isclose(field.field[0].sum(), 20)
+    assert np.isclose(field.field[1].sum(), 5)
+    # same as a dense stencil over the whole world
+    dense = np.zeros((9, 9, 1), np.float32)
+    dense[0, 0, 0] = dense[4, 4, 0] = 10
+    padded = np.pad(dense, 1, mode="edge")
+    neighbours = sum(np.roll(padded, shift, axis)[1:-1, 1:-1, 1:-1]
+        for axis in range(3) for shift in (-1, 1))
+    assert np.allclose(field.field[0], 0.6 * dense + 0.4 / 6 * neighbours)
+
+
+def test_trails_evaporate():
+    field = Pheromone_Field((16, 16, 1), decay=0.5, diffusion=0.1)
+    field.deposit([[8, 8, 0]], [0])
+    for _ in range(20):
+        field.step()
+    assert not field.field.any()
+    lo, hi = field.active_box
+    assert np.all(lo == hi)
+
+
+def test_env_deposits_and_observes_pheromones(tmp_path):
+    env = SMAE(signal_depth=8, world_size=(10, 10, 1), actor_ids=range(4),
+        rng=np.random.RandomState(0),
+        pheromones=Pheromone_Field((10, 10, 1), channels=3))
+    rng = np.random.default_rng(0)
+    with Recorder(env, tmp_path / "run.rec", keyframe_interval=3):
+        for _ in range(5):
+            actions = rng.random((4, ACT_CONTINUOUS_LEN))
+            # signal 2 lays channel 1
+            obs, _, _, _ = env.step_batch(actions, np.full(4, 2))
+    assert obs[OBS_PHEROMONES].shape == (4, 3, 5, 8, 1)
+    assert env.pheromones.field[1].sum() > 0
+    assert not env.pheromones.field[[0, 2]].any()
+    assert env.actors[0].observation_space[OBS_PHEROMONES].shape \
+        == (3, 5, 8, 1)
+
+    replayed = Replayer(tmp_path / "run.rec").env(5)
+    assert np.array_equal(replayed.pheromones.field, env.pheromones.field)
+    loaded = tmp_path / "env.ckpt"
+    env.save(loaded)
+    assert np.array_equal(SMAE.load(loaded).pheromones.field,
+        env.pheromones.field)
+
+    env.reset()
+    assert not env.pheromones.field.any()
+
+
+def test_batched_and_tiled_envs_reject_pheromones():
+    import pytest
+    from smae.batched import Batched_SMAE
+    from smae.tiled import Tiled_SMAE
+
+    with pytest.raises(ValueError, match="pheromones"):
+        Batched_SMAE(2, 8, world_size=(10, 10, 1), actor_ids=range(2),
+            pheromones=Pheromone_Field((10, 10, 1)))
+    env = SMAE(signal_depth=8, world_size=(10, 10, 1), actor_ids=range(2),
+        pheromones=Pheromone_Field((10, 10, 1)))
+    with pytest.raises(ValueError, match="pheromones"):
+        Tiled_SMAE(env, tiles=(2, 1), halo=2)
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from smae.env import SMAE
+from smae.pool import Env_Pool
+from smae.actor import ACT_CONTINUOUS_LEN, OBS_OPERATIONS, OBS_HEALTH
+
+
+def make_env(i):
+    np.random.seed(i)
+    return SMAE(signal_depth=8, world_size=(8, 8, 1), actor_ids=range(3))
+
+
+def make_growing_env(i):
+    env = make_env(i)
+    # born at the end of the first step
+    env.queue_birth("newborn")
+    return env
+
+
+def test_pool_matches_envs_stepped_in_process():
+    rng = np.random.default_rng(0)
+    envs = [make_env(i) for i in range(4)]
+    with Env_Pool(make_env, n_envs=4, n_workers=2) as pool:
+        obs = pool.reset()
+        assert obs[OBS_OPERATIONS].shape == (4, 3, 5, 8, 1)
+        for step in range(5):
+            actions = rng.random((4, 3, ACT_CONTINUOUS_LEN))
+            signals = rng.integers(8, size=(4, 3))
+            if step % 2:
+                obs, rewards, done, alive = pool.step(actions, signals)
+            else:
+                pool.step_async(actions, signals)
+                while not pool.poll():
+                    pass
+                obs, rewards, done, alive = pool.step_wait()
+            for i, env in enumerate(envs):
+                expected, r, _, _ = env.step_batch(actions[i], signals[i])
+                assert np.array_equal(obs[OBS_OPERATIONS][i],
+                    expected[OBS_OPERATIONS])
+                assert np.allclose(obs[OBS_HEALTH][i, :, 0],
+                    expected[OBS_HEALTH])
+                assert np.allclose(rewards[i], r)
+        assert alive.all()
+
+
+def test_newborns_take_unused_rows():
+    rng = np.random.default_rng(1)
+    envs = [make_growing_env(i) for i in range(2)]
+    with Env_Pool(make_growing_env, n_envs=2, n_workers=1,
+            max_actors=5) as pool:
+        pool.reset()
+        assert not pool.alive[:, 3:].any()
+        for step in range(3):
+            actions = rng.random((2, 5, ACT_CONTINUOUS_LEN))
+            signals = rng.integers(8, size=(2, 5))
+            obs, rewards, done, alive = pool.step(actions, signals)
+            for i, env in enumerate(envs):
+                n = len(env.actors)
+                env.step_batch(actions[i, :n], signals[i, :n])
+                assert alive[i, :4].all() and not alive[i, 4]
+                # the newborn is observed from the end of its first step
+                expected = env.egocentric_obs_batch()
+                assert np.array_equal(obs[OBS_OPERATIONS][i, :4],
+                    expected[OBS_OPERATIONS])
+
+    with Env_Pool(make_growing_env, n_envs=1, n_workers=1) as pool:
+        pool.reset()
+        with pytest.raises(RuntimeError, match="max_actors=3"):
+            pool.step()
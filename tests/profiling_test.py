@@ -0,0 +1,60 @@
+import json
+import logging
+import tracemalloc
+import numpy as np
+
+from smae.env import SMAE
+from smae.profiling import Profiler
+from smae.actor import ACT_CONTINUOUS_LEN
+
+
+def run(env, steps=5):
+    rng = np.random.default_rng(0)
+    for _ in range(steps):
+        n = len(env.actors)
+        env.step_batch(rng.random((n, ACT_CONTINUOUS_LEN)),
+            rng.integers(8, size=n))
+
+
+def test_profiler_times_phases_and_counts(caplog):
+    profiler = Profiler(log_every=2, track_allocations=True)
+    env = SMAE(signal_depth=8, world_size=(12, 12, 1), actor_ids=range(6),
+        rng=np.random.RandomState(0), profiler=profiler)
+    assert profiler.snapshot()["counters"]["actors_added"] == 6
+    with caplog.at_level(logging.INFO, logger="smae.profiling"):
+        run(env)
+    tracemalloc.stop()
+
+    stats = profiler.snapshot()
+    assert stats["steps"] == 5
+    # construction already ran gravity and the logic update once
+    for name, calls in [("apply_actions", 5), ("gravity", 6),
+        ("update_actors", 5), ("combined_object_ops", 6),
+        ("signal_field", 6), ("observations", 5)]:
+        assert stats["phases"][name]["calls"] == calls
+        assert stats["phases"][name]["seconds"] > 0
+        assert "memory_delta" in stats["phases"][name]
+    assert stats["counters"]["cells_traversed"] > 0
+    assert stats["counters"]["cells_classified"] \
+        >= stats["counters"]["cells_traversed"]
+
+    # every log covers the 2 steps since the last one
+    logged = [json.loads(record.getMessage()) for record in caplog.records]
+    assert len(logged) == 2
+    assert [stats["steps"] for stats in logged] == [2, 2]
+    assert logged[1]["phases"]["gravity"]["calls"] == 2
+
+    env.remove_actor(actor_id=0)
+    assert profiler.snapshot()["counters"]["actors_removed"] == 1
+    profiler.reset()
+    assert profiler.snapshot() == {"steps": 0, "phases": {}, "counters": {}}
+
+
+def test_no_profiler_measures_nothing():
+    env = SMAE(signal_depth=8, world_size=(12, 12, 1), actor_ids=range(6),
+        rng=np.random.RandomState(0))
+    assert env.profiler is None
+    run(env)
+    env.profiler = profiler = Profiler()
+    run(env, steps=1)
+    assert profiler.snapshot()["steps"] == 1
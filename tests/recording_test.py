@@ -0,0 +1,57 @@
+import numpy as np
+
+from smae.env import SMAE
+from smae.recording import Recorder, Replayer
+from smae.elements import OPERATIONS, Moving_Object
+from smae.actor import ACT_CONTINUOUS_LEN, OBS_OPERATIONS, OBS_SIGNALS, \
+    OBS_HEALTH
+
+
+def make_env():
+    static_objects = np.full((12, 12, 1),
+        OPERATIONS.encode([OPERATIONS.GOTHROUGH]), dtype=np.int8)
+    static_objects[::3, ::2] = OPERATIONS.encode([OPERATIONS.EAT])
+    env = SMAE(signal_depth=8, world_size=(12, 12, 1),
+        static_objects=static_objects, actor_ids=range(6),
+        rng=np.random.RandomState(0))
+    env.add_moving_object(Moving_Object(loc=(5, 5, 0)))
+    return env
+
+
+def test_replay_matches_recorded_run(tmp_path):
+    rng = np.random.default_rng(2)
+    env = make_env()
+    states, obs, sent = [], [], []
+    with Recorder(env, tmp_path / "run.rec", keyframe_interval=4):
+        states.append(env.static_objects.copy())
+        obs.append(env.egocentric_obs_batch())
+        for step in range(11):
+            if step == 5:
+                env.add_actor("late")
+            n = len(env.actors)
+            actions = rng.random((n, ACT_CONTINUOUS_LEN))
+            actions[:, 5] = 1 # eat
+            signals = rng.integers(8, size=n)
+            env.step_batch(actions, signals)
+            sent.append(actions.copy())
+            # callers may reuse their buffers while records wait
+            actions[...] = -1
+            states.append(env.static_objects.copy())
+            obs.append(env.egocentric_obs_batch())
+    assert env.recorder is None
+
+    replayer = Replayer(tmp_path / "run.rec")
+    assert len(replayer) == 12
+    assert replayer.actor_ids(5)[-1] != "late"
+    assert replayer.actor_ids(6)[-1] == "late"
+    # seek backwards and forwards
+    for step in [11, 2, 3, 9, 0, 7]:
+        replayed = replayer.observations(step)
+        for key in (OBS_OPERATIONS, OBS_SIGNALS, OBS_HEALTH):
+            assert np.array_equal(replayed[key], obs[step][key])
+        assert np.array_equal(replayer.env(step).static_objects,
+            states[step])
+    ids, actions, signals = replayer.actions(6)
+    assert ids == list(range(6)) + ["late"]
+    assert actions.shape == (7, ACT_CONTINUOUS_LEN)
+    assert np.array_equal(actions, sent[5])
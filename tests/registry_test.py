@@ -0,0 +1,17 @@
+from smae.registry import Entity_Registry
+
+
+def test_handles_stay_put_and_are_reused():
+    registry = Entity_Registry("abcd")
+    handles = {entity: registry.handle(entity) for entity in "abcd"}
+    assert registry.remove("b") == handles["b"]
+    assert "b" not in registry and len(registry) == 3
+    # the last entity fills the hole, handles do not change
+    assert list(registry) == ["a", "d", "c"]
+    assert all(registry.get(handles[entity]) == entity for entity in "acd")
+    assert registry.get(handles["b"]) is None
+    assert registry.add("e") == handles["b"]
+
+    copy = registry.copy()
+    copy.remove("a")
+    assert "a" in registry and registry[-1] == "e"
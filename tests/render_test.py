@@ -0,0 +1,68 @@
+import numpy as np
+
+from smae.env import SMAE
+from smae.elements import OPERATIONS, Moving_Object, Signaling_Moving_Object
+
+
+def make_env(seed=0):
+    rng = np.random.default_rng(seed)
+    static_objects = rng.choice([
+        OPERATIONS.encode([OPERATIONS.GOTHROUGH]),
+        OPERATIONS.encode([OPERATIONS.EAT]),
+        OPERATIONS.encode([OPERATIONS.PICKUP]),
+        OPERATIONS.encode([OPERATIONS.PICKUP, OPERATIONS.PUSH_OVER]),
+        OPERATIONS.encode([]),
+    ], p=[0.6, 0.1, 0.1, 0.1, 0.1], size=(12, 10, 2)).astype(np.int8)
+    env = SMAE(signal_depth=8, world_size=(12, 10, 2),
+        static_objects=static_objects, gravity=(0, 0, 0),
+        actor_ids=range(10))
+    for i, actor in enumerate(env.actors.values()):
+        actor.set_signal(100 * i)
+    for moving_object in (Moving_Object(loc=env.random_avaliable_loc()),
+            Signaling_Moving_Object(signal_depth=8,
+                loc=env.random_avaliable_loc())):
+        env.add_moving_object(moving_object)
+    env.signaling_objects[-1].set_signal(5)
+    return env
+
+
+def test_vectorized_render_matches_per_voxel_coloring():
+    env = make_env()
+    for z_heights in (0, 1, [0, 1]):
+        fast = env.render(z_heights=z_heights)
+        slow = env.render(z_heights=z_heights, coloring=env.default_coloring)
+        assert fast.shape == (12, 10, 4)
+        assert fast.dtype == np.uint8
+        assert np.array_equal(fast, slow)
+
+
+def test_human_render_is_an_image():
+    image = make_env().render(mode="human")
+    assert image.size == (10, 12)
+    assert image.mode == "RGB"
+
+
+def test_render_pipeline_frames_match_render(tmp_path):
+    from PIL import Image
+    from smae.actor import ACT_CONTINUOUS, ACT_SIGNAL
+    from smae.render import Render_Pipeline
+
+    env = make_env(1)
+    rng = np.random.default_rng(1)
+    expected = []
+    with Render_Pipeline(env, str(tmp_path), z_heights=[0, 1],
+            max_queue=100) as pipeline:
+        for _ in range(5):
+            env.step({actor_id: {
+                ACT_CONTINUOUS: rng.random(6),
+                ACT_SIGNAL: rng.integers(1024)
+            } for actor_id in env.actors})
+            # static changes only reach the worker as deltas
+            env.set_static_object((rng.integers(10), rng.integers(12), 0),
+                OPERATIONS.encode([OPERATIONS.EAT]))
+            assert pipeline.capture()
+            expected.append(env.render(z_heights=[0, 1])[:, :, 0:3])
+    assert pipeline.frames_written == 5
+    for i, frame in enumerate(expected):
+        written = np.asarray(Image.open(tmp_path / "frame_{:06d}.png".format(i)))
+        assert np.array_equal(written, frame)
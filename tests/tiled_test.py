@@ -0,0 +1,86 @@
+import numpy as np
+
+from smae.env import SMAE
+from smae.tiled import Tiled_SMAE
+from smae.actor import ACT_CONTINUOUS_LEN, OBS_OPERATIONS, OBS_SIGNALS, \
+    OBS_HEALTH
+from smae.elements import OPERATIONS, Moving_Object, Signaling_Moving_Object
+
+
+def make_env(seed, world_size=(48, 48, 1), n_actors=40):
+    rng = np.random.default_rng(seed)
+    np.random.seed(seed)
+    static_objects = rng.choice([
+        OPERATIONS.encode([OPERATIONS.GOTHROUGH]),
+        OPERATIONS.encode([OPERATIONS.EAT]),
+        OPERATIONS.encode([OPERATIONS.PICKUP]),
+        OPERATIONS.encode([OPERATIONS.PICKUP, OPERATIONS.PUSH_OVER]),
+        OPERATIONS.encode([]),
+    ], p=[0.7, 0.1, 0.05, 0.1, 0.05], size=world_size).astype(np.int8)
+    env = SMAE(signal_depth=8, world_size=world_size,
+        static_objects=static_objects, actor_ids=range(n_actors))
+    for i in range(10):
+        moving_object = Moving_Object(loc=env.random_avaliable_loc()) \
+            if i % 2 else Signaling_Moving_Object(signal_depth=8,
+                loc=env.random_avaliable_loc())
+        env.add_moving_object(moving_object)
+    env._logic_update()
+    return env
+
+
+def check_tiled_matches_single_process(tiles, halo, **kwargs):
+    rng = np.random.default_rng(0)
+    env = make_env(0, **kwargs)
+    with Tiled_SMAE(env, tiles=tiles, halo=halo) as tiled:
+        # tiles must be wider than their halo to test anything
+        assert min(tiled.world_size[0] // tiles[0],
+            tiled.world_size[1] // tiles[1]) > tiled.halo
+        obs = env.egocentric_obs_batch()
+        assert np.array_equal(tiled.obs[OBS_OPERATIONS], obs[OBS_OPERATIONS])
+        for _ in range(15):
+            actions = rng.random((len(tiled.actor_ids), ACT_CONTINUOUS_LEN))
+            actions[:, 0] = 1
+            signals = rng.integers(8, size=len(tiled.actor_ids))
+            alive = tiled.alive.copy()
+            obs, rewards, done, _ = tiled.step(actions, signals)
+
+            expected, r, d, ids = env.step_batch(
+                actions[alive], signals[alive])
+            assert np.array_equal(tiled.actor_ids[alive], ids)
+            for key in (OBS_OPERATIONS, OBS_SIGNALS):
+                assert np.array_equal(obs[key][alive], expected[key])
+            assert np.allclose(obs[OBS_HEALTH][alive, 0],
+                expected[OBS_HEALTH])
+            assert np.allclose(rewards[alive], r)
+            assert np.array_equal(done[alive], d)
+            assert np.array_equal(tiled.static_objects, env.static_objects)
+            assert np.array_equal(tiled.signal_field, env.signal_field)
+
+
+def test_tiled_matches_single_process():
+    check_tiled_matches_single_process(tiles=(4, 4), halo=None,
+        world_size=(160, 160, 1), n_actors=400)
+
+
+def test_narrow_halos_still_match_sparse_worlds():
+    check_tiled_matches_single_process(tiles=(3, 3), halo=10)
+
+
+def test_failed_start_leaves_nothing_behind(monkeypatch):
+    import multiprocessing as mp
+    import os
+    import pytest
+    from smae import tiled as tiled_module
+
+    if not os.path.isdir("/dev/shm") or "fork" not in mp.get_all_start_methods():
+        pytest.skip("needs fork and /dev/shm")
+
+    def fail(self, objects):
+        raise ValueError("tile failed")
+    # forked workers see the patch
+    monkeypatch.setattr(tiled_module._Tile, "adopt", fail)
+    before = set(os.listdir("/dev/shm"))
+    with pytest.raises(RuntimeError, match="tile failed"):
+        Tiled_SMAE(make_env(0), tiles=(2, 2), halo=4, context="fork")
+    assert not mp.active_children()
+    assert set(os.listdir("/dev/shm")) <= before
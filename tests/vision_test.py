@@ -0,0 +1,127 @@
+import numpy as np
+import pytest
+
+from smae import vision
+from smae.env import SMAE, Obs_Buffers
+from smae.elements import OPERATIONS
+from smae.actor import Actor, OBS_OPERATIONS, OBS_SIGNALS, ACT_CONTINUOUS_LEN
+
+
+def test_orientation_buckets_wrap():
+    buckets = vision.orientation_buckets(
+        np.array([0.0, np.pi/2, -np.pi/2, 2*np.pi, 0.2]), n_buckets=4)
+    assert list(buckets) == [0, 1, 3, 0, 0]
+
+
+def test_views_turn_with_orientation():
+    grid = np.arange(5*5*1).reshape((5, 5, 1))
+    cells = np.array([[2, 2, 0], [2, 2, 0]])
+    views = vision.gather(grid, cells, np.array([2, 0]), (3, 2, 1))
+    # facing +y: egocentric x runs along world +x
+    assert views[0, :, 1, 0].tolist() == [grid[1, 3, 0], grid[2, 3, 0], grid[3, 3, 0]]
+    # facing +x: forward is world +x and right is world -y
+    assert views[1, 1, :, 0].tolist() == [grid[2, 2, 0], grid[3, 2, 0]]
+    assert views[1, :, 1, 0].tolist() == [grid[3, 3, 0], grid[3, 2, 0], grid[3, 1, 0]]
+
+
+def test_every_view_cell_sees_a_distinct_cell():
+    for n_buckets in (8, 16):
+        table = vision.offset_table((9, 16, 3), n_buckets)
+        for bucket in range(n_buckets):
+            assert len(np.unique(table[bucket], axis=0)) == table.shape[1]
+        # and stays within a cell of the exact rotation
+        angles = 2*np.pi*np.arange(n_buckets) / n_buckets
+        ex, ey, _ = np.meshgrid(np.arange(9) - 4, np.arange(16),
+            np.arange(3), indexing="ij")
+        exact_x = ex.ravel() * np.sin(angles)[:, None] \
+            + ey.ravel() * np.cos(angles)[:, None]
+        exact_y = -ex.ravel() * np.cos(angles)[:, None] \
+            + ey.ravel() * np.sin(angles)[:, None]
+        assert np.abs(table[:, :, 0] - exact_x).max() < 1.5
+        assert np.abs(table[:, :, 1] - exact_y).max() < 1.5
+
+
+def test_views_keep_declared_shape_at_world_edges():
+    env = SMAE(signal_depth=8, world_size=(6, 6, 1), out_of_bounds_ops=7)
+    actor = Actor(env, initial_loc=(0, 5, 0), initial_orientation=np.pi/2)
+    env.add_actor(actor)
+    obs = actor.egocentric_obs(env)
+    space = actor.observation_space
+    assert obs[OBS_OPERATIONS].shape == space[OBS_OPERATIONS].shape
+    assert obs[OBS_SIGNALS].shape == space[OBS_SIGNALS].shape
+    # everything left of and ahead of the actor is outside the world
+    assert np.all(obs[OBS_OPERATIONS][0:2] == 7)
+    assert np.all(obs[OBS_OPERATIONS][:, 1:] == 7)
+    assert not np.any(obs[OBS_OPERATIONS][2:, 0] == 7)
+
+
+def test_pack_ops_round_trip():
+    ops = np.random.default_rng(0).integers(0, 16, (4, 3, 3, 1)).astype(np.int8)
+    packed = vision.pack_ops(ops)
+    assert packed.shape == (4, vision.packed_size((3, 3, 1))) == (4, 5)
+    flat = ops.reshape((4, -1)).astype(int)
+    assert packed[0, 0] == flat[0, 0] | flat[0, 1] << 4
+    assert packed[0, 4] == flat[0, 8]
+    assert np.array_equal(vision.unpack_ops(packed, (3, 3, 1)), ops)
+
+
+def test_buffered_obs_match_and_are_reused():
+    def make():
+        return SMAE(signal_depth=8, world_size=(8, 8, 1), actor_ids=range(5),
+            rng=np.random.RandomState(0))
+    fresh, buffered = make(), make()
+    buffers = Obs_Buffers(8, (5, 8, 1), packed=True)
+    rng = np.random.default_rng(0)
+    for _ in range(3):
+        actions = rng.random((5, ACT_CONTINUOUS_LEN))
+        signals = rng.integers(0, 4, 5)
+        expected, _, _, _ = fresh.step_batch(actions, signals)
+        obs, _, _, _ = buffered.step_batch(actions, signals, out=buffers)
+        assert np.shares_memory(obs[OBS_SIGNALS], buffers.arrays[OBS_SIGNALS])
+        assert np.array_equal(
+            vision.unpack_ops(obs[OBS_OPERATIONS], (5, 8, 1)),
+            expected[OBS_OPERATIONS])
+        for key in expected:
+            if key != OBS_OPERATIONS:
+                assert np.array_equal(obs[key], expected[key])
+    # env owned buffers survive between steps
+    first = buffered.egocentric_obs_batch(out=True)
+    assert buffered.egocentric_obs_batch(out=True) is first
+    with pytest.raises(ValueError):
+        buffered.egocentric_obs_batch(out=Obs_Buffers(2, (5, 8, 1)))
+
+
+def test_walls_hide_what_is_behind_them():
+    static = np.full((7, 9, 1), OPERATIONS.encode([OPERATIONS.GOTHROUGH]),
+        np.int8)
+    static[3, 3, 0] = OPERATIONS.encode([]) # wall
+    env = SMAE(signal_depth=8, world_size=(7, 9, 1), static_objects=static,
+        out_of_bounds_ops=15, occlusion=True)
+    actor = Actor(env, initial_loc=(3, 0, 0), initial_orientation=np.pi/2)
+    env.add_actor(actor)
+    ops = actor.egocentric_obs(env)[OBS_OPERATIONS]
+    # the wall is seen, the column behind it is not
+    assert ops[2, 3, 0] == 0
+    assert np.all(ops[2, 4:, 0] == 15)
+    assert np.all(ops[2, 1:3, 0] == 1)
+    assert np.all(ops[0, :, 0] == 1)
+
+    # every path agrees on the hidden cells
+    expected = env.egocentric_obs_batch()
+    buffered = env.egocentric_obs_batch(out=True, packed=True)
+    assert np.array_equal(
+        vision.unpack_ops(buffered[OBS_OPERATIONS], (5, 8, 1)),
+        expected[OBS_OPERATIONS])
+    assert np.array_equal(expected[OBS_OPERATIONS][0], ops)
+
+
+def test_visibility_table_follows_straight_rays():
+    table = vision.visibility_table((3, 4, 1), n_buckets=4)
+    cell = lambda x, y: np.ravel_multi_index((x, y, 0), (3, 4, 1))
+    deps = lambda x, y: set(table[0, cell(x, y)].tolist()) - {12}
+    # straight ahead depends on the cells in between
+    assert deps(1, 3) == {cell(1, 1), cell(1, 2)}
+    # right next to the actor nothing is in between
+    assert deps(1, 1) == deps(0, 1) == set()
+    # rays passing between two cells depend on both
+    assert deps(0, 2) == {cell(0, 1), cell(1, 1)}